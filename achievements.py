@@ -0,0 +1,133 @@
+"""
+Conquistas avaliadas sobre os agregados por usuário (tabela user_aggregates)
+"""
+
+import operator
+import sqlite3
+import uuid
+from typing import Dict, List, NamedTuple, Optional
+
+
+class AchievementRule(NamedTuple):
+    """Regra declarativa: a conquista é desbloqueada quando metric <op> threshold"""
+    key: str
+    name: str
+    description: str
+    icon: str
+    metric: str
+    op: str
+    threshold: float
+
+
+ACHIEVEMENT_RULES = (
+    # Conquistas de distância
+    AchievementRule('total_10km', 'Primeiros 10km', 'Completou 10km totais', '🏃', 'total_distance', '>=', 10),
+    AchievementRule('total_50km', 'Meio Centenário', 'Completou 50km totais', '🎯', 'total_distance', '>=', 50),
+    AchievementRule('total_100km', 'Centenário', 'Completou 100km totais', '💯', 'total_distance', '>=', 100),
+    # Conquistas de pace
+    AchievementRule('pace_6min', 'Corredor Rápido', 'Pace abaixo de 6 min/km', '💨', 'best_pace', '<=', 6),
+)
+
+OPERATORS = {'>=': operator.ge, '<=': operator.le, '>': operator.gt, '<': operator.lt}
+
+AGGREGATE_COLUMNS = ('total_distance', 'total_trainings', 'total_duration', 'best_pace', 'pace_sum')
+
+
+def create_tables(cursor: sqlite3.Cursor):
+    """Cria a tabela de agregados e o índice usado na verificação de conquistas"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_aggregates (
+            user_id TEXT PRIMARY KEY,
+            total_distance REAL NOT NULL DEFAULT 0,
+            total_trainings INTEGER NOT NULL DEFAULT 0,
+            total_duration INTEGER NOT NULL DEFAULT 0,
+            best_pace REAL,
+            pace_sum REAL NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_achievements_user_name
+        ON achievements (user_id, name)
+    ''')
+
+
+def record_training(conn: sqlite3.Connection, user_id: str, distance: float, duration: int, pace: float):
+    """Soma um treino aos agregados do usuário (chamar na mesma transação do INSERT)
+
+    Treinos sem distância têm pace 0 e não contam para o melhor pace.
+    """
+    conn.execute('''
+        INSERT INTO user_aggregates (user_id, total_distance, total_trainings, total_duration, best_pace, pace_sum)
+        VALUES (?, ?, 1, ?, ?, ?)
+        ON CONFLICT (user_id) DO UPDATE SET
+            total_distance = total_distance + excluded.total_distance,
+            total_trainings = total_trainings + 1,
+            total_duration = total_duration + excluded.total_duration,
+            best_pace = MIN(COALESCE(best_pace, excluded.best_pace), COALESCE(excluded.best_pace, best_pace)),
+            pace_sum = pace_sum + excluded.pace_sum,
+            updated_at = CURRENT_TIMESTAMP
+    ''', (user_id, distance, duration, pace if pace > 0 else None, pace))
+
+
+def get_aggregates(conn: sqlite3.Connection, user_id: str) -> Optional[Dict]:
+    """Retorna os agregados do usuário, ou None se ele não tem treinos"""
+    row = conn.execute(f'''
+        SELECT {', '.join(AGGREGATE_COLUMNS)} FROM user_aggregates WHERE user_id = ?
+    ''', (user_id,)).fetchone()
+    return dict(zip(AGGREGATE_COLUMNS, row)) if row else None
+
+
+def evaluate_rules(aggregates: Dict) -> List[AchievementRule]:
+    """Retorna as regras satisfeitas pelos agregados, em O(1) por regra"""
+    return [
+        rule for rule in ACHIEVEMENT_RULES
+        if aggregates.get(rule.metric) is not None
+        and OPERATORS[rule.op](aggregates[rule.metric], rule.threshold)
+    ]
+
+
+def unlock_achievements(conn: sqlite3.Connection, user_id: str) -> int:
+    """Desbloqueia as conquistas satisfeitas que o usuário ainda não tem
+
+    Todas as conquistas candidatas são inseridas com um único
+    INSERT ... WHERE NOT EXISTS. Retorna quantas foram desbloqueadas.
+    """
+    aggregates = get_aggregates(conn, user_id)
+    rules = evaluate_rules(aggregates) if aggregates else []
+    if not rules:
+        return 0
+
+    values = ', '.join('(?, ?, ?, ?)' for _ in rules)
+    params = []
+    for rule in rules:
+        params.extend((str(uuid.uuid4()), rule.name, rule.description, rule.icon))
+
+    cursor = conn.execute(f'''
+        INSERT INTO achievements (id, user_id, name, description, icon)
+        SELECT candidate.column1, ?, candidate.column2, candidate.column3, candidate.column4
+        FROM (VALUES {values}) AS candidate
+        WHERE NOT EXISTS (
+            SELECT 1 FROM achievements
+            WHERE achievements.user_id = ? AND achievements.name = candidate.column2
+        )
+    ''', (user_id, *params, user_id))
+    return cursor.rowcount
+
+
+def backfill(conn: sqlite3.Connection) -> int:
+    """Recalcula os agregados de todos os usuários e desbloqueia as conquistas pendentes
+
+    Retorna quantas conquistas foram desbloqueadas.
+    """
+    conn.execute('DELETE FROM user_aggregates')
+    conn.execute('''
+        INSERT INTO user_aggregates (user_id, total_distance, total_trainings, total_duration, best_pace, pace_sum)
+        SELECT user_id, SUM(distance), COUNT(*), SUM(duration),
+               MIN(CASE WHEN pace > 0 THEN pace END), SUM(pace)
+        FROM trainings GROUP BY user_id
+    ''')
+
+    user_ids = [row[0] for row in conn.execute('SELECT user_id FROM user_aggregates')]
+    return sum(unlock_achievements(conn, user_id) for user_id in user_ids)
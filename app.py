@@ -1,36 +1,232 @@
 from flask import Flask, render_template, request, jsonify, session
 from flask_socketio import SocketIO, emit
+import base64
+import binascii
+import itertools
 import json
 import math
 import time
-from datetime import datetime, timedelta
+from datetime import date, datetime, timezone
 import uuid
 import sqlite3
 import os
-from typing import Dict, List, Optional, Tuple
-import threading
+import re
+from typing import IO, Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+import atexit
+import numpy as np
+
+import achievements
+import geometry
+import heatmap
+import metrics
+import migrations
+import native
+import offload
+import rollups
+import simplify
+import spatial_index
+import track_files
+from database import ConnectionPool
+from journal import SessionJournal, list_sessions
+from live_metrics import LiveMetrics
+from persistence import PersistenceWorker
+from reaper import SessionReaper
+from reorder import ReorderBuffer
+from session_store import create_session_store
+from stats_cache import StatsCache
+from tile_cache import TileCache
+from track_codec import decode_track, encode_track, iter_rows
+from track_store import TrackStore
+from updates import UpdateThrottle
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'running_trainer_secret_key'
-socketio = SocketIO(app, cors_allowed_origins="*")
+# Com vários processos, os eventos Socket.IO passam por uma fila de mensagens (ex.: redis://)
+# eventlet e gevent só funcionam com o monkey patching feito pelo run.py (ou pelo worker do gunicorn),
+# então o padrão é threading mesmo com eles instalados
+socketio = SocketIO(app, cors_allowed_origins="*",
+                    message_queue=os.environ.get('SOCKETIO_MESSAGE_QUEUE'),
+                    async_mode=os.environ.get('SOCKETIO_ASYNC_MODE', 'threading'))
+
+# Threads do sistema para SQLite e CPU pesada fora do loop de eventos (ver offload.py)
+OFFLOAD_POOL_SIZE = int(os.environ.get('OFFLOAD_POOL_SIZE', 10))
+offload.configure(socketio.async_mode, OFFLOAD_POOL_SIZE)
+
+def database_options():
+    """Lê as configurações do banco de dados das variáveis de ambiente"""
+    return {
+        'path': os.environ.get('DATABASE', 'running_trainer.db'),
+        'journal_mode': os.environ.get('DB_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.environ.get('DB_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': int(os.environ.get('DB_BUSY_TIMEOUT', 5000)),
+        'cached_statements': int(os.environ.get('DB_CACHED_STATEMENTS', 256))
+    }
+
+# Configuração do banco de dados SQLite; as conexões só são abertas no primeiro uso
+# e o esquema é criado por TrainingManager.start (servidor) ou configure_database
+db = ConnectionPool(**database_options())
+
+# Quantidade de posições brutas mantidas por sessão (0 desativa o buffer)
+RAW_POSITIONS_BUFFER = int(os.environ.get('GPS_RAW_BUFFER', 0))
+
+# Journal em disco das sessões ativas (vazio desativa): posições aceitas são gravadas
+# em segmentos de GPS_JOURNAL_SEGMENT posições e a memória guarda só as últimas GPS_MEMORY_WINDOW
+JOURNAL_DIR = os.environ.get('GPS_JOURNAL_DIR', '')
+JOURNAL_SEGMENT = int(os.environ.get('GPS_JOURNAL_SEGMENT', 16))
+JOURNAL_FSYNC = os.environ.get('GPS_JOURNAL_FSYNC', 'False').lower() == 'true'
+GPS_MEMORY_WINDOW = int(os.environ.get('GPS_MEMORY_WINDOW', 300))
+
+# Buffer de reordenação das posições numeradas (seq) de cada sessão: uma lacuna na sequência segura
+# até GPS_REORDER_CAPACITY posições ou GPS_REORDER_MAX_DELAY segundos (relógio do cliente)
+REORDER_CAPACITY = int(os.environ.get('GPS_REORDER_CAPACITY', 64))
+REORDER_MAX_DELAY = float(os.environ.get('GPS_REORDER_MAX_DELAY', 10))
+
+# Política padrão do training_update (cada sessão pode mudar em /api/training/start)
+UPDATE_DEFAULTS = {
+    'max_rate': float(os.environ.get('UPDATE_MAX_RATE', 2)),
+    'delta': os.environ.get('UPDATE_DELTA', 'True').lower() == 'true',
+    'keyframe_interval': int(os.environ.get('UPDATE_KEYFRAME_INTERVAL', 20))
+}
+
+# Cache das estatísticas de /api/stats/<user_id>
+stats_cache = StatsCache(
+    maxsize=int(os.environ.get('STATS_CACHE_SIZE', 1024)),
+    ttl=float(os.environ.get('STATS_CACHE_TTL', 300))
+)
+
+# Comprimir as trilhas salvas com zlib
+TRACK_COMPRESSION = os.environ.get('GPS_TRACK_ZLIB', 'True').lower() == 'true'
+
+# Níveis de detalhe pré-calculados de cada trilha salva (tolerâncias em metros)
+TRACK_LOD_TOLERANCES = tuple(
+    float(tolerance) for tolerance in os.environ.get('GPS_TRACK_LOD', '2,5,10,25').split(',') if tolerance
+)
+
+# Níveis de zoom do mapa de calor (HEATMAP_MAX_ZOOM abaixo do mínimo desativa) e cache em disco
+# dos tiles, com os menos usados removidos acima de HEATMAP_CACHE_MB
+HEATMAP_ZOOMS = tuple(range(int(os.environ.get('HEATMAP_MIN_ZOOM', 8)), int(os.environ.get('HEATMAP_MAX_ZOOM', 16)) + 1))
+heatmap_cache = TileCache(
+    os.environ.get('HEATMAP_CACHE_DIR', 'heatmap_cache'),
+    max_bytes=int(float(os.environ.get('HEATMAP_CACHE_MB', 256)) * 2 ** 20)
+)
+
+# Máximo de treinos devolvidos pelas consultas de listagem
+MAX_QUERY_LIMIT = 500
+
+# Colunas das listagens de treinos (todas no índice idx_trainings_user_created, nunca gps_data)
+TRAINING_SUMMARY_FIELDS = ('training_id', 'user_id', 'type', 'distance', 'duration', 'pace', 'created_at')
+TRAINING_SUMMARY_COLUMNS = 'id, user_id, type, distance, duration, pace, created_at'
+
+# Tendências (/api/trends): períodos devolvidos sem since e máximo por consulta
+TREND_DEFAULT_PERIODS = {'day': 90, 'week': 52, 'month': 12}
+MAX_TREND_PERIODS = 1000
+
+# Importação de GPX/TCX: tipo dos treinos importados, treinos por transação e posições por add_positions
+IMPORT_TRAINING_TYPE = os.environ.get('IMPORT_TRAINING_TYPE', 'importado')
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 20))
+IMPORT_CHUNK_SIZE = 1024
+# Namespace dos ids dos treinos importados (uuid5 do usuário e do horário de início)
+IMPORT_NAMESPACE = uuid.UUID('6f1c2a54-3d0e-5b8f-9a47-c2e1d8b0f3a6')
+
+# Onde ficam as sessões ativas: 'memory' (um processo) ou 'sqlite' (vários processos)
+SESSION_STORE = os.environ.get('SESSION_STORE', 'memory')
 
-# Configuração do banco de dados SQLite
-DATABASE = 'running_trainer.db'
+# Gravação em segundo plano: treinos por transação e espera máxima (s) para juntar um lote
+PERSIST_BATCH_SIZE = int(os.environ.get('PERSIST_BATCH_SIZE', 32))
+PERSIST_MAX_DELAY = float(os.environ.get('PERSIST_MAX_DELAY', 0.05))
+
+# Sessões sem atividade por SESSION_IDLE_TTL segundos (0 desativa) são finalizadas pelo reaper:
+# 'persist' grava o treino (se houver posições aceitas) e 'discard' descarta a sessão
+SESSION_IDLE_TTL = float(os.environ.get('SESSION_IDLE_TTL', 1800))
+SESSION_IDLE_ACTION = os.environ.get('SESSION_IDLE_ACTION', 'persist')
+SESSION_REAP_INTERVAL = float(os.environ.get('SESSION_REAP_INTERVAL', 60))
+if SESSION_IDLE_ACTION not in ('persist', 'discard'):
+    raise ValueError(f'Unknown SESSION_IDLE_ACTION: {SESSION_IDLE_ACTION}')
+
+# Orçamento (MB) das trilhas em memória das sessões ativas (0 desativa; só com SESSION_STORE=memory).
+# Acima dele os maiores trackers vão para um journal em GPS_SPILL_DIR ou, sem ele, são
+# simplificados com erro máximo de GPS_DOWNSAMPLE_TOLERANCE metros
+GPS_MEMORY_BUDGET_MB = float(os.environ.get('GPS_MEMORY_BUDGET_MB', 0))
+GPS_SPILL_DIR = os.environ.get('GPS_SPILL_DIR', '')
+GPS_DOWNSAMPLE_TOLERANCE = float(os.environ.get('GPS_DOWNSAMPLE_TOLERANCE', 2))
+
+# Eventos (handlers, transações) mais lentos que isso (ms) vão para o log; 0 desativa
+SLOW_EVENT_MS = float(os.environ.get('METRICS_SLOW_EVENT_MS', 250))
+metrics.configure(slow_event_threshold=SLOW_EVENT_MS / 1000 if SLOW_EVENT_MS > 0 else None)
+
+# Métricas do caminho de ingestão (ver /metrics)
+GPS_STAGE_SECONDS = metrics.REGISTRY.histogram(
+    'gps_stage_seconds', 'Duração de cada etapa do processamento de posições', ('stage',))
+GPS_FIXES_ACCEPTED = metrics.REGISTRY.counter('gps_fixes_accepted', 'Posições aceitas')
+GPS_FIXES_FILTERED = metrics.REGISTRY.counter('gps_fixes_filtered', 'Posições descartadas, por motivo', ('reason',))
+# Séries usadas a cada posição, resolvidas uma vez
+QUALITY_FILTER_SECONDS = GPS_STAGE_SECONDS.labels('quality_filter')
+KALMAN_SECONDS = GPS_STAGE_SECONDS.labels('kalman')
+DISTANCE_SECONDS = GPS_STAGE_SECONDS.labels('distance')
+STORE_SECONDS = GPS_STAGE_SECONDS.labels('store')
+FIXES_ACCEPTED = GPS_FIXES_ACCEPTED.labels()
+FIXES_FILTERED_QUALITY = GPS_FIXES_FILTERED.labels('quality_filter')
+FIXES_FILTERED_MOVEMENT = GPS_FIXES_FILTERED.labels('minimum_movement')
+EVENT_SECONDS = metrics.REGISTRY.histogram(
+    'event_seconds', 'Duração dos eventos Socket.IO e requisições instrumentados', ('event',), slow_log=True)
+EVENT_STAGE_SECONDS = metrics.REGISTRY.histogram(
+    'event_stage_seconds', 'Duração de cada etapa dos eventos instrumentados', ('event', 'stage'))
+
+class FilterSettings(NamedTuple):
+    """Parâmetros dos filtros de qualidade e do filtro Kalman"""
+    max_accuracy: float = 50           # metros
+    max_speed: float = 20              # m/s (72 km/h)
+    max_jump_speed: float = 25         # m/s implícitos entre posições (90 km/h)
+    min_movement: float = 0.003        # km (3 metros)
+    process_noise: float = 1e-5        # Q do filtro Kalman
+    noise_per_meter: float = 1e-5      # R por metro de precisão
+    min_measurement_noise: float = 1e-5
+
+DEFAULT_FILTER_SETTINGS = FilterSettings()
 
 class GPSTracker:
-    def __init__(self):
-        self.positions = []
-        self.raw_positions = []
+    def __init__(self, raw_buffer_size: int = RAW_POSITIONS_BUFFER, journal: Optional[SessionJournal] = None,
+                 window_size: int = GPS_MEMORY_WINDOW, settings: FilterSettings = DEFAULT_FILTER_SETTINGS):
+        self.settings = settings
+        # Com journal, a trilha completa fica em disco e a memória guarda só uma janela recente
+        self.journal = journal
+        self.positions = TrackStore(maxlen=window_size if journal else None)
+        self.raw_positions = TrackStore(maxlen=raw_buffer_size)
         self.is_tracking = False
         self.total_distance = 0.0
+        self.accuracy_sum = 0.0
+        self.max_speed = 0
         self.last_position = None
-        self.kalman_filter = KalmanFilter()
+        self.kalman_filter = KalmanFilter(settings.process_noise, settings.noise_per_meter,
+                                          settings.min_measurement_noise)
+        self.projection = geometry.LocalProjection()
+        # Parciais, voltas, ritmo móvel e pausa automática
+        self.live = LiveMetrics()
+        # Posições numeradas pelo cliente, colocadas em ordem e sem repetições
+        self.reorder = ReorderBuffer(REORDER_CAPACITY, REORDER_MAX_DELAY)
+        # Posições do início da trilha já simplificadas por downsample
+        self._simplified = 0
         self.start_time = None
+        # Se alguma posição trouxe o horário do relógio do cliente
+        self.client_clock = False
         
     def add_position(self, lat: float, lon: float, accuracy: float, speed: Optional[float] = None, 
-                    altitude: Optional[float] = None, heading: Optional[float] = None) -> Dict:
-        """Adiciona uma nova posição e processa os dados"""
-        timestamp = time.time()
+                    altitude: Optional[float] = None, heading: Optional[float] = None,
+                    timestamp: Optional[float] = None, seq: Optional[int] = None) -> Dict:
+        """Adiciona uma nova posição e processa os dados
+        
+        timestamp é o instante da posição no relógio do cliente (s); sem ele, vale
+        a hora de chegada. Posições com seq passam pelo buffer de reordenação e
+        retornam o resultado de add_positions.
+        """
+        if seq is not None:
+            return self.add_positions([{'latitude': lat, 'longitude': lon, 'accuracy': accuracy, 'speed': speed,
+                                        'altitude': altitude, 'heading': heading, 'timestamp': timestamp,
+                                        'seq': seq}])
+        if timestamp is None:
+            timestamp = time.time()
+        else:
+            self.client_clock = True
         
         position = {
             'latitude': lat,
@@ -43,28 +239,50 @@ class GPSTracker:
         }
         
         # Armazenar posição bruta
-        self.raw_positions.append(position)
+        self.raw_positions.append_position(position)
         
         # Aplicar filtros de qualidade
-        if not self._is_valid_position(position):
+        started = time.perf_counter()
+        valid = self._is_valid_position(position)
+        checked = time.perf_counter()
+        QUALITY_FILTER_SECONDS.observe(checked - started)
+        if not valid:
+            FIXES_FILTERED_QUALITY.inc()
             return {'status': 'filtered', 'reason': 'quality_filter'}
         
-        # Aplicar filtro Kalman
-        filtered_position = self.kalman_filter.filter(position)
+        # Aplicar filtro Kalman (a posição bruta não é mais usada, então é reaproveitada)
+        filtered_position = position
+        filtered_position['latitude'], filtered_position['longitude'] = \
+            self.kalman_filter.filter_coords(lat, lon, accuracy)
+        filtered = time.perf_counter()
+        KALMAN_SECONDS.observe(filtered - checked)
         
+        # Distância do segmento, calculada uma vez para o movimento mínimo e o total
+        last = self.last_position
+        segment_distance = 0.0
+        if last:
+            segment_distance = self.projection.distance(last['latitude'], last['longitude'],
+                                                        filtered_position['latitude'],
+                                                        filtered_position['longitude'])
+        measured = time.perf_counter()
+        DISTANCE_SECONDS.observe(measured - filtered)
         # Verificar movimento mínimo
-        if self.last_position and self._calculate_distance(self.last_position, filtered_position) < 0.003:  # 3 metros
+        if last and segment_distance < self.settings.min_movement:
+            FIXES_FILTERED_MOVEMENT.inc()
+            # Parado também conta para o relógio das métricas ao vivo
+            self.live.update(timestamp, self.total_distance)
             return {'status': 'filtered', 'reason': 'minimum_movement'}
         
-        # Adicionar à lista de posições válidas
-        self.positions.append(filtered_position)
-        
-        # Calcular distância
-        if self.last_position:
-            segment_distance = self._calculate_distance(self.last_position, filtered_position)
-            self.total_distance += segment_distance
+        # Adicionar à trilha de posições válidas
+        self._store_position(filtered_position['latitude'], filtered_position['longitude'], accuracy,
+                             speed, altitude, heading, timestamp)
+        self.total_distance += segment_distance
+        self.live.update(timestamp, self.total_distance)
         
         self.last_position = filtered_position
+        self._flush_journal()
+        STORE_SECONDS.observe(time.perf_counter() - measured)
+        FIXES_ACCEPTED.inc()
         
         return {
             'status': 'accepted',
@@ -73,47 +291,248 @@ class GPSTracker:
             'signal_strength': self._get_signal_strength(accuracy)
         }
     
+    def add_positions(self, fixes: List[Dict]) -> Dict:
+        """Processa um lote de posições (buffer do celular) de uma só vez
+        
+        Os filtros sem estado são calculados sobre o lote inteiro com NumPy. O
+        filtro de salto e o de movimento mínimo dependem da última posição aceita
+        (e uma posição GPS em cada três costuma ser rejeitada), então o restante
+        roda posição a posição. O resultado é o mesmo de chamar add_position para
+        cada posição em sequência.
+        
+        Posições com seq (numeradas pelo cliente a partir de 0 em cada sessão)
+        passam antes pelo ReorderBuffer: saem em ordem de seq, as repetidas e as
+        atrasadas são descartadas e as que estão depois de uma lacuna esperam
+        no buffer. Assim um trecho gravado offline pode ser enviado de uma vez
+        ao voltar o sinal, mesmo que parte dele já tenha chegado.
+        
+        Como em add_position, uma posição sem timestamp vale a hora de chegada
+        (a mesma para o lote todo).
+        """
+        started = time.perf_counter()
+        now = time.time()
+        batch = [{
+            'latitude': fix['latitude'],
+            'longitude': fix['longitude'],
+            'accuracy': fix['accuracy'],
+            'speed': fix.get('speed'),
+            'altitude': fix.get('altitude'),
+            'heading': fix.get('heading'),
+            'timestamp': now if fix.get('timestamp') is None else fix['timestamp'],
+            'seq': fix.get('seq')
+        } for fix in fixes]
+        if any(fix.get('timestamp') is not None for fix in fixes):
+            self.client_clock = True
+        
+        filtered = {'quality_filter': 0, 'minimum_movement': 0, 'duplicate': 0, 'late': 0, 'invalid_seq': 0}
+        numbered = [position for position in batch if position['seq'] is not None]
+        if numbered:
+            ready, filtered['duplicate'], filtered['late'], filtered['invalid_seq'] = self.reorder.push(numbered)
+            batch = [position for position in batch if position['seq'] is None] + ready
+        
+        accepted = self._process_batch(batch, filtered)
+        self._flush_journal()
+        
+        GPS_STAGE_SECONDS.observe(time.perf_counter() - started, 'batch')
+        return self._batch_result(accepted, filtered)
+    
+    def duration(self, start_time: float, end_time: float) -> int:
+        """Duração da sessão em segundos
+        
+        Com os horários do cliente, vai da primeira à última posição que passou
+        pelo filtro de qualidade, então um trecho gravado offline e enviado de
+        uma vez conta pelo tempo em que foi gravado. Sem eles, vai de start_time
+        a end_time no relógio do servidor.
+        """
+        live = self.live
+        if self.client_clock and live.start_time is not None:
+            return int(live.last_time - live.start_time)
+        return int(end_time - start_time)
+    
+    def drain(self) -> Dict:
+        """Processa as posições ainda seguradas no buffer de reordenação (fim da sessão)"""
+        filtered = {'quality_filter': 0, 'minimum_movement': 0, 'duplicate': 0, 'late': 0, 'invalid_seq': 0}
+        accepted = self._process_batch(self.reorder.flush(), filtered)
+        self._flush_journal()
+        return self._batch_result(accepted, filtered)
+    
+    def _process_batch(self, batch: List[Dict], filtered: Dict[str, int]) -> int:
+        """Passa as posições, já em ordem, pelos filtros; retorna quantas foram aceitas"""
+        for position in batch:
+            self.raw_positions.append_position(position)
+        
+        accepted = 0
+        if batch:
+            lat = np.array([p['latitude'] for p in batch], dtype=float)
+            lon = np.array([p['longitude'] for p in batch], dtype=float)
+            acc = np.array([p['accuracy'] for p in batch], dtype=float)
+            speed = np.array([np.nan if p['speed'] is None else p['speed'] for p in batch], dtype=float)
+            
+            # Filtros sem estado: precisão, velocidade e coordenadas válidas (finitas)
+            settings = self.settings
+            valid = ~((acc > settings.max_accuracy) | (speed > settings.max_speed) |
+                      (np.abs(lat) > 90) | (np.abs(lon) > 180))
+            valid &= np.isfinite(lat) & np.isfinite(lon) & np.isfinite(acc)
+            filtered['quality_filter'] = int(len(batch) - np.count_nonzero(valid))
+            
+            for index in np.flatnonzero(valid).tolist():
+                reason = self._accept_one(batch[index])
+                if reason is None:
+                    accepted += 1
+                else:
+                    filtered[reason] += 1
+        return accepted
+    
+    def _batch_result(self, accepted: int, filtered: Dict[str, int]) -> Dict:
+        if accepted:
+            GPS_FIXES_ACCEPTED.inc(accepted)
+        for reason, count in filtered.items():
+            if count:
+                GPS_FIXES_FILTERED.inc(count, reason)
+        
+        status = 'accepted' if accepted else 'buffered' if len(self.reorder) else 'filtered'
+        result = {
+            'status': status,
+            'accepted': accepted,
+            'filtered': filtered,
+            'buffered': len(self.reorder),
+            'total_distance': self.total_distance
+        }
+        if accepted:
+            result['position'] = self.last_position
+            result['signal_strength'] = self._get_signal_strength(self.last_position['accuracy'])
+        
+        return result
+    
+    def _accept_one(self, position: Dict) -> Optional[str]:
+        """Aplica os filtros com estado a uma posição do lote; retorna o motivo da rejeição ou None"""
+        lat, lon = position['latitude'], position['longitude']
+        last = self.last_position
+        if last:
+            # Filtro de salto de posição
+            time_diff = position['timestamp'] - last['timestamp']
+            if time_diff > 0:
+                jump_distance = self.projection.distance(last['latitude'], last['longitude'], lat, lon)
+                if jump_distance * 1000 / time_diff > self.settings.max_jump_speed:
+                    return 'quality_filter'
+        
+        # A posição do lote não é mais usada, então é reaproveitada
+        position['latitude'], position['longitude'] = \
+            self.kalman_filter.filter_coords(lat, lon, position['accuracy'])
+        segment_distance = 0.0
+        if last:
+            segment_distance = self.projection.distance(last['latitude'], last['longitude'],
+                                                        position['latitude'], position['longitude'])
+            if segment_distance < self.settings.min_movement:
+                self.live.update(position['timestamp'], self.total_distance)
+                return 'minimum_movement'
+        
+        self._store_position(position['latitude'], position['longitude'], position['accuracy'],
+                             position['speed'], position['altitude'], position['heading'], position['timestamp'])
+        self.total_distance += segment_distance
+        self.live.update(position['timestamp'], self.total_distance)
+        self.last_position = position
+        return None
+    
+    def _store_position(self, lat: float, lon: float, accuracy: float, speed: Optional[float],
+                        altitude: Optional[float], heading: Optional[float], timestamp: float):
+        """Guarda uma posição aceita na trilha, nos totais e no journal"""
+        self.positions.append(lat, lon, accuracy, speed, altitude, heading, timestamp)
+        self.accuracy_sum += accuracy
+        if speed is not None and speed > self.max_speed:
+            self.max_speed = speed
+        if self.journal is not None:
+            self.journal.append(self.positions.row(-1))
+    
+    def _flush_journal(self, force: bool = False):
+        """Grava o segmento do journal quando ele enche (ou sempre, com force)"""
+        if self.journal is not None and (force or self.journal.needs_flush):
+            self.journal.flush({
+                'kalman_filter': self.kalman_filter.get_state(),
+                'raw_positions': self.raw_positions.appended,
+                'live': self.live.to_state(),
+                'reorder': self.reorder.to_state(),
+                'client_clock': self.client_clock
+            })
+    
+    def track(self):
+        """Trilha completa das posições aceitas: o journal em disco, se houver"""
+        if self.journal is not None:
+            self._flush_journal(force=True)
+            return self.journal
+        return self.positions
+    
+    @property
+    def nbytes(self) -> int:
+        """Memória ocupada pelas trilhas (aceitas e brutas) do tracker"""
+        return self.positions.nbytes + self.raw_positions.nbytes
+    
+    def spill(self, journal: SessionJournal):
+        """Passa a trilha em memória para um journal e mantém na memória só a janela recente"""
+        window = TrackStore(maxlen=GPS_MEMORY_WINDOW)
+        for row in self.positions.rows():
+            journal.append(row)
+            window.append(*row)
+            if journal.needs_flush:
+                journal.flush()
+        window.appended = self.positions.appended
+        self.positions = window
+        self.journal = journal
+        self._flush_journal(force=True)
+    
+    def downsample(self, tolerance: float) -> bool:
+        """Simplifica (Douglas-Peucker) a parte da trilha em memória ainda não simplificada
+        
+        O erro máximo é tolerance metros; a última posição já simplificada e a
+        mais recente são mantidas. Os totais não mudam, só a trilha que será
+        salva. Retorna False se não havia o que simplificar.
+        """
+        rows = list(self.positions.rows())
+        start = max(self._simplified - 1, 0)
+        if len(rows) - start < 3:
+            return False
+        weights = simplify.importance(np.array([row[0] for row in rows[start:]]),
+                                      np.array([row[1] for row in rows[start:]]))
+        kept = rows[:start] + [rows[start + i] for i in np.flatnonzero(weights > tolerance)]
+        
+        simplified = TrackStore()
+        for row in kept:
+            simplified.append(*row)
+        simplified.appended = self.positions.appended
+        self.positions = simplified
+        self._simplified = len(kept)
+        return True
+    
     def _is_valid_position(self, position: Dict) -> bool:
         """Aplica filtros de qualidade na posição"""
         # Filtro de precisão
-        if position['accuracy'] > 50:
+        if position['accuracy'] > self.settings.max_accuracy:
             return False
         
-        # Filtro de velocidade (máximo 72 km/h)
-        if position['speed'] and position['speed'] > 20:
+        # Filtro de velocidade
+        if position['speed'] and position['speed'] > self.settings.max_speed:
             return False
         
-        # Filtro de coordenadas válidas
+        # Filtro de coordenadas válidas (NaN/inf quebrariam a projeção e o Kalman)
+        if not (math.isfinite(position['latitude']) and math.isfinite(position['longitude']) and
+                math.isfinite(position['accuracy'])):
+            return False
         if abs(position['latitude']) > 90 or abs(position['longitude']) > 180:
             return False
         
         # Filtro de salto de posição
         if self.last_position:
-            distance = self._calculate_distance(self.last_position, position)
+            distance = self.projection.distance(self.last_position['latitude'], self.last_position['longitude'],
+                                                position['latitude'], position['longitude'])
             time_diff = position['timestamp'] - self.last_position['timestamp']
             
             if time_diff > 0:
                 implied_speed = (distance * 1000) / time_diff  # m/s
-                if implied_speed > 25:  # 90 km/h
+                if implied_speed > self.settings.max_jump_speed:
                     return False
         
         return True
     
-    def _calculate_distance(self, pos1: Dict, pos2: Dict) -> float:
-        """Calcula distância entre duas posições usando fórmula de Haversine"""
-        R = 6371  # Raio da Terra em km
-        
-        lat1_rad = math.radians(pos1['latitude'])
-        lat2_rad = math.radians(pos2['latitude'])
-        delta_lat = math.radians(pos2['latitude'] - pos1['latitude'])
-        delta_lon = math.radians(pos2['longitude'] - pos1['longitude'])
-        
-        a = (math.sin(delta_lat / 2) ** 2 + 
-             math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lon / 2) ** 2)
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-        
-        return R * c
-    
     def _get_signal_strength(self, accuracy: float) -> str:
         """Determina a força do sinal baseado na precisão"""
         if accuracy <= 5:
@@ -127,7 +546,8 @@ class GPSTracker:
     
     def get_stats(self) -> Dict:
         """Retorna estatísticas do rastreamento"""
-        if not self.positions:
+        accepted = self.positions.appended
+        if not accepted:
             return {
                 'total_distance': 0,
                 'average_accuracy': 0,
@@ -136,68 +556,171 @@ class GPSTracker:
                 'filtered_positions': 0
             }
         
-        accuracies = [p['accuracy'] for p in self.positions]
-        speeds = [p['speed'] for p in self.positions if p['speed'] is not None]
+        # Totais acumulados a cada posição: não dependem da janela em memória
+        return {
+            'total_distance': self.total_distance,
+            'average_accuracy': self.accuracy_sum / accepted,
+            'max_speed': self.max_speed,
+            'valid_positions': accepted,
+            'filtered_positions': self.raw_positions.appended - accepted
+        }
+    
+    def to_state(self) -> Dict:
+        """Estado serializável do rastreador, usado pelos session stores"""
+        journal = None
+        if self.journal is not None:
+            self._flush_journal(force=True)
+            journal = {
+                'directory': self.journal.directory,
+                'session_id': self.journal.session_id,
+                'segment_size': self.journal.segment_size,
+                'fsync': self.journal.fsync
+            }
         
         return {
+            'journal': journal,
+            'accuracy_sum': self.accuracy_sum,
+            'max_speed': self.max_speed,
+            'positions': self.positions.to_state(),
+            'raw_positions': self.raw_positions.to_state(),
+            'is_tracking': self.is_tracking,
             'total_distance': self.total_distance,
-            'average_accuracy': sum(accuracies) / len(accuracies),
-            'max_speed': max(speeds) if speeds else 0,
-            'valid_positions': len(self.positions),
-            'filtered_positions': len(self.raw_positions) - len(self.positions)
+            'last_position': self.last_position,
+            'kalman_filter': self.kalman_filter.get_state(),
+            'settings': tuple(self.settings),
+            'live': self.live.to_state(),
+            'reorder': self.reorder.to_state(),
+            'start_time': self.start_time,
+            'client_clock': self.client_clock
         }
     
+    @classmethod
+    def from_state(cls, state: Dict) -> 'GPSTracker':
+        """Reconstrói um rastreador a partir de to_state"""
+        tracker = cls(journal=SessionJournal(**state['journal']) if state['journal'] else None,
+                      settings=FilterSettings(*state.get('settings', DEFAULT_FILTER_SETTINGS)))
+        tracker.accuracy_sum = state['accuracy_sum']
+        tracker.max_speed = state['max_speed']
+        tracker.positions = TrackStore.from_state(state['positions'])
+        tracker.raw_positions = TrackStore.from_state(state['raw_positions'])
+        tracker.is_tracking = state['is_tracking']
+        tracker.total_distance = state['total_distance']
+        tracker.last_position = state['last_position']
+        tracker.kalman_filter.set_state(state['kalman_filter'])
+        if state.get('live'):
+            tracker.live = LiveMetrics.from_state(state['live'])
+        if state.get('reorder'):
+            tracker.reorder = ReorderBuffer.from_state(state['reorder'])
+        tracker.start_time = state['start_time']
+        tracker.client_clock = state.get('client_clock', False)
+        return tracker
+    
+    @classmethod
+    def from_journal(cls, journal: SessionJournal) -> 'GPSTracker':
+        """Reconstrói o rastreador de uma sessão interrompida a partir do journal"""
+        tracker = cls()
+        tracker.positions = TrackStore(maxlen=GPS_MEMORY_WINDOW)
+        state = journal.read_state() or {}
+        # O estado das métricas ao vivo é gravado junto com cada segmento e corresponde
+        # às posições do journal; sem ele, as métricas são refeitas só com as posições aceitas
+        replay_live = not state.get('live')
+        previous = None
+        for row in journal.rows():
+            tracker._store_position(*row)
+            current = tracker.positions[-1]
+            if previous is not None:
+                tracker.total_distance += tracker.projection.distance(previous['latitude'], previous['longitude'],
+                                                                      current['latitude'], current['longitude'])
+            if replay_live:
+                tracker.live.update(current['timestamp'], tracker.total_distance)
+            previous = current
+        
+        tracker.last_position = previous
+        tracker.journal = journal
+        
+        tracker.raw_positions.appended = state.get('raw_positions', tracker.positions.appended)
+        if not replay_live:
+            tracker.live = LiveMetrics.from_state(state['live'])
+        # Seqs já processados até o segmento gravado: reenvios do cliente não contam duas vezes
+        if state.get('reorder'):
+            tracker.reorder = ReorderBuffer.from_state(state['reorder'])
+        tracker.client_clock = state.get('client_clock', False)
+        if state.get('kalman_filter'):
+            tracker.kalman_filter.set_state(state['kalman_filter'])
+        elif previous is not None:
+            tracker.kalman_filter.filter_coords(previous['latitude'], previous['longitude'], previous['accuracy'])
+        return tracker
+    
     def reset(self):
         """Reseta todos os dados do rastreamento"""
-        self.positions = []
-        self.raw_positions = []
+        self.positions.clear()
+        self.raw_positions.clear()
         self.total_distance = 0.0
+        self.accuracy_sum = 0.0
+        self.max_speed = 0
         self.last_position = None
         self.kalman_filter.reset()
+        self.live = LiveMetrics(self.live.settings)
+        self.reorder = ReorderBuffer(self.reorder.capacity, self.reorder.max_delay)
+        self._simplified = 0
         self.start_time = None
+        self.client_clock = False
 
 class KalmanFilter:
     """Filtro Kalman simples para suavizar dados de GPS"""
     
-    def __init__(self):
-        self.Q = 1e-5  # Ruído do processo
+    def __init__(self, process_noise: float = 1e-5, noise_per_meter: float = 1e-5,
+                 min_measurement_noise: float = 1e-5):
+        self.Q = process_noise  # Ruído do processo
         self.R = 1e-3  # Ruído da medição
-        self.lat_filter = {'Q': 1e-5, 'R': 1e-3, 'P': 1, 'X': 0, 'K': 0}
-        self.lon_filter = {'Q': 1e-5, 'R': 1e-3, 'P': 1, 'X': 0, 'K': 0}
+        # R de cada medição = max(min_measurement_noise, precisão * noise_per_meter)
+        self.noise_per_meter = noise_per_meter
+        self.min_measurement_noise = min_measurement_noise
+        self.lat_filter = {'Q': self.Q, 'R': self.R, 'P': 1, 'X': 0, 'K': 0}
+        self.lon_filter = {'Q': self.Q, 'R': self.R, 'P': 1, 'X': 0, 'K': 0}
         self.initialized = False
     
     def filter(self, position: Dict) -> Dict:
         """Aplica filtro Kalman na posição"""
-        if not self.initialized:
-            self.lat_filter['X'] = position['latitude']
-            self.lon_filter['X'] = position['longitude']
-            self.initialized = True
-            return position
-        
-        # Filtrar latitude
-        filtered_lat = self._filter_value(
-            position['latitude'], 
-            self.lat_filter, 
-            position['accuracy']
+        filtered_position = position.copy()
+        filtered_position['latitude'], filtered_position['longitude'] = self.filter_coords(
+            position['latitude'], position['longitude'], position['accuracy']
         )
         
-        # Filtrar longitude
-        filtered_lon = self._filter_value(
-            position['longitude'], 
-            self.lon_filter, 
-            position['accuracy']
-        )
+        return filtered_position
+    
+    def filter_coords(self, lat: float, lon: float, accuracy: float) -> Tuple[float, float]:
+        """Aplica filtro Kalman nas coordenadas, sem copiar a posição"""
+        if not self.initialized:
+            self.lat_filter['X'] = lat
+            self.lon_filter['X'] = lon
+            self.initialized = True
+            return lat, lon
         
-        filtered_position = position.copy()
-        filtered_position['latitude'] = filtered_lat
-        filtered_position['longitude'] = filtered_lon
+        # Filtrar latitude e longitude
+        filtered_lat = self._filter_value(lat, self.lat_filter, accuracy)
+        filtered_lon = self._filter_value(lon, self.lon_filter, accuracy)
         
-        return filtered_position
+        return filtered_lat, filtered_lon
+    
+    def get_state(self) -> Dict:
+        """Retorna uma cópia do estado do filtro"""
+        return {
+            'initialized': self.initialized,
+            'lat_filter': dict(self.lat_filter),
+            'lon_filter': dict(self.lon_filter)
+        }
+    
+    def set_state(self, state: Dict):
+        """Restaura um estado obtido com get_state"""
+        self.initialized = state['initialized']
+        self.lat_filter = dict(state['lat_filter'])
+        self.lon_filter = dict(state['lon_filter'])
     
     def _filter_value(self, measurement: float, filter_state: Dict, accuracy: float) -> float:
         """Aplica filtro Kalman em um valor"""
         # Ajustar R baseado na precisão do GPS
-        filter_state['R'] = max(1e-5, accuracy / 100000)
+        filter_state['R'] = max(self.min_measurement_noise, accuracy * self.noise_per_meter)
         
         # Predição
         filter_state['P'] += filter_state['Q']
@@ -212,161 +735,539 @@ class KalmanFilter:
     def reset(self):
         """Reseta o filtro"""
         self.initialized = False
-        self.lat_filter = {'Q': 1e-5, 'R': 1e-3, 'P': 1, 'X': 0, 'K': 0}
-        self.lon_filter = {'Q': 1e-5, 'R': 1e-3, 'P': 1, 'X': 0, 'K': 0}
+        self.lat_filter = {'Q': self.Q, 'R': self.R, 'P': 1, 'X': 0, 'K': 0}
+        self.lon_filter = {'Q': self.Q, 'R': self.R, 'P': 1, 'X': 0, 'K': 0}
 
 class TrainingManager:
     def __init__(self):
-        self.active_sessions = {}
-        self.init_database()
+        # Nada de banco nem threads aqui: o módulo é importado também pelo manage.py e
+        # pelos processos do reprocess e do mapa de calor (ver start)
+        self._started = False
+        self._start_lock = native.lock()
+        self.active_sessions = create_session_store(SESSION_STORE, db, GPSTracker, GPS_MEMORY_WINDOW)
+        self.persistence = PersistenceWorker(
+            self.save_trainings,
+            batch_size=PERSIST_BATCH_SIZE,
+            max_delay=PERSIST_MAX_DELAY
+        )
+        self.reaper = SessionReaper(
+            self.active_sessions, self.reap_session, self.shrink_session,
+            idle_ttl=SESSION_IDLE_TTL,
+            interval=SESSION_REAP_INTERVAL,
+            # Com o store SQLite os trackers não ficam na memória do processo
+            memory_budget=int(GPS_MEMORY_BUDGET_MB * 2 ** 20) if SESSION_STORE == 'memory' else None
+        )
     
-    def init_database(self):
-        """Inicializa o banco de dados SQLite"""
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        
-        # Tabela de usuários
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id TEXT PRIMARY KEY,
-                name TEXT NOT NULL,
-                age INTEGER NOT NULL,
-                weight REAL NOT NULL,
-                height REAL NOT NULL,
-                level TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Tabela de metas
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS goals (
-                id TEXT PRIMARY KEY,
-                user_id TEXT NOT NULL,
-                distance REAL NOT NULL,
-                months INTEGER NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        # Tabela de treinos
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS trainings (
-                id TEXT PRIMARY KEY,
-                user_id TEXT NOT NULL,
-                type TEXT NOT NULL,
-                distance REAL NOT NULL,
-                duration INTEGER NOT NULL,
-                pace REAL NOT NULL,
-                gps_data TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        # Tabela de conquistas
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS achievements (
-                id TEXT PRIMARY KEY,
-                user_id TEXT NOT NULL,
-                name TEXT NOT NULL,
-                description TEXT NOT NULL,
-                icon TEXT NOT NULL,
-                unlocked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
+    def start(self):
+        """Prepara o banco e inicia as threads de gravação e do reaper; só a primeira chamada faz algo
         
-        conn.commit()
-        conn.close()
+        O run.py chama ao subir o servidor. Com outro servidor (gunicorn app:app) a
+        primeira requisição HTTP ou o primeiro treino enfileirado chama.
+        """
+        if self._started:
+            return
+        with self._start_lock:
+            if self._started:
+                return
+            self.init_database()
+            self.persistence.start()
+            self.reaper.start()
+            self._started = True
+    
+    def init_database(self):
+        """Inicializa o banco de dados SQLite e aplica as migrações pendentes"""
+        # IMMEDIATE: dois processos subindo juntos não aplicam a mesma migração ao mesmo tempo
+        with db.transaction(immediate=True) as conn:
+            cursor = conn.cursor()
+            
+            # Tabela de usuários
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    id TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    age INTEGER NOT NULL,
+                    weight REAL NOT NULL,
+                    height REAL NOT NULL,
+                    level TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Tabela de metas
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS goals (
+                    id TEXT PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    distance REAL NOT NULL,
+                    months INTEGER NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users (id)
+                )
+            ''')
+            
+            # Tabela de treinos
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS trainings (
+                    id TEXT PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    distance REAL NOT NULL,
+                    duration INTEGER NOT NULL,
+                    pace REAL NOT NULL,
+                    gps_data TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users (id)
+                )
+            ''')
+            
+            # Tabela de conquistas
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS achievements (
+                    id TEXT PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    description TEXT NOT NULL,
+                    icon TEXT NOT NULL,
+                    unlocked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users (id)
+                )
+            ''')
+            
+            # Agregados por usuário usados pelas conquistas
+            achievements.create_tables(cursor)
+            
+            # Níveis de detalhe das trilhas (ver simplify.py)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS training_track_lods (
+                    training_id TEXT NOT NULL,
+                    tolerance REAL NOT NULL,
+                    point_count INTEGER NOT NULL,
+                    gps_data BLOB NOT NULL,
+                    PRIMARY KEY (training_id, tolerance)
+                )
+            ''')
+            
+            # Índice espacial dos trechos das trilhas (ver spatial_index.py)
+            spatial_index.create_tables(cursor)
+            
+            # Sessões ativas (usada com SESSION_STORE=sqlite)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS active_sessions (
+                    session_id TEXT PRIMARY KEY,
+                    state BLOB NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            
+            # Posições aceitas das sessões ativas no SQLite, gravadas uma vez cada
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS active_session_positions (
+                    session_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    position BLOB NOT NULL,
+                    PRIMARY KEY (session_id, seq)
+                ) WITHOUT ROWID
+            ''')
+            
+            # Mudanças de esquema posteriores (índices etc.), controladas por PRAGMA user_version
+            migrations.migrate(conn)
     
+    @offload.blocking
     def create_user(self, name: str, age: int, weight: float, height: float, level: str) -> str:
         """Cria um novo usuário"""
         user_id = str(uuid.uuid4())
         
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO users (id, name, age, weight, height, level)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (user_id, name, age, weight, height, level))
-        
-        conn.commit()
-        conn.close()
+        with db.transaction(immediate=True) as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                INSERT INTO users (id, name, age, weight, height, level)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (user_id, name, age, weight, height, level))
         
         return user_id
     
     def save_training(self, user_id: str, training_type: str, distance: float, 
-                     duration: int, pace: float, gps_data: List[Dict]) -> str:
+                     duration: int, pace: float, gps_data, training_id: Optional[str] = None) -> str:
         """Salva um treino no banco de dados"""
-        training_id = str(uuid.uuid4())
+        training_id = training_id or str(uuid.uuid4())
         
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
+        self.save_trainings([{
+            'training_id': training_id,
+            'user_id': user_id,
+            'type': training_type,
+            'distance': distance,
+            'duration': duration,
+            'pace': pace,
+            'gps_data': gps_data
+        }])
         
-        cursor.execute('''
-            INSERT INTO trainings (id, user_id, type, distance, duration, pace, gps_data)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (training_id, user_id, training_type, distance, duration, pace, json.dumps(gps_data)))
+        return training_id
+    
+    def save_trainings(self, trainings: List[Dict]):
+        """Salva vários treinos em uma única transação"""
+        heatmap_tiles = self._write_trainings(trainings)
         
-        conn.commit()
-        conn.close()
+        # Depois do commit: treinos novos e conquistas desbloqueadas mudam as estatísticas
+        for user_id in dict.fromkeys(t['user_id'] for t in trainings):
+            stats_cache.invalidate(user_id)
+        # e as trilhas novas mudam os tiles do mapa de calor que elas tocam
+        heatmap_cache.invalidate(heatmap_tiles)
         
-        # Verificar conquistas
-        self._check_achievements(user_id)
+        # O treino está no banco: o journal da sessão não é mais necessário
+        for t in trainings:
+            if t.get('journal') is not None:
+                t['journal'].delete()
+    
+    @offload.blocking
+    def _write_trainings(self, trainings: List[Dict]) -> List[Tuple]:
+        """Codifica as trilhas e grava os treinos, níveis de detalhe, índice espacial, mapa de calor e conquistas
         
-        return training_id
+        Retorna os tiles do mapa de calor alterados, como (user_id, z, x, y).
+        """
+        # Trilhas no formato binário compacto (ver track_codec), codificadas antes
+        # de abrir a transação para não segurar a trava de escrita
+        rows = [
+            (t['training_id'], t['user_id'], t['type'], t['distance'], t['duration'], t['pace'],
+             (t.get('live') or {}).get('moving_time'), encode_track(t['gps_data'], compress=TRACK_COMPRESSION),
+             t.get('created_at'))
+            for t in trainings
+        ]
+        splits = [
+            (t['training_id'], kind, item['number'], item['distance'], item['duration'], item['elapsed'], item['pace'])
+            for t in trainings if t.get('live')
+            for kind, items in (('split', t['live']['splits']), ('lap', t['live']['laps']))
+            for item in items
+        ]
+        # Níveis de detalhe e índice espacial partem da mesma simplificação da trilha. Tudo é lido
+        # em streaming da trilha já codificada (a mesma que rebuild-spatial-index e
+        # render-heatmaps --rebuild leem), sem montar uma lista com as posições
+        lods = []
+        segments = []
+        heat = {}
+        for t, row in zip(trainings, rows):
+            lat, lon, weights = simplify.load(iter_rows(row[7]))
+            lods.extend(
+                (t['training_id'], tolerance, len(level), encode_track(level, compress=TRACK_COMPRESSION))
+                for tolerance, level in simplify.build_levels(iter_rows(row[7]), weights, TRACK_LOD_TOLERANCES)
+            )
+            segments.extend(spatial_index.index_rows(t['training_id'], lat, lon, weights))
+            heat.setdefault(t['user_id'], []).append(heatmap.rasterize_track(iter_rows(row[7]), HEATMAP_ZOOMS))
+        heat = {user_id: heatmap.merge(tile_sets) for user_id, tile_sets in heat.items()}
+        # Contagens dos tiles somadas e recomprimidas antes da transação; write_tiles confere se
+        # o tile não mudou desde a leitura e refaz a soma só dos que mudaram
+        conn = db.connection()
+        tile_updates = [update for user_id, tiles in heat.items()
+                        for update in heatmap.prepare_tiles(conn, user_id, tiles)]
+        user_ids = list(dict.fromkeys(t['user_id'] for t in trainings))
+        
+        with db.transaction(immediate=True) as conn:
+            conn.executemany('''
+                INSERT INTO trainings (id, user_id, type, distance, duration, pace, moving_time, gps_data, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+            ''', rows)
+            conn.executemany('''
+                INSERT INTO training_splits (training_id, kind, number, distance, duration, elapsed, pace)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', splits)
+            conn.executemany('''
+                INSERT INTO training_track_lods (training_id, tolerance, point_count, gps_data)
+                VALUES (?, ?, ?, ?)
+            ''', lods)
+            spatial_index.insert(conn, segments)
+            heatmap.write_tiles(conn, tile_updates)
+            
+            # Agregados, totais por período e conquistas na mesma transação dos treinos
+            for t in trainings:
+                achievements.record_training(conn, t['user_id'], t['distance'], t['duration'], t['pace'])
+            rollups.record_trainings(conn, [t['training_id'] for t in trainings])
+            for user_id in user_ids:
+                self._check_achievements(conn, user_id)
+        
+        return [(user_id, *key) for user_id, tiles in heat.items() for key in tiles]
     
-    def _check_achievements(self, user_id: str):
-        """Verifica e desbloqueia conquistas"""
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        
-        # Calcular estatísticas totais
-        cursor.execute('''
-            SELECT SUM(distance), COUNT(*), MIN(pace)
-            FROM trainings WHERE user_id = ?
-        ''', (user_id,))
-        
-        result = cursor.fetchone()
-        total_distance = result[0] or 0
-        total_trainings = result[1] or 0
-        best_pace = result[2] or 999
-        
-        # Conquistas de distância
-        achievements_to_unlock = []
-        
-        if total_distance >= 10:
-            achievements_to_unlock.append(('total_10km', 'Primeiros 10km', 'Completou 10km totais', '🏃'))
-        if total_distance >= 50:
-            achievements_to_unlock.append(('total_50km', 'Meio Centenário', 'Completou 50km totais', '🎯'))
-        if total_distance >= 100:
-            achievements_to_unlock.append(('total_100km', 'Centenário', 'Completou 100km totais', '💯'))
-        
-        # Conquistas de pace
-        if best_pace <= 6:
-            achievements_to_unlock.append(('pace_6min', 'Corredor Rápido', 'Pace abaixo de 6 min/km', '💨'))
-        
-        # Inserir conquistas que ainda não foram desbloqueadas
-        for achievement_id, name, description, icon in achievements_to_unlock:
-            cursor.execute('''
-                SELECT COUNT(*) FROM achievements 
-                WHERE user_id = ? AND name = ?
-            ''', (user_id, name))
+    def submit_training(self, user_id: str, training_type: str, distance: float,
+                        duration: int, pace: float, gps_data, journal: Optional[SessionJournal] = None,
+                        training_id: Optional[str] = None, live: Optional[Dict] = None) -> str:
+        """Enfileira um treino para gravação em segundo plano e retorna seu id
+        
+        Com journal, a sessão é marcada como finalizada antes de entrar na fila:
+        se o processo cair antes da gravação, recover_sessions a reenfileira.
+        live é o LiveMetrics.summary da sessão (tempo em movimento, parciais e voltas).
+        """
+        self.start()
+        job = {
+            'training_id': training_id or str(uuid.uuid4()),
+            'user_id': user_id,
+            'type': training_type,
+            'distance': distance,
+            'duration': duration,
+            'pace': pace,
+            'gps_data': gps_data,
+            'journal': journal,
+            'live': live
+        }
+        if journal is not None:
+            journal.finish({key: job[key] for key in ('training_id', 'distance', 'duration', 'pace', 'live')})
+        return self.persistence.submit(job)
+    
+    def import_trainings(self, user_id: str, files: Iterable[Tuple[str, IO[bytes]]],
+                         training_type: str = IMPORT_TRAINING_TYPE, batch_size: int = IMPORT_BATCH_SIZE,
+                         progress: Optional[Callable[[int], None]] = None) -> Dict:
+        """Importa o histórico de treinos de arquivos GPX/TCX, dados como (nome, arquivo)
+        
+        Cada atividade (trk do GPX, Activity do TCX) vira um treino, filtrado
+        pelo mesmo GPSTracker das sessões ao vivo e com a data do seu início. O
+        id vem do usuário e do horário de início, então reimportar um arquivo
+        pula as atividades já gravadas. Os treinos são gravados com
+        save_trainings a cada batch_size; um arquivo inválido entra em 'errors'
+        sem interromper os demais.
+        """
+        result = {'imported': 0, 'skipped': 0, 'errors': [], 'training_ids': []}
+        pending = []
+        for name, source in files:
+            try:
+                pending.extend(self._import_file(user_id, source, training_type))
+            except ValueError as e:
+                result['errors'].append({'file': name, 'error': str(e)})
+                continue
+            if len(pending) >= batch_size:
+                self._save_imported(pending, result, progress)
+                pending = []
+        if pending:
+            self._save_imported(pending, result, progress)
+        return result
+    
+    @offload.blocking
+    def _import_file(self, user_id: str, source: IO[bytes], training_type: str) -> List[Dict]:
+        """Lê um arquivo em streaming e filtra suas atividades (a parte cara da importação)
+        
+        Só a trilha aceita de cada atividade fica na memória, no TrackStore do tracker.
+        """
+        trainings = []
+        for _, points in itertools.groupby(track_files.iter_points(source), key=lambda item: item[0]):
+            gps_tracker = GPSTracker(raw_buffer_size=0)
+            start_time = end_time = None
+            batch = []
+            for _, point in points:
+                # Sem horário não há duração nem ritmo
+                if point['timestamp'] is None:
+                    continue
+                if start_time is None:
+                    start_time = point['timestamp']
+                end_time = point['timestamp']
+                batch.append(point)
+                if len(batch) == IMPORT_CHUNK_SIZE:
+                    gps_tracker.add_positions(batch)
+                    batch = []
+            if batch:
+                gps_tracker.add_positions(batch)
+            if not gps_tracker.positions.appended:
+                continue
             
-            if cursor.fetchone()[0] == 0:
-                cursor.execute('''
-                    INSERT INTO achievements (id, user_id, name, description, icon)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (str(uuid.uuid4()), user_id, name, description, icon))
+            duration = int(end_time - start_time)
+            distance = gps_tracker.total_distance
+            trainings.append({
+                'training_id': str(uuid.uuid5(IMPORT_NAMESPACE, f'{user_id}:{start_time}')),
+                'user_id': user_id,
+                'type': training_type,
+                'distance': distance,
+                'duration': duration,
+                'pace': (duration / 60) / distance if distance > 0 else 0,
+                'gps_data': gps_tracker.track(),
+                'journal': None,
+                'live': gps_tracker.live.summary(),
+                'created_at': datetime.fromtimestamp(start_time, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+            })
+        return trainings
+    
+    def _save_imported(self, trainings: List[Dict], result: Dict, progress: Optional[Callable[[int], None]]):
+        # Atividades repetidas no lote ou já gravadas por uma importação anterior
+        unique = {t['training_id']: t for t in trainings}
+        existing = self._existing_trainings(list(unique))
+        new = [t for training_id, t in unique.items() if training_id not in existing]
+        if new:
+            self.save_trainings(new)
+        
+        result['imported'] += len(new)
+        result['skipped'] += len(trainings) - len(new)
+        result['training_ids'].extend(t['training_id'] for t in new)
+        if progress:
+            progress(result['imported'] + result['skipped'])
+    
+    @offload.blocking
+    def _existing_trainings(self, training_ids: List[str]) -> Set[str]:
+        existing = set()
+        conn = db.connection()
+        # Abaixo do limite de parâmetros por consulta do SQLite
+        for start in range(0, len(training_ids), 500):
+            chunk = training_ids[start:start + 500]
+            existing.update(row[0] for row in conn.execute(
+                f'SELECT id FROM trainings WHERE id IN ({",".join("?" * len(chunk))})', chunk))
+        return existing
+    
+    def finish_session(self, training_session: Dict, end_time: float) -> Dict:
+        """Calcula as estatísticas finais de uma sessão e enfileira a gravação do treino"""
+        gps_tracker = training_session['gps_tracker']
+        # Posições que esperavam uma lacuna ainda entram no treino
+        gps_tracker.drain()
+        duration = gps_tracker.duration(training_session['start_time'], end_time)
+        distance = gps_tracker.total_distance
+        pace = (duration / 60) / distance if distance > 0 else 0
+        live = gps_tracker.live.summary()
+        
+        # Salvar treino em segundo plano (ver /api/training/<training_id>/status)
+        training_id = self.submit_training(
+            user_id=training_session['user_id'],
+            training_type=training_session['type'],
+            distance=distance,
+            duration=duration,
+            pace=pace,
+            gps_data=gps_tracker.track(),
+            journal=gps_tracker.journal,
+            live=live
+        )
         
-        conn.commit()
-        conn.close()
+        return {
+            'training_id': training_id,
+            'distance': distance,
+            'duration': duration,
+            'pace': pace,
+            'moving_time': live['moving_time'],
+            'splits': live['splits'],
+            'laps': live['laps']
+        }
+    
+    def reap_session(self, training_session: Dict, last_activity: float) -> str:
+        """Destino de uma sessão abandonada, retirada pelo reaper
+        
+        Com SESSION_IDLE_ACTION='persist' o treino é gravado até a última
+        atividade; sessões sem posições aceitas (ou com 'discard') são descartadas.
+        """
+        gps_tracker = training_session['gps_tracker']
+        if SESSION_IDLE_ACTION == 'persist' and gps_tracker.positions.appended:
+            self.finish_session(training_session, last_activity)
+            return 'persisted'
+        if gps_tracker.journal is not None:
+            gps_tracker.journal.delete()
+        return 'discarded'
+    
+    def shrink_session(self, session_id: str, training_session: Dict) -> Optional[str]:
+        """Reduz a memória do tracker de uma sessão para o orçamento de memória"""
+        gps_tracker = training_session['gps_tracker']
+        if gps_tracker.journal is not None:
+            # A trilha já está em disco; a memória guarda só a janela recente
+            return None
+        
+        if GPS_SPILL_DIR:
+            updates = training_session['updates']
+            journal = SessionJournal.create(
+                GPS_SPILL_DIR, session_id,
+                {'user_id': training_session['user_id'], 'type': training_session['type'],
+                 'start_time': training_session['start_time'],
+                 'updates': {'max_rate': updates.max_rate, 'delta': updates.delta,
+                             'keyframe_interval': updates.keyframe_interval}},
+                segment_size=JOURNAL_SEGMENT, fsync=JOURNAL_FSYNC
+            )
+            gps_tracker.spill(journal)
+            return 'spilled'
+        
+        return 'downsampled' if gps_tracker.downsample(GPS_DOWNSAMPLE_TOLERANCE) else None
+    
+    def recover_sessions(self) -> int:
+        """Reconstrói as sessões interrompidas por um reinício a partir dos journals
+        
+        Sessões ativas voltam para active_sessions; sessões já finalizadas mas
+        ainda não gravadas no banco são reenfileiradas. Retorna quantas
+        sessões foram recuperadas.
+        """
+        recovered = 0
+        # Sessões passadas para o disco pelo orçamento de memória também têm journal
+        directories = [directory for directory in dict.fromkeys((JOURNAL_DIR, GPS_SPILL_DIR)) if directory]
+        for directory, session_id in ((d, s) for d in directories for s in list_sessions(d)):
+            journal = SessionJournal(directory, session_id, segment_size=JOURNAL_SEGMENT, fsync=JOURNAL_FSYNC)
+            meta = journal.read_meta()
+            summary = journal.read_summary()
+            
+            if summary is not None:
+                if self.training_status(summary['training_id']) == 'durable':
+                    journal.delete()
+                elif self.persistence.status(summary['training_id']) is None:
+                    self.submit_training(meta['user_id'], meta['type'], summary['distance'],
+                                         summary['duration'], summary['pace'], journal, journal=journal,
+                                         training_id=summary['training_id'], live=summary.get('live'))
+                    recovered += 1
+                continue
+            
+            if session_id not in self.active_sessions:
+                self.active_sessions[session_id] = {
+                    'user_id': meta['user_id'],
+                    'type': meta['type'],
+                    'gps_tracker': GPSTracker.from_journal(journal),
+                    'updates': UpdateThrottle.from_options(meta.get('updates', {}), UPDATE_DEFAULTS),
+                    'start_time': meta['start_time'],
+                    'is_active': True
+                }
+                recovered += 1
+        
+        return recovered
+    
+    def training_status(self, training_id: str) -> str:
+        """Situação da gravação de um treino: pending, failed, durable ou unknown"""
+        status = self.persistence.status(training_id)
+        if status:
+            return status
+        return 'durable' if self._is_durable(training_id) else 'unknown'
+    
+    @offload.blocking
+    def _is_durable(self, training_id: str) -> bool:
+        row = db.connection().execute(
+            'SELECT 1 FROM trainings WHERE id = ?', (training_id,)
+        ).fetchone()
+        return row is not None
+    
+    def shutdown(self):
+        """Grava os treinos pendentes antes de encerrar o processo"""
+        self.reaper.stop()
+        self.persistence.stop()
+    
+    def _check_achievements(self, conn: sqlite3.Connection, user_id: str) -> int:
+        """Verifica e desbloqueia conquistas a partir dos agregados do usuário"""
+        return achievements.unlock_achievements(conn, user_id)
 
 # Instância global do gerenciador de treinos
 training_manager = TrainingManager()
+atexit.register(training_manager.shutdown)
+
+# Sessões com envio da atualização pendente já agendado (ver _schedule_trailing_update)
+_trailing_updates: Set[str] = set()
+
+def _tracker_memory() -> Optional[int]:
+    """Bytes das trilhas em memória das sessões ativas (só no session store em memória)"""
+    if SESSION_STORE != 'memory':
+        return None
+    return sum(training_session['gps_tracker'].nbytes
+               for _, training_session in training_manager.active_sessions.items())
+
+metrics.REGISTRY.gauge('active_sessions', 'Sessões de treino ativas',
+                       lambda: len(training_manager.active_sessions))
+metrics.REGISTRY.gauge('gps_tracker_bytes', 'Memória das trilhas das sessões ativas', _tracker_memory)
+metrics.REGISTRY.gauge('persistence_pending', 'Treinos aguardando gravação',
+                       lambda: training_manager.persistence.pending_count())
+metrics.REGISTRY.gauge('stats_cache', 'Contadores do cache de estatísticas',
+                       lambda: {(name,): value for name, value in stats_cache.stats().items()}, ('field',))
+metrics.REGISTRY.gauge('heatmap_cache', 'Contadores do cache em disco dos tiles do mapa de calor',
+                       lambda: {(name,): value for name, value in heatmap_cache.stats().items()}, ('field',))
+
+def configure_database(**options):
+    """Reconfigura o pool de conexões SQLite e garante o esquema no novo banco"""
+    db.configure(**options)
+    training_manager.init_database()
+
+@app.before_request
+def _start_training_manager():
+    """Sobe o banco e as threads do TrainingManager na primeira requisição (servidores que só importam o app)"""
+    training_manager.start()
 
 @app.route('/')
 def index():
@@ -400,13 +1301,30 @@ def start_training():
     data = request.json
     training_type = data.get('type', 'longa')
     
+    # Política de envio do training_update (max_rate, delta, keyframe_interval)
+    update_options = data.get('updates') or {}
+    try:
+        updates = UpdateThrottle.from_options(update_options, UPDATE_DEFAULTS)
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': f'Invalid update policy: {e}'}), 400
+    
     # Criar nova sessão de treino
     session_id = str(uuid.uuid4())
+    start_time = time.time()
+    journal = None
+    if JOURNAL_DIR:
+        journal = SessionJournal.create(
+            JOURNAL_DIR, session_id,
+            {'user_id': user_id, 'type': training_type, 'start_time': start_time, 'updates': update_options},
+            segment_size=JOURNAL_SEGMENT, fsync=JOURNAL_FSYNC
+        )
+    
     training_manager.active_sessions[session_id] = {
         'user_id': user_id,
         'type': training_type,
-        'gps_tracker': GPSTracker(),
-        'start_time': time.time(),
+        'gps_tracker': GPSTracker(journal=journal),
+        'updates': updates,
+        'start_time': start_time,
         'is_active': True
     }
     
@@ -415,84 +1333,416 @@ def start_training():
     return jsonify({
         'session_id': session_id,
         'status': 'started',
-        'type': training_type
+        'type': training_type,
+        'updates': {
+            'max_rate': updates.max_rate,
+            'delta': updates.delta,
+            'keyframe_interval': updates.keyframe_interval
+        }
     })
 
 @app.route('/api/training/stop', methods=['POST'])
+@EVENT_SECONDS.time('stop_training')
 def stop_training():
     """Para uma sessão de treino"""
     session_id = session.get('training_session_id')
-    if not session_id or session_id not in training_manager.active_sessions:
+    started = time.perf_counter()
+    training_session = training_manager.active_sessions.pop(session_id) if session_id else None
+    EVENT_STAGE_SECONDS.observe(time.perf_counter() - started, 'stop_training', 'session')
+    if training_session is None:
         return jsonify({'error': 'No active training session'}), 400
     
-    training_session = training_manager.active_sessions[session_id]
-    gps_tracker = training_session['gps_tracker']
+    # A atualização segurada pelo limite de taxa não espera mais o fim do intervalo
+    update = training_session['updates'].flush()
+    if update and training_session.get('sid'):
+        _emit_update('stop_training', update, training_session['sid'])
     
-    # Calcular estatísticas finais
-    duration = int(time.time() - training_session['start_time'])
-    distance = gps_tracker.total_distance
-    pace = (duration / 60) / distance if distance > 0 else 0
-    
-    # Salvar treino
-    training_id = training_manager.save_training(
-        user_id=training_session['user_id'],
-        training_type=training_session['type'],
-        distance=distance,
-        duration=duration,
-        pace=pace,
-        gps_data=gps_tracker.positions
-    )
+    # Estatísticas finais e gravação em segundo plano
+    submitting = time.perf_counter()
+    result = training_manager.finish_session(training_session, time.time())
+    EVENT_STAGE_SECONDS.observe(time.perf_counter() - submitting, 'stop_training', 'submit')
     
     # Limpar sessão
-    del training_manager.active_sessions[session_id]
     session.pop('training_session_id', None)
     
-    return jsonify({
+    return jsonify(dict(result, status='completed', persistence='pending'))
+
+@app.route('/api/training/<training_id>/status')
+def get_training_status(training_id):
+    """Informa se o treino já foi gravado de forma durável"""
+    status = training_manager.training_status(training_id)
+    return jsonify({'training_id': training_id, 'status': status}), 404 if status == 'unknown' else 200
+
+@app.route('/api/training/<training_id>/track')
+def get_training_track(training_id):
+    """Trilha do treino no nível de detalhe mais simples dentro da tolerância pedida (m)
+    
+    Sem tolerância (ou abaixo do menor nível) a trilha vai completa.
+    """
+    tolerance = request.args.get('tolerance', 0.0, type=float)
+    body = _load_track_json(training_id, tolerance)
+    if body is None:
+        return jsonify({'error': 'Training not found'}), 404
+    return app.response_class(body, mimetype='application/json')
+
+@offload.blocking
+def _load_track_json(training_id: str, tolerance: float) -> Optional[str]:
+    """Lê, decodifica e serializa a trilha (a parte cara da rota), ou None se o treino não existe"""
+    conn = db.connection()
+    row = conn.execute('''
+        SELECT tolerance, gps_data FROM training_track_lods
+        WHERE training_id = ? AND tolerance <= ?
+        ORDER BY tolerance DESC LIMIT 1
+    ''', (training_id, tolerance)).fetchone()
+    if row is None:
+        row = conn.execute('SELECT 0.0, gps_data FROM trainings WHERE id = ?', (training_id,)).fetchone()
+        if row is None:
+            return None
+    
+    positions = decode_track(row[1])
+    return json.dumps({
         'training_id': training_id,
-        'distance': distance,
-        'duration': duration,
-        'pace': pace,
-        'status': 'completed'
-    })
+        'tolerance': row[0],
+        'point_count': len(positions),
+        'positions': positions
+    }, separators=(',', ':'))
+
+@app.route('/api/training/<training_id>/gpx')
+def export_training_gpx(training_id):
+    """Trilha completa do treino em GPX, escrita em streaming a partir do gps_data salvo"""
+    row = _load_gpx_source(training_id)
+    if row is None:
+        return jsonify({'error': 'Training not found'}), 404
+    
+    training_type, created_at, gps_data = row
+    # A trilha é decodificada e escrita aos poucos, enquanto a resposta é enviada
+    response = app.response_class(
+        track_files.iter_gpx(iter_rows(gps_data), name=f'{training_type} {created_at}', training_type=training_type),
+        mimetype='application/gpx+xml'
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename="{training_id}.gpx"'
+    return response
+
+@offload.blocking
+def _load_gpx_source(training_id: str) -> Optional[Tuple]:
+    return db.connection().execute(
+        'SELECT type, created_at, gps_data FROM trainings WHERE id = ?', (training_id,)
+    ).fetchone()
+
+@app.route('/api/training/<training_id>/splits')
+def get_training_splits(training_id):
+    """Tempo em movimento, parciais por km e voltas de um treino salvo"""
+    result = _load_splits(training_id)
+    if result is None:
+        return jsonify({'error': 'Training not found'}), 404
+    return jsonify(result)
+
+@offload.blocking
+def _load_splits(training_id: str) -> Optional[Dict]:
+    conn = db.connection()
+    row = conn.execute('SELECT moving_time FROM trainings WHERE id = ?', (training_id,)).fetchone()
+    if row is None:
+        return None
+    
+    result = {'training_id': training_id, 'moving_time': row[0], 'splits': [], 'laps': []}
+    for kind, number, distance, duration, elapsed, pace in conn.execute('''
+        SELECT kind, number, distance, duration, elapsed, pace FROM training_splits
+        WHERE training_id = ? ORDER BY kind, number
+    ''', (training_id,)):
+        result[kind + 's'].append({'number': number, 'distance': distance, 'duration': duration,
+                                   'elapsed': elapsed, 'pace': pace})
+    return result
+
+@app.route('/api/trainings/import', methods=['POST'])
+def import_trainings():
+    """Importa treinos de arquivos GPX/TCX enviados no campo multipart 'files' (.gz aceito)"""
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'User not authenticated'}), 401
+    
+    uploads = request.files.getlist('files')
+    if not uploads:
+        return jsonify({'error': 'No files uploaded'}), 400
+    
+    result = training_manager.import_trainings(
+        user_id,
+        ((upload.filename, track_files.decompress(upload.filename or '', upload.stream)) for upload in uploads),
+        training_type=request.form.get('type', IMPORT_TRAINING_TYPE)
+    )
+    return jsonify(dict(result, status='success'))
+
+@app.route('/api/trainings/<user_id>')
+def list_trainings(user_id):
+    """Histórico de treinos do usuário, mais recentes primeiro, paginado por cursor
+    
+    O cursor é a posição (created_at, id) do último treino da página anterior,
+    então cada página é uma busca direta no índice idx_trainings_user_created,
+    sem OFFSET. A trilha (gps_data) nunca é lida.
+    """
+    limit = max(1, min(request.args.get('limit', 20, type=int), MAX_QUERY_LIMIT))
+    cursor = request.args.get('cursor')
+    
+    position = None
+    if cursor:
+        try:
+            position = _decode_cursor(cursor)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+    rows = _query_trainings(user_id, position, limit + 1)
+    
+    trainings = [_training_summary(row) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = trainings[-1]
+        next_cursor = _encode_cursor(last['created_at'], last['training_id'])
+    
+    return jsonify({'trainings': trainings, 'next_cursor': next_cursor})
+
+@offload.blocking
+def _query_trainings(user_id: str, position: Optional[Tuple[str, str]], limit: int) -> List[Tuple]:
+    """Treinos do usuário depois da posição (created_at, id) do cursor"""
+    if position:
+        return db.connection().execute(f'''
+            SELECT {TRAINING_SUMMARY_COLUMNS} FROM trainings
+            WHERE user_id = ? AND (created_at, id) < (?, ?)
+            ORDER BY created_at DESC, id DESC LIMIT ?
+        ''', (user_id, *position, limit)).fetchall()
+    return db.connection().execute(f'''
+        SELECT {TRAINING_SUMMARY_COLUMNS} FROM trainings
+        WHERE user_id = ?
+        ORDER BY created_at DESC, id DESC LIMIT ?
+    ''', (user_id, limit)).fetchall()
+
+def _encode_cursor(created_at: str, training_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([created_at, training_id]).encode()).decode()
+
+def _decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        created_at, training_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (TypeError, binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f'Invalid cursor: {cursor}') from e
+    if not isinstance(created_at, str) or not isinstance(training_id, str):
+        raise ValueError(f'Invalid cursor: {cursor}')
+    return created_at, training_id
+
+@app.route('/api/trainings/near')
+def get_trainings_near():
+    """Treinos que passaram a até radius metros de um ponto, mais próximos primeiro"""
+    lat = request.args.get('lat', type=float)
+    lon = request.args.get('lon', type=float)
+    radius = request.args.get('radius', 100.0, type=float)
+    if lat is None or lon is None or radius <= 0:
+        return jsonify({'error': 'lat, lon and a positive radius are required'}), 400
+    limit = max(1, min(request.args.get('limit', 50, type=int), MAX_QUERY_LIMIT))
+    
+    matches, summaries = _query_near(lat, lon, radius, request.args.get('user_id'), limit)
+    return jsonify({'trainings': [
+        dict(summaries[training_id], distance_to_point=round(distance, 1))
+        for training_id, distance in matches if training_id in summaries
+    ]})
+
+@app.route('/api/trainings/bbox')
+def get_trainings_in_bbox():
+    """Treinos que passaram por uma área retangular, mais recentes primeiro"""
+    bounds = [request.args.get(name, type=float) for name in ('min_lat', 'min_lon', 'max_lat', 'max_lon')]
+    if None in bounds or bounds[0] > bounds[2] or bounds[1] > bounds[3]:
+        return jsonify({'error': 'min_lat, min_lon, max_lat and max_lon are required'}), 400
+    limit = max(1, min(request.args.get('limit', 50, type=int), MAX_QUERY_LIMIT))
+    
+    summaries = sorted(_query_bbox(bounds, request.args.get('user_id')).values(),
+                       key=lambda summary: summary['created_at'], reverse=True)
+    return jsonify({'trainings': summaries[:limit]})
+
+@offload.blocking
+def _query_near(lat: float, lon: float, radius: float, user_id: Optional[str],
+                limit: int) -> Tuple[List[Tuple[str, float]], Dict[str, Dict]]:
+    matches = spatial_index.near(db.connection(), lat, lon, radius, user_id, limit)
+    return matches, _training_summaries([training_id for training_id, _ in matches])
+
+@offload.blocking
+def _query_bbox(bounds: List[float], user_id: Optional[str]) -> Dict[str, Dict]:
+    return _training_summaries(spatial_index.within_bbox(db.connection(), *bounds, user_id=user_id))
+
+def _training_summaries(training_ids: List[str]) -> Dict[str, Dict]:
+    """Dados resumidos (sem a trilha) dos treinos, por id"""
+    conn = db.connection()
+    summaries = {}
+    for start in range(0, len(training_ids), 500):
+        chunk = training_ids[start:start + 500]
+        rows = conn.execute(f'''
+            SELECT {TRAINING_SUMMARY_COLUMNS}
+            FROM trainings WHERE id IN ({', '.join('?' * len(chunk))})
+        ''', chunk).fetchall()
+        for row in rows:
+            summary = _training_summary(row)
+            summaries[summary['training_id']] = summary
+    return summaries
+
+def _training_summary(row: Tuple) -> Dict:
+    return dict(zip(TRAINING_SUMMARY_FIELDS, row))
 
 @socketio.on('gps_position')
+@EVENT_SECONDS.time('gps_position')
 def handle_gps_position(data):
     """Recebe dados de GPS em tempo real"""
     session_id = session.get('training_session_id')
-    if not session_id or session_id not in training_manager.active_sessions:
-        emit('error', {'message': 'No active training session'})
-        return
-    
-    training_session = training_manager.active_sessions[session_id]
-    gps_tracker = training_session['gps_tracker']
-    
-    # Processar posição GPS
-    result = gps_tracker.add_position(
-        lat=data['latitude'],
-        lon=data['longitude'],
-        accuracy=data['accuracy'],
-        speed=data.get('speed'),
-        altitude=data.get('altitude'),
-        heading=data.get('heading')
-    )
+    update = None
     
-    if result['status'] == 'accepted':
-        # Calcular estatísticas em tempo real
-        duration = int(time.time() - training_session['start_time'])
-        distance = result['total_distance']
-        pace = (duration / 60) / distance if distance > 0 else 0
-        current_speed = data.get('speed', 0) * 3.6 if data.get('speed') else 0  # km/h
+    with training_manager.active_sessions.edit(session_id) as training_session:
+        if training_session is None:
+            emit('error', {'message': 'No active training session'})
+            return
         
-        # Enviar atualização para o cliente
-        emit('training_update', {
-            'distance': distance,
-            'duration': duration,
-            'pace': pace,
-            'current_speed': current_speed,
-            'signal_strength': result['signal_strength'],
-            'accuracy': data['accuracy'],
-            'total_positions': len(gps_tracker.positions)
-        })
+        gps_tracker = training_session['gps_tracker']
+        
+        # Processar posição GPS
+        started = time.perf_counter()
+        live_time = gps_tracker.live.last_time
+        result = gps_tracker.add_position(
+            lat=data['latitude'],
+            lon=data['longitude'],
+            accuracy=data['accuracy'],
+            speed=data.get('speed'),
+            altitude=data.get('altitude'),
+            heading=data.get('heading'),
+            timestamp=data.get('timestamp'),
+            seq=data.get('seq')
+        )
+        
+        if _live_changed(gps_tracker, result, live_time):
+            update = training_session['updates'].offer(_training_update(training_session, gps_tracker, data))
+        else:
+            # Mesmo sem atualização nova, a pendente sai se o intervalo já terminou
+            update = training_session['updates'].poll()
+        _schedule_trailing_update(session_id, training_session)
+        EVENT_STAGE_SECONDS.observe(time.perf_counter() - started, 'gps_position', 'process')
+    
+    # Envio fora do bloco para não segurar a sessão durante o emit
+    if update:
+        _emit_update('gps_position', update)
+
+@socketio.on('gps_batch')
+@EVENT_SECONDS.time('gps_batch')
+def handle_gps_batch(data):
+    """Recebe um lote de posições GPS acumuladas pelo cliente"""
+    session_id = session.get('training_session_id')
+    update = None
+    
+    with training_manager.active_sessions.edit(session_id) as training_session:
+        if training_session is None:
+            emit('error', {'message': 'No active training session'})
+            return
+        
+        gps_tracker = training_session['gps_tracker']
+        
+        fixes = data.get('positions', []) if isinstance(data, dict) else data
+        started = time.perf_counter()
+        live_time = gps_tracker.live.last_time
+        result = gps_tracker.add_positions(fixes)
+        
+        if _live_changed(gps_tracker, result, live_time):
+            # Uma única atualização agregada para o lote inteiro
+            update = training_session['updates'].offer(
+                _training_update(training_session, gps_tracker, result.get('position') or gps_tracker.last_position)
+            )
+        else:
+            update = training_session['updates'].poll()
+        _schedule_trailing_update(session_id, training_session)
+        EVENT_STAGE_SECONDS.observe(time.perf_counter() - started, 'gps_batch', 'process')
+    
+    if update:
+        _emit_update('gps_batch', update)
+
+def _emit_update(event: str, update: Dict, sid: Optional[str] = None):
+    """Envia o training_update medindo o tempo do emit
+    
+    Fora de um evento do cliente (tarefa em segundo plano, rota HTTP), envia
+    para o sid da conexão guardado na sessão.
+    """
+    started = time.perf_counter()
+    if sid is None:
+        emit('training_update', update)
+    else:
+        socketio.emit('training_update', update, to=sid)
+    EVENT_STAGE_SECONDS.observe(time.perf_counter() - started, event, 'emit')
+
+def _schedule_trailing_update(session_id: str, training_session: Dict):
+    """Agenda o envio da atualização segurada pelo limite de taxa para o fim do intervalo
+    
+    Chamado dentro do edit da sessão, depois de offer/poll. Guarda o sid da
+    conexão atual, para onde a tarefa envia a atualização.
+    """
+    training_session['sid'] = request.sid
+    delay = training_session['updates'].wait()
+    if delay is not None and session_id not in _trailing_updates:
+        _trailing_updates.add(session_id)
+        socketio.start_background_task(_send_trailing_update, session_id, delay)
+
+def _send_trailing_update(session_id: str, delay: float):
+    """Envia a atualização pendente quando o intervalo do limite de taxa termina
+    
+    Sem isso, a última atualização de uma rajada de posições só sairia com a
+    próxima posição, que pode não vir (corredor parado, fim do treino).
+    """
+    while delay is not None:
+        socketio.sleep(delay)
+        update = sid = None
+        with training_manager.active_sessions.edit(session_id, touch=False) as training_session:
+            if training_session is None:
+                delay = None
+            else:
+                updates = training_session['updates']
+                update = updates.poll()
+                # Outra atualização pode ter chegado depois de um envio: espera o novo intervalo
+                delay = updates.wait()
+                sid = training_session.get('sid')
+            if delay is None:
+                _trailing_updates.discard(session_id)
+        if update:
+            _emit_update('trailing_update', update, sid)
+
+def _live_changed(gps_tracker: GPSTracker, result: Dict, live_time: Optional[float]) -> bool:
+    """Se a posição mudou o que o training_update mostra
+    
+    Além das aceitas, as descartadas por movimento mínimo passam pelo
+    LiveMetrics e andam o relógio: tempo em movimento, pausa automática e fim
+    da pausa mudam com o corredor parado.
+    """
+    return result['status'] == 'accepted' or gps_tracker.live.last_time != live_time
+
+def _training_update(training_session: Dict, gps_tracker: GPSTracker, fix: Dict) -> Dict:
+    """Monta as estatísticas em tempo real enviadas ao cliente (fix: a posição mais recente)"""
+    duration = gps_tracker.duration(training_session['start_time'], time.time())
+    distance = gps_tracker.total_distance
+    pace = (duration / 60) / distance if distance > 0 else 0
+    current_speed = fix.get('speed', 0) * 3.6 if fix.get('speed') else 0  # km/h
+    
+    return {
+        'distance': distance,
+        'duration': duration,
+        'pace': pace,
+        'current_speed': current_speed,
+        'signal_strength': gps_tracker._get_signal_strength(fix['accuracy']),
+        'accuracy': fix['accuracy'],
+        'total_positions': gps_tracker.positions.appended,
+        **gps_tracker.live.snapshot()
+    }
+
+@socketio.on('lap')
+def handle_lap(data=None):
+    """Fecha a volta atual, marcada pelo corredor"""
+    session_id = session.get('training_session_id')
+    
+    with training_manager.active_sessions.edit(session_id) as training_session:
+        if training_session is None:
+            emit('error', {'message': 'No active training session'})
+            return
+        lap = training_session['gps_tracker'].live.lap()
+    
+    if lap is None:
+        emit('error', {'message': 'No position received yet'})
+    else:
+        emit('lap_recorded', lap)
 
 @socketio.on('calibrate_gps')
 def handle_gps_calibration(data):
@@ -505,10 +1755,29 @@ def handle_gps_calibration(data):
         'status': 'calibrating'
     })
 
+@app.route('/metrics')
+def get_metrics():
+    """Métricas no formato texto do Prometheus"""
+    return app.response_class(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/stats/<user_id>')
 def get_user_stats(user_id):
     """Retorna estatísticas do usuário"""
-    conn = sqlite3.connect(DATABASE)
+    # Em um acerto do cache o banco não é consultado
+    entry, hit = stats_cache.get_or_load(user_id, lambda: _load_user_stats(user_id))
+    
+    if entry.etag in request.if_none_match:
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(entry.payload)
+    response.set_etag(entry.etag)
+    response.headers['X-Cache'] = 'HIT' if hit else 'MISS'
+    return response
+
+@offload.blocking
+def _load_user_stats(user_id: str) -> Dict:
+    """Consulta as estatísticas e conquistas do usuário no banco"""
+    conn = db.connection()
     cursor = conn.cursor()
     
     # Estatísticas gerais
@@ -531,11 +1800,9 @@ def get_user_stats(user_id):
         ORDER BY unlocked_at DESC
     ''', (user_id,))
     
-    achievements = cursor.fetchall()
+    unlocked = cursor.fetchall()
     
-    conn.close()
-    
-    return jsonify({
+    return {
         'total_trainings': stats[0] or 0,
         'total_distance': stats[1] or 0,
         'total_duration': stats[2] or 0,
@@ -547,9 +1814,71 @@ def get_user_stats(user_id):
                 'description': a[1],
                 'icon': a[2],
                 'unlocked_at': a[3]
-            } for a in achievements
+            } for a in unlocked
         ]
+    }
+
+@app.route('/api/heatmap/<user_id>/<int:z>/<int:x>/<int:y>.png')
+def get_heatmap_tile(user_id, z, x, y):
+    """Tile z/x/y do mapa de calor de todas as trilhas do usuário (PNG transparente onde não há treinos)"""
+    # O user_id vira parte do caminho no cache em disco
+    if z not in HEATMAP_ZOOMS or not (0 <= x < 2 ** z and 0 <= y < 2 ** z) or not re.fullmatch(r'[\w-]+', user_id):
+        return jsonify({'error': 'Tile not found'}), 404
+    
+    key = (user_id, z, x, y)
+    png = heatmap_cache.get(key)
+    if png is None:
+        generation = heatmap_cache.generation
+        png = _render_heatmap_tile(user_id, z, x, y)
+        if png is None:
+            png = heatmap.EMPTY_TILE
+        else:
+            heatmap_cache.put(key, png, generation)
+    
+    # Os tiles mudam a cada treino salvo: o navegador revalida pelo ETag
+    response = app.response_class(png, mimetype='image/png')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
+
+@offload.blocking
+def _render_heatmap_tile(user_id: str, z: int, x: int, y: int) -> Optional[bytes]:
+    counts = heatmap.load_counts(db.connection(), user_id, z, x, y)
+    return heatmap.render_png(counts) if counts is not None else None
+
+@app.route('/api/trends/<user_id>')
+def get_user_trends(user_id):
+    """Distância, duração, treinos e pace do usuário por dia, semana ou mês
+    
+    period: day, week (padrão) ou month. since/until: datas YYYY-MM-DD; sem
+    elas, os últimos TREND_DEFAULT_PERIODS períodos até hoje (UTC).
+    """
+    period = request.args.get('period', 'week')
+    if period not in rollups.PERIODS:
+        return jsonify({'error': f'Invalid period: {period}'}), 400
+    try:
+        until = date.fromisoformat(request.args['until']) if 'until' in request.args \
+            else datetime.now(timezone.utc).date()
+        since = date.fromisoformat(request.args['since']) if 'since' in request.args \
+            else rollups.add_periods(period, rollups.period_start(period, until), 1 - TREND_DEFAULT_PERIODS[period])
+    except ValueError:
+        return jsonify({'error': 'Invalid date, expected YYYY-MM-DD'}), 400
+    if since > until:
+        return jsonify({'error': 'since must not be after until'}), 400
+    if rollups.count_periods(period, since, until) > MAX_TREND_PERIODS:
+        return jsonify({'error': f'At most {MAX_TREND_PERIODS} periods per request'}), 400
+    
+    return jsonify({
+        'user_id': user_id,
+        'period': period,
+        'trends': _load_trends(user_id, period, since, until)
     })
 
+@offload.blocking
+def _load_trends(user_id: str, period: str, since: date, until: date) -> List[Dict]:
+    return rollups.get_trends(db.connection(), user_id, period, since, until)
+
 if __name__ == '__main__':
+    training_manager.start()
+    training_manager.recover_sessions()
     socketio.run(app, debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,74 @@
+"""
+Micro-benchmark do custo de geometria por posição GPS
+
+Compara o caminho antigo de add_position (até três chamadas de Haversine por
+posição aceita) com o atual (uma projeção local para o filtro de salto e uma
+para o segmento) e mede add_position de ponta a ponta.
+
+    python benchmarks/bench_geometry.py [--fixes N] [--repeat N]
+"""
+
+import argparse
+import timeit
+
+from common import fake_clock, load_app
+from synthetic import generate_track
+
+import geometry
+
+
+def synthetic_fixes(count: int, seed: int = 42):
+    """Posições da trilha sintética como tuplas (lat, lon, precisão, velocidade, timestamp)"""
+    return [(fix['latitude'], fix['longitude'], fix['accuracy'], fix['speed'], fix['timestamp'])
+            for fix in generate_track(count, seed=seed)]
+
+
+def bench_distance(fixes, repeat: int):
+    pairs = list(zip(fixes, fixes[1:]))
+
+    def haversine_x3():
+        for (lat1, lon1, *_), (lat2, lon2, *_) in pairs:
+            geometry.haversine(lat1, lon1, lat2, lon2)
+            geometry.haversine(lat1, lon1, lat2, lon2)
+            geometry.haversine(lat1, lon1, lat2, lon2)
+
+    projection = geometry.LocalProjection()
+
+    def projection_x2():
+        for (lat1, lon1, *_), (lat2, lon2, *_) in pairs:
+            projection.distance(lat1, lon1, lat2, lon2)
+            projection.distance(lat1, lon1, lat2, lon2)
+
+    before = min(timeit.repeat(haversine_x3, number=1, repeat=repeat)) / len(pairs)
+    after = min(timeit.repeat(projection_x2, number=1, repeat=repeat)) / len(pairs)
+    return before, after
+
+
+def bench_add_position(fixes, repeat: int):
+    app = load_app()
+
+    def run():
+        tracker = app.GPSTracker()
+        for lat, lon, accuracy, speed, timestamp in fixes:
+            clock.now = timestamp
+            tracker.add_position(lat, lon, accuracy, speed)
+
+    with fake_clock(app) as clock:
+        return min(timeit.repeat(run, number=1, repeat=repeat)) / len(fixes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fixes', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    fixes = synthetic_fixes(args.fixes)
+    before, after = bench_distance(fixes, args.repeat)
+    print(f'📏 Distância por posição: haversine x3 {before * 1e6:.2f} µs | '
+          f'projeção x2 {after * 1e6:.2f} µs ({before / after:.1f}x)')
+    print(f'📍 add_position: {bench_add_position(fixes, args.repeat) * 1e6:.2f} µs por posição')
+
+
+if __name__ == '__main__':
+    main()
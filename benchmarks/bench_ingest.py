@@ -0,0 +1,103 @@
+"""
+Micro-benchmarks do caminho de ingestão de GPS
+
+Mede, sobre uma trilha sintética (ver synthetic.py):
+
+- GPSTracker.add_position, por posição
+- GPSTracker.add_positions (lote), por posição
+- KalmanFilter.filter, por chamada
+- TrainingManager.save_training, por treino (banco temporário)
+
+    python benchmarks/bench_ingest.py [--fixes N] [--repeat N] [--trainings N] [--output arquivo.json]
+"""
+
+import argparse
+import uuid
+
+from common import fake_clock, load_app, time_per_op, write_results
+from synthetic import generate_track
+
+
+def bench_add_position(app, fixes, repeat: int) -> dict:
+    last = {}
+
+    def run():
+        tracker = last['tracker'] = app.GPSTracker()
+        for fix in fixes:
+            clock.now = fix['timestamp']
+            tracker.add_position(fix['latitude'], fix['longitude'], fix['accuracy'],
+                                 fix['speed'], fix['altitude'], fix['heading'])
+
+    with fake_clock(app) as clock:
+        result = time_per_op(run, len(fixes), repeat)
+    # Para conferir que a trilha sintética exercita os filtros
+    result['accepted'] = last['tracker'].positions.appended
+    return result
+
+
+def bench_add_positions(app, fixes, repeat: int, batch_size: int = 30) -> dict:
+    def run():
+        tracker = app.GPSTracker()
+        for start in range(0, len(fixes), batch_size):
+            tracker.add_positions(fixes[start:start + batch_size])
+
+    result = time_per_op(run, len(fixes), repeat)
+    result['batch_size'] = batch_size
+    return result
+
+
+def bench_kalman(app, fixes, repeat: int) -> dict:
+    def run():
+        kalman = app.KalmanFilter()
+        for fix in fixes:
+            kalman.filter(fix)
+
+    return time_per_op(run, len(fixes), repeat)
+
+
+def bench_save_training(app, fixes, repeat: int, trainings: int) -> dict:
+    tracker = app.GPSTracker()
+    tracker.add_positions(fixes)
+    user_id = app.training_manager.create_user('Benchmark', 30, 70, 1.75, 'intermediario')
+
+    def run():
+        for _ in range(trainings):
+            app.training_manager.save_training(user_id, 'longa', tracker.total_distance, 3600, 5.5,
+                                               tracker.positions, training_id=str(uuid.uuid4()))
+
+    result = time_per_op(run, trainings, repeat)
+    result['track_positions'] = len(tracker.positions)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fixes', type=int, default=3600, help='Posições da trilha sintética')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--trainings', type=int, default=20, help='Treinos gravados por repetição')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Arquivo JSON com os resultados')
+    args = parser.parse_args()
+
+    app = load_app()
+    fixes = generate_track(args.fixes, seed=args.seed)
+
+    results = {
+        'fixes': args.fixes,
+        'add_position': bench_add_position(app, fixes, args.repeat),
+        'add_positions': bench_add_positions(app, fixes, args.repeat),
+        'kalman_filter': bench_kalman(app, fixes, args.repeat),
+        'save_training': bench_save_training(app, fixes, args.repeat, args.trainings)
+    }
+
+    for name in ('add_position', 'add_positions', 'kalman_filter', 'save_training'):
+        result = results[name]
+        print(f"⏱️  {name:<14} {result['best_us']:>10.2f} µs/op (mediana {result['median_us']:.2f})")
+    print(f"📍 {results['add_position']['accepted']} de {args.fixes} posições aceitas")
+
+    app.training_manager.shutdown()
+    write_results(args.output, 'ingest', results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Utilitários compartilhados pelos benchmarks
+"""
+
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, Optional, Sequence
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def load_app():
+    """Importa o app com o banco em um diretório temporário
+
+    Os caminhos padrão do app (o do banco, por exemplo) são relativos ao
+    diretório atual, então o diretório de trabalho muda antes do import.
+    """
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    os.chdir(workdir)
+    import app
+    app.configure_database(path=os.path.join(workdir, 'bench.db'))
+    return app
+
+
+class FakeClock:
+    """Relógio controlado pelo benchmark, no lugar do módulo time usado pelo app"""
+
+    now = 0.0
+    # Os tempos das métricas continuam reais
+    perf_counter = staticmethod(time.perf_counter)
+
+    @classmethod
+    def time(cls) -> float:
+        return cls.now
+
+
+@contextmanager
+def fake_clock(module):
+    """Troca module.time por FakeClock enquanto o bloco executa"""
+    real_time, module.time = module.time, FakeClock
+    try:
+        yield FakeClock
+    finally:
+        module.time = real_time
+
+
+def time_per_op(fn: Callable[[], None], ops: int, repeat: int) -> Dict:
+    """Executa fn repeat vezes e retorna o tempo por operação (µs)"""
+    timings = [t / ops * 1e6 for t in timeit.repeat(fn, number=1, repeat=repeat)]
+    return {
+        'ops': ops,
+        'repeat': repeat,
+        'best_us': round(min(timings), 3),
+        'median_us': round(statistics.median(timings), 3)
+    }
+
+
+def percentiles(values: Sequence[float], points: Iterable[int] = (50, 90, 99)) -> Dict:
+    """Percentis (pelo posto mais próximo) e máximo de uma amostra"""
+    if not values:
+        return {f'p{point}': None for point in points}
+    ordered = sorted(values)
+    result = {f'p{point}': ordered[min(len(ordered) - 1, int(len(ordered) * point / 100))] for point in points}
+    result['max'] = ordered[-1]
+    return result
+
+
+def environment() -> Dict:
+    """Dados da máquina e da versão do código, para comparar execuções"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count()
+    }
+
+
+def write_results(path: Optional[str], benchmark: str, results: Dict) -> Dict:
+    """Acrescenta o ambiente aos resultados e grava o JSON (se path for informado)"""
+    document = {'benchmark': benchmark, 'environment': environment(), 'results': results}
+    if path:
+        with open(path, 'w') as f:
+            json.dump(document, f, indent=2)
+        print(f"💾 Resultados gravados em {path}")
+    return document
+
+
+def elapsed(start: float) -> float:
+    return time.perf_counter() - start
@@ -0,0 +1,267 @@
+"""
+Teste de carga do evento gps_position com N corredores simulados
+
+Cada corredor cria um usuário, inicia um treino, envia as posições de uma
+trilha sintética pelo Socket.IO (esperando a confirmação de cada evento, o que
+dá a latência de ida e volta) e finaliza o treino. Relata posições/s,
+latência p50/p90/p99 e memória por sessão, e grava o resultado em JSON.
+
+Dois modos:
+
+- em processo (padrão): clientes de teste do Flask-SocketIO no mesmo
+  processo, com o relógio do app avançando junto com a trilha. Mede o custo do
+  servidor sem rede; a memória por sessão é medida com tracemalloc em uma
+  passada separada, para não distorcer a latência.
+- rede (--url http://host:5000): clientes python-socketio reais contra um
+  servidor rodando, cada um em uma thread enviando --rate posições por segundo.
+  Precisa das dependências de benchmarks/requirements.txt. A memória por
+  sessão vem do /metrics do servidor (gps_tracker_bytes / active_sessions),
+  lido quando todos os corredores terminaram de enviar; conta só as trilhas
+  em memória e exige SESSION_STORE=memory.
+
+    python benchmarks/load_socketio.py --clients 50 --fixes 600 [--output carga.json]
+    python benchmarks/load_socketio.py --url http://localhost:5000 --clients 200 --fixes 120 --rate 1
+"""
+
+import argparse
+import http.cookiejar
+import json
+import re
+import threading
+import time
+import tracemalloc
+import urllib.request
+from typing import Dict, List, Optional
+
+from common import elapsed, fake_clock, load_app, percentiles, write_results
+from synthetic import generate_track
+
+USER = {'name': 'Corredor', 'age': 30, 'weight': 70, 'height': 1.75, 'level': 'intermediario'}
+
+
+def runner_tracks(clients: int, fixes: int, seed: int) -> List[List[Dict]]:
+    """Uma trilha por corredor, cada um começando em um ponto diferente"""
+    return [
+        generate_track(fixes, seed=seed + i, start=(-23.55 + (i % 50) * 0.01, -46.63 + (i // 50) * 0.01))
+        for i in range(clients)
+    ]
+
+
+def run_in_process(args) -> Dict:
+    app = load_app()
+    tracks = runner_tracks(args.clients, args.fixes, args.seed)
+    updates = {'max_rate': args.update_rate} if args.update_rate is not None else {}
+
+    def start_runners(count: int):
+        runners = []
+        for _ in range(count):
+            client = app.app.test_client()
+            client.post('/api/user', json=USER)
+            client.post('/api/training/start', json={'type': 'longa', 'updates': updates})
+            runners.append((client, app.socketio.test_client(app.app, flask_test_client=client)))
+        return runners
+
+    runners = start_runners(args.clients)
+    latencies = []
+    received = 0
+
+    # As posições dos corredores são intercaladas, como chegariam ao servidor
+    with fake_clock(app) as clock:
+        started = time.perf_counter()
+        for i in range(args.fixes):
+            for (_, sock), track in zip(runners, tracks):
+                fix = track[i]
+                clock.now = fix['timestamp']
+                sent = time.perf_counter()
+                sock.emit('gps_position', fix, callback=True)
+                latencies.append(elapsed(sent))
+            for _, sock in runners:
+                received += len(sock.get_received())
+        duration = elapsed(started)
+
+    for client, sock in runners:
+        sock.disconnect()
+        client.post('/api/training/stop')
+
+    return {
+        'mode': 'in-process',
+        'duration_s': round(duration, 3),
+        'latencies': latencies,
+        'updates_received': received,
+        'memory_per_session_bytes': measure_session_memory(app, start_runners, tracks, args)
+    }
+
+
+def measure_session_memory(app, start_runners, tracks: List[List[Dict]], args) -> int:
+    """Memória que cada sessão ativa acumula ao receber a trilha inteira (tracemalloc)
+
+    As sessões são criadas antes da medição; conta só o que cresce com as posições.
+    """
+    count = min(args.clients, 10)
+    runners = start_runners(count)
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        with fake_clock(app) as clock:
+            for i in range(args.fixes):
+                for (_, sock), track in zip(runners, tracks):
+                    clock.now = track[i]['timestamp']
+                    sock.emit('gps_position', track[i])
+                for _, sock in runners:
+                    sock.get_received()
+        used = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        tracemalloc.stop()
+    for client, sock in runners:
+        sock.disconnect()
+        client.post('/api/training/stop')
+    return used // count
+
+
+def run_network(args) -> Dict:
+    import socketio
+
+    tracks = runner_tracks(args.clients, args.fixes, args.seed)
+    updates = {'max_rate': args.update_rate} if args.update_rate is not None else {}
+    latencies = []
+    received = [0]
+    errors = []
+    lock = threading.Lock()
+    ready = threading.Barrier(args.clients + 1)
+    # Segunda barreira: o /metrics é lido com todas as sessões ainda ativas
+    sent_all = threading.Barrier(args.clients + 1)
+
+    def post(opener, path: str, payload: Dict) -> Dict:
+        request = urllib.request.Request(args.url + path, data=json.dumps(payload).encode(),
+                                         headers={'Content-Type': 'application/json'})
+        with opener.open(request, timeout=30) as response:
+            return json.load(response)
+
+    def runner(track: List[Dict]):
+        own_latencies = []
+        sock = None
+        try:
+            cookies = http.cookiejar.CookieJar()
+            opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(cookies))
+            post(opener, '/api/user', USER)
+            post(opener, '/api/training/start', {'type': 'longa', 'updates': updates})
+
+            sock = socketio.Client()
+            sock.on('training_update', lambda data: _count(received, lock))
+            cookie_header = '; '.join(f'{cookie.name}={cookie.value}' for cookie in cookies)
+            sock.connect(args.url, headers={'Cookie': cookie_header}, transports=['websocket'])
+        except Exception as e:
+            errors.append(repr(e))
+            ready.abort()
+            return
+
+        try:
+            ready.wait()
+        except threading.BrokenBarrierError:
+            sock.disconnect()
+            return
+
+        try:
+            interval = 1 / args.rate if args.rate else 0
+            next_send = time.perf_counter()
+            for fix in track:
+                if interval:
+                    next_send += interval
+                    time.sleep(max(0.0, next_send - time.perf_counter()))
+                sent = time.perf_counter()
+                sock.call('gps_position', fix, timeout=30)
+                own_latencies.append(elapsed(sent))
+            try:
+                sent_all.wait()
+            except threading.BrokenBarrierError:
+                pass
+            post(opener, '/api/training/stop', {})
+        except Exception as e:
+            errors.append(repr(e))
+            sent_all.abort()
+        finally:
+            sock.disconnect()
+            with lock:
+                latencies.extend(own_latencies)
+
+    threads = [threading.Thread(target=runner, args=(track,), daemon=True) for track in tracks]
+    for thread in threads:
+        thread.start()
+    try:
+        ready.wait()
+    except threading.BrokenBarrierError:
+        raise SystemExit(f"❌ Falha ao iniciar os corredores: {errors[0]}")
+    started = time.perf_counter()
+    memory_per_session = None
+    try:
+        sent_all.wait()
+        duration = elapsed(started)
+        memory_per_session = server_session_memory(args.url)
+    except threading.BrokenBarrierError:
+        duration = elapsed(started)
+    for thread in threads:
+        thread.join()
+
+    return {
+        'mode': 'network',
+        'url': args.url,
+        'rate_per_client': args.rate,
+        'duration_s': round(duration, 3),
+        'latencies': latencies,
+        'updates_received': received[0],
+        'errors': errors,
+        'memory_per_session_bytes': memory_per_session
+    }
+
+
+def server_session_memory(url: str) -> Optional[int]:
+    """Memória das trilhas por sessão ativa segundo o /metrics do servidor"""
+    with urllib.request.urlopen(url + '/metrics', timeout=30) as response:
+        text = response.read().decode()
+    # Só as duas métricas sem labels interessam aqui
+    values = dict(re.findall(r'^(gps_tracker_bytes|active_sessions) (\S+)$', text, re.MULTILINE))
+    if 'gps_tracker_bytes' not in values or not float(values.get('active_sessions', 0)):
+        return None
+    return int(float(values['gps_tracker_bytes']) / float(values['active_sessions']))
+
+
+def _count(counter: List[int], lock: threading.Lock):
+    with lock:
+        counter[0] += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=20, help='Corredores simultâneos')
+    parser.add_argument('--fixes', type=int, default=300, help='Posições enviadas por corredor')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--url', help='Servidor a testar pela rede (padrão: em processo)')
+    parser.add_argument('--rate', type=float, default=1.0, help='Posições por segundo por corredor (modo rede; 0 = sem pausa)')
+    parser.add_argument('--update-rate', type=float, help='max_rate do training_update de cada sessão')
+    parser.add_argument('--output', help='Arquivo JSON com os resultados')
+    args = parser.parse_args()
+
+    run = run_network(args) if args.url else run_in_process(args)
+    latencies = run.pop('latencies')
+    sent = len(latencies)
+    results = dict(
+        run,
+        clients=args.clients,
+        fixes_per_client=args.fixes,
+        fixes=sent,
+        fixes_per_sec=round(sent / run['duration_s'], 1) if run['duration_s'] else None,
+        latency_ms={name: None if value is None else round(value * 1000, 3)
+                    for name, value in percentiles(latencies).items()}
+    )
+
+    latency = results['latency_ms']
+    print(f"🏃 {args.clients} corredores, {sent} posições em {results['duration_s']} s "
+          f"({results['fixes_per_sec']} posições/s)")
+    print(f"⏱️  latência p50 {latency['p50']} ms | p90 {latency['p90']} ms | p99 {latency['p99']} ms")
+    if results['memory_per_session_bytes'] is not None:
+        print(f"🧠 {results['memory_per_session_bytes'] / 1024:.1f} KiB por sessão")
+    write_results(args.output, 'socketio-load', results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Gerador de trilhas GPS sintéticas para os benchmarks
+
+Simula uma corrida com uma posição por intervalo: direção e ritmo variando
+aos poucos, pausas (semáforo, cadarço), erro de GPS correlacionado no tempo
+que acompanha a precisão, precisão que deriva e piora em trechos (árvores,
+prédios, túneis) e saltos isolados de multicaminho.
+"""
+
+import math
+import random
+from typing import Dict, List, Tuple
+
+METERS_PER_DEGREE = 111_195.0
+
+
+def generate_track(count: int = 3600, seed: int = 0, start: Tuple[float, float] = (-23.55, -46.63),
+                   start_time: float = 1_000_000.0, interval: float = 1.0, speed: float = 3.0,
+                   jump_probability: float = 0.01, pause_probability: float = 0.002,
+                   degraded_probability: float = 0.005) -> List[Dict]:
+    """Gera count posições no formato recebido pelo evento gps_position (com timestamp)"""
+    rng = random.Random(seed)
+    lat, lon = start
+    heading = rng.uniform(0, 360)
+    accuracy = rng.uniform(4, 8)
+    altitude = rng.uniform(0, 900)
+    error_north = error_east = 0.0
+    paused = degraded = 0
+    fixes = []
+
+    for i in range(count):
+        # Movimento real: pausas ocasionais e direção/ritmo em passeio aleatório
+        if paused:
+            paused -= 1
+            true_speed = 0.0
+        else:
+            if rng.random() < pause_probability:
+                paused = rng.randint(10, 60)
+            heading = (heading + rng.gauss(0, 6)) % 360
+            true_speed = max(0.5, speed + rng.gauss(0, 0.3))
+        step = true_speed * interval
+        lat += step * math.cos(math.radians(heading)) / METERS_PER_DEGREE
+        lon += step * math.sin(math.radians(heading)) / (METERS_PER_DEGREE * math.cos(math.radians(lat)))
+        altitude += rng.gauss(0, 0.3)
+
+        # Precisão: deriva lenta, com trechos de sinal ruim
+        if degraded:
+            degraded -= 1
+        elif rng.random() < degraded_probability:
+            degraded = rng.randint(5, 30)
+        accuracy = min(40.0, max(3.0, accuracy + rng.gauss(0, 0.4)))
+        reported_accuracy = round(rng.uniform(30, 80) if degraded else accuracy, 1)
+
+        # Erro de posição correlacionado (AR(1)) proporcional à precisão
+        error_north = 0.9 * error_north + rng.gauss(0, reported_accuracy * 0.2)
+        error_east = 0.9 * error_east + rng.gauss(0, reported_accuracy * 0.2)
+        if rng.random() < jump_probability:
+            # Salto de multicaminho: uma posição isolada a centenas de metros
+            jump_north, jump_east = rng.uniform(-500, 500), rng.uniform(-500, 500)
+        else:
+            jump_north = jump_east = 0.0
+
+        fixes.append({
+            'latitude': lat + (error_north + jump_north) / METERS_PER_DEGREE,
+            'longitude': lon + (error_east + jump_east) / (METERS_PER_DEGREE * math.cos(math.radians(lat))),
+            'accuracy': reported_accuracy,
+            'speed': round(max(0.0, true_speed + rng.gauss(0, 0.2)), 2),
+            'altitude': round(altitude, 1),
+            'heading': round(heading, 1),
+            'timestamp': start_time + i * interval
+        })
+    return fixes
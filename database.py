@@ -0,0 +1,134 @@
+"""
+Pool de conexões SQLite reaproveitadas por thread
+"""
+
+import sqlite3
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Iterator
+
+import metrics
+import native
+
+SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+TRANSACTION_SECONDS = metrics.REGISTRY.histogram(
+    'db_transaction_seconds', 'Duração das transações, incluindo a espera pela trava de escrita',
+    ('mode',), slow_log=True)
+COMMIT_SECONDS = metrics.REGISTRY.histogram('db_commit_seconds', 'Duração dos commits')
+
+
+class _PooledConnection(sqlite3.Connection):
+    """Conexão que aceita referências fracas, para o pool não prolongar sua vida"""
+
+
+class ConnectionPool:
+    """Mantém uma conexão SQLite aberta por thread do sistema
+
+    Abrir uma conexão por operação obriga o SQLite a reabrir o arquivo e a
+    recompilar as consultas a cada chamada. Aqui cada thread reaproveita sua
+    conexão, o cache de statements do módulo sqlite3 guarda as consultas
+    preparadas e o modo WAL permite leituras simultâneas a uma escrita.
+
+    Trava e thread-local são os do sistema (native), pois o pool é usado
+    pelas threads do offload mesmo com monkey patching. Com eventlet/gevent as
+    green threads da thread do hub dividem a conexão dela: uma transação aberta
+    fora do offload não pode ceder a vez (emit, sleep, offload.run) antes do
+    commit, ou outra green thread entraria nela como transação aninhada.
+    """
+
+    def __init__(self, path: str, journal_mode: str = 'WAL', synchronous: str = 'NORMAL',
+                 busy_timeout: int = 5000, cached_statements: int = 256):
+        self._local = native.local()
+        self._lock = native.lock()
+        self._connections = weakref.WeakSet()
+        self._generation = 0
+        self.configure(path=path, journal_mode=journal_mode, synchronous=synchronous,
+                       busy_timeout=busy_timeout, cached_statements=cached_statements)
+
+    def configure(self, path: str = None, journal_mode: str = None, synchronous: str = None,
+                  busy_timeout: int = None, cached_statements: int = None):
+        """Altera a configuração; as conexões abertas são fechadas e recriadas sob demanda"""
+        if synchronous is not None and synchronous.upper() not in SYNCHRONOUS_MODES:
+            raise ValueError(f'Invalid synchronous mode: {synchronous}')
+
+        with self._lock:
+            if path is not None:
+                self.path = path
+            if journal_mode is not None:
+                self.journal_mode = journal_mode.upper()
+            if synchronous is not None:
+                self.synchronous = synchronous.upper()
+            if busy_timeout is not None:
+                self.busy_timeout = int(busy_timeout)
+            if cached_statements is not None:
+                self.cached_statements = int(cached_statements)
+            self._generation += 1
+
+        self.close_all()
+
+    def connection(self) -> sqlite3.Connection:
+        """Retorna a conexão da thread atual, abrindo-a se necessário"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.generation == self._generation:
+            return conn
+
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout / 1000,
+            cached_statements=self.cached_statements,
+            check_same_thread=False,
+            factory=_PooledConnection
+        )
+        conn.execute(f'PRAGMA journal_mode = {self.journal_mode}')
+        conn.execute(f'PRAGMA synchronous = {self.synchronous}')
+        conn.execute(f'PRAGMA busy_timeout = {self.busy_timeout}')
+
+        self._local.conn = conn
+        self._local.generation = self._generation
+        with self._lock:
+            self._connections.add(conn)
+
+        return conn
+
+    @contextmanager
+    def transaction(self, immediate: bool = False) -> Iterator[sqlite3.Connection]:
+        """Executa um bloco em uma transação, com commit ou rollback no final
+
+        Com immediate=True a trava de escrita é obtida no início, evitando que
+        duas transações de leitura tentem se promover a escrita ao mesmo tempo.
+        """
+        conn = self.connection()
+        if conn.in_transaction:
+            # Transação aninhada: quem abriu a transação externa faz o commit
+            yield conn
+            return
+
+        start = time.perf_counter()
+        if immediate:
+            conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            commit_start = time.perf_counter()
+            conn.commit()
+            COMMIT_SECONDS.observe(time.perf_counter() - commit_start)
+        finally:
+            TRANSACTION_SECONDS.observe(time.perf_counter() - start, 'immediate' if immediate else 'deferred')
+
+    def close_all(self):
+        """Fecha todas as conexões abertas pelo pool"""
+        with self._lock:
+            connections = list(self._connections)
+            self._connections = weakref.WeakSet()
+
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = native.local()
@@ -0,0 +1,314 @@
+"""
+Mapa de calor pessoal em tiles z/x/y (Web Mercator, 256x256 pixels)
+
+Cada trilha salva é rasterizada em todos os níveis de zoom configurados: os
+trechos entre posições consecutivas viram linhas de pixels e cada pixel conta
+uma vez por treino. A tabela heatmap_tiles guarda, por usuário e tile, quantos
+treinos passaram por cada pixel (uint16 comprimido com zlib). Um treino novo
+só soma seus pixels aos tiles que toca, sem reler as outras trilhas:
+prepare_tiles lê as contagens e monta os blobs novos antes da transação de
+escrita, e write_tiles, já na transação do INSERT, só grava os que ninguém
+mudou nesse meio tempo; render_png transforma a contagem na imagem servida
+pela rota de tiles, que fica no TileCache em disco.
+
+rebuild e prerender são os comandos em lote (manage.py render-heatmaps): a
+rasterização das trilhas e a geração dos PNGs rodam em um pool de processos.
+"""
+
+import functools
+import math
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from geometry import DEG, EARTH_RADIUS_KM
+from tile_cache import TileCache
+from track_codec import iter_rows
+
+TILE_SIZE = 256
+TILE_PIXELS = TILE_SIZE * TILE_SIZE
+# Limite de latitude do Web Mercator
+MAX_LATITUDE = 85.05112878
+METERS_PER_DEGREE = EARTH_RADIUS_KM * 1000 * DEG
+# Trechos mais longos que isso (m) são lacunas do sinal: não viram linha
+MAX_SEGMENT_METERS = 200.0
+# Treinos em um pixel para a cor mais intensa (escala logarítmica)
+SATURATION = 20
+MAX_COUNT = np.iinfo(np.uint16).max
+
+# (z, x, y) -> pixels tocados no tile (índice y * TILE_SIZE + x)
+TileKey = Tuple[int, int, int]
+Tiles = Dict[TileKey, np.ndarray]
+
+
+def rasterize(lat: np.ndarray, lon: np.ndarray, zooms: Sequence[int]) -> Tiles:
+    """Pixels tocados pela trilha em cada tile de cada zoom, sem repetição"""
+    tiles = {}
+    if not len(lat):
+        return tiles
+    lat = np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE)
+    # Posição no mundo, de 0 a 1
+    world_x = (lon + 180) / 360
+    world_y = 0.5 - np.arcsinh(np.tan(lat * DEG)) / (2 * math.pi)
+    gaps = np.hypot(np.diff(lat), np.diff(lon) * np.cos(lat[:-1] * DEG)) * METERS_PER_DEGREE > MAX_SEGMENT_METERS
+
+    for zoom in zooms:
+        scale = TILE_SIZE << zoom
+        x, y = _densify(world_x * scale, world_y * scale, gaps)
+        pixels = np.unique(np.clip(y.astype(np.int64), 0, scale - 1) * scale
+                           + np.clip(x.astype(np.int64), 0, scale - 1))
+        px, py = pixels % scale, pixels // scale
+        tile = (py // TILE_SIZE) * (1 << zoom) + px // TILE_SIZE
+        local = (py % TILE_SIZE) * TILE_SIZE + px % TILE_SIZE
+        order = np.argsort(tile, kind='stable')
+        tile, local = tile[order], local[order].astype(np.uint16)
+        starts = np.flatnonzero(np.r_[True, tile[1:] != tile[:-1]])
+        for start, end in zip(starts, np.r_[starts[1:], len(tile)]):
+            ty, tx = divmod(int(tile[start]), 1 << zoom)
+            tiles[(zoom, tx, ty)] = local[start:end]
+    return tiles
+
+
+def rasterize_track(rows: Iterable[Tuple], zooms: Sequence[int]) -> Tiles:
+    """rasterize a partir de posições em tuplas na ordem de FIELDS"""
+    coords = np.array([row[:2] for row in rows], dtype=float).reshape(-1, 2)
+    return rasterize(coords[:, 0], coords[:, 1], zooms)
+
+
+def merge(tile_sets: Iterable[Tiles]) -> Tiles:
+    """Junta os pixels de várias trilhas (um pixel aparece uma vez por trilha)"""
+    parts: Dict[TileKey, List[np.ndarray]] = {}
+    for tiles in tile_sets:
+        for key, pixels in tiles.items():
+            parts.setdefault(key, []).append(pixels)
+    return {key: np.concatenate(pixels) for key, pixels in parts.items()}
+
+
+class TileUpdate(NamedTuple):
+    """Contagem nova de um tile, montada por prepare_tiles"""
+    user_id: str
+    key: TileKey
+    pixels: np.ndarray
+    stored: Optional[bytes]   # blob lido (None se o tile não existia), a versão conferida na gravação
+    counts: bytes
+
+
+def prepare_tiles(conn, user_id: str, tiles: Tiles) -> List[TileUpdate]:
+    """Soma os pixels às contagens gravadas do usuário, fora da transação de escrita
+
+    A descompressão, a soma e a recompressão dos tiles ficam aqui, e
+    write_tiles só grava os blobs prontos enquanto segura a trava.
+    """
+    return [_tile_update(conn, user_id, key, pixels) for key, pixels in tiles.items()]
+
+
+def write_tiles(conn, updates: Iterable[TileUpdate]):
+    """Grava o resultado de prepare_tiles (chamar dentro da transação de escrita)
+
+    Cada tile só é gravado se o blob ainda é o lido em prepare_tiles. Se outra
+    escrita (uma importação, render-heatmaps --rebuild em outro processo)
+    mudou o tile nesse meio tempo, a soma desse tile é refeita aqui, sobre a
+    contagem atual.
+    """
+    for update in updates:
+        user_id, (zoom, x, y) = update.user_id, update.key
+        if update.stored is None:
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO heatmap_tiles (user_id, z, x, y, counts) VALUES (?, ?, ?, ?, ?)',
+                (user_id, zoom, x, y, update.counts)
+            )
+        else:
+            cursor = conn.execute(
+                'UPDATE heatmap_tiles SET counts = ? WHERE user_id = ? AND z = ? AND x = ? AND y = ? AND counts = ?',
+                (update.counts, user_id, zoom, x, y, update.stored)
+            )
+        if not cursor.rowcount:
+            retry = _tile_update(conn, user_id, update.key, update.pixels)
+            conn.execute('INSERT OR REPLACE INTO heatmap_tiles (user_id, z, x, y, counts) VALUES (?, ?, ?, ?, ?)',
+                         (user_id, zoom, x, y, retry.counts))
+
+
+def _tile_update(conn, user_id: str, key: TileKey, pixels: np.ndarray) -> TileUpdate:
+    row = conn.execute(
+        'SELECT counts FROM heatmap_tiles WHERE user_id = ? AND z = ? AND x = ? AND y = ?', (user_id, *key)
+    ).fetchone()
+    counts = np.bincount(pixels, minlength=TILE_PIXELS).astype(np.uint32)
+    if row:
+        counts += decode_counts(row[0])
+    return TileUpdate(user_id, key, pixels, row[0] if row else None, encode_counts(counts))
+
+
+def load_counts(conn, user_id: str, zoom: int, x: int, y: int) -> Optional[np.ndarray]:
+    """Contagem por pixel do tile, ou None se nenhum treino do usuário passa por ele"""
+    row = conn.execute(
+        'SELECT counts FROM heatmap_tiles WHERE user_id = ? AND z = ? AND x = ? AND y = ?',
+        (user_id, zoom, x, y)
+    ).fetchone()
+    return decode_counts(row[0]) if row else None
+
+
+def encode_counts(counts: np.ndarray) -> bytes:
+    return zlib.compress(np.minimum(counts, MAX_COUNT).astype('<u2').tobytes())
+
+
+def decode_counts(data: bytes) -> np.ndarray:
+    return np.frombuffer(zlib.decompress(data), dtype='<u2')
+
+
+def render_png(counts: np.ndarray) -> bytes:
+    """PNG RGBA do tile: transparente sem treinos, de laranja a amarelo-claro conforme a contagem"""
+    counts = counts.reshape(TILE_SIZE, TILE_SIZE)
+    intensity = np.clip(np.log1p(counts) / math.log1p(SATURATION), 0, 1)
+    rgba = np.empty((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8)
+    rgba[..., 0] = 255
+    rgba[..., 1] = 90 + 165 * intensity
+    rgba[..., 2] = 200 * intensity ** 2
+    rgba[..., 3] = np.where(counts > 0, 110 + 145 * intensity, 0)
+    return encode_png(rgba)
+
+
+def encode_png(rgba: np.ndarray) -> bytes:
+    """Codifica uma imagem RGBA (altura x largura x 4, uint8) em PNG"""
+    height, width = rgba.shape[:2]
+    # Cada linha começa com o byte do filtro (0, nenhum)
+    raw = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    raw[:, 1:] = rgba.reshape(height, -1)
+    return b''.join((
+        b'\x89PNG\r\n\x1a\n',
+        _png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)),
+        _png_chunk(b'IDAT', zlib.compress(raw.tobytes())),
+        _png_chunk(b'IEND', b'')
+    ))
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+EMPTY_TILE = encode_png(np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8))
+
+
+def rasterize_rows(rows: List[Tuple], zooms: Sequence[int]) -> List[Tuple[str, Tiles]]:
+    """Rasteriza um bloco de (user_id, gps_data); roda nos processos do pool"""
+    return [(user_id, rasterize_track(iter_rows(gps_data), zooms)) for user_id, gps_data in rows]
+
+
+def render_rows(rows: List[Tuple]) -> List[Tuple[Tuple, bytes]]:
+    """Gera os PNGs de um bloco de (user_id, z, x, y, counts); roda nos processos do pool"""
+    return [((user_id, zoom, x, y), render_png(decode_counts(counts))) for user_id, zoom, x, y, counts in rows]
+
+
+def rebuild(db, zooms: Sequence[int], user_id: Optional[str] = None, chunk_size: int = 200, workers: int = 1,
+            progress: Callable[[int], None] = None) -> int:
+    """Recalcula heatmap_tiles a partir das trilhas salvas (de um usuário ou de todos)
+
+    Só entram os treinos que já existiam quando os tiles foram apagados; os
+    gravados durante a reconstrução são somados pela gravação incremental.
+    Retorna quantos treinos foram rasterizados.
+    """
+    where, params = ('user_id = ?', (user_id,)) if user_id else ('1', ())
+    with db.transaction(immediate=True) as conn:
+        conn.execute(f'DELETE FROM heatmap_tiles WHERE {where}', params)
+        last_rowid = conn.execute('SELECT COALESCE(MAX(rowid), 0) FROM trainings').fetchone()[0]
+
+    conn = db.connection()
+    processed = 0
+
+    def read_chunks() -> Iterator[List[Tuple]]:
+        rowid = 0
+        while True:
+            rows = conn.execute(f'''
+                SELECT rowid, user_id, gps_data FROM trainings
+                WHERE rowid > ? AND rowid <= ? AND {where} ORDER BY rowid LIMIT ?
+            ''', (rowid, last_rowid, *params, chunk_size)).fetchall()
+            if not rows:
+                return
+            rowid = rows[-1][0]
+            yield [row[1:] for row in rows]
+
+    def commit(results: List[Tuple[str, Tiles]]):
+        nonlocal processed
+        by_user: Dict[str, List[Tiles]] = {}
+        for owner, tiles in results:
+            by_user.setdefault(owner, []).append(tiles)
+        updates = [update for owner, tile_sets in by_user.items()
+                   for update in prepare_tiles(conn, owner, merge(tile_sets))]
+        with db.transaction(immediate=True):
+            write_tiles(conn, updates)
+        processed += len(results)
+        if progress:
+            progress(processed)
+
+    _run_chunks(read_chunks(), functools.partial(rasterize_rows, zooms=tuple(zooms)), commit, workers)
+    return processed
+
+
+def prerender(db, cache: TileCache, user_id: Optional[str] = None, chunk_size: int = 200, workers: int = 1,
+              progress: Callable[[int], None] = None) -> int:
+    """Gera os PNGs de todos os tiles (de um usuário ou de todos) no cache em disco
+
+    Retorna quantos tiles foram gerados.
+    """
+    conn = db.connection()
+    user_filter, params = ('AND user_id = ?', (user_id,)) if user_id else ('', ())
+    rendered = 0
+
+    def read_chunks() -> Iterator[List[Tuple]]:
+        position = ('', -1, -1, -1)
+        while True:
+            rows = conn.execute(f'''
+                SELECT user_id, z, x, y, counts FROM heatmap_tiles
+                WHERE (user_id, z, x, y) > (?, ?, ?, ?) {user_filter}
+                ORDER BY user_id, z, x, y LIMIT ?
+            ''', (*position, *params, chunk_size)).fetchall()
+            if not rows:
+                return
+            position = rows[-1][:4]
+            yield rows
+
+    def commit(results: List[Tuple[Tuple, bytes]]):
+        nonlocal rendered
+        for key, png in results:
+            cache.put(key, png)
+        rendered += len(results)
+        if progress:
+            progress(rendered)
+
+    _run_chunks(read_chunks(), render_rows, commit, workers)
+    return rendered
+
+
+def _densify(px: np.ndarray, py: np.ndarray, gaps: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Pontos a cada pixel ao longo dos trechos (as lacunas ficam só com as extremidades)"""
+    if len(px) < 2:
+        return px, py
+    dx, dy = np.diff(px), np.diff(py)
+    steps = np.maximum(np.ceil(np.maximum(np.abs(dx), np.abs(dy))), 1).astype(np.int64)
+    steps[gaps] = 1
+    segment = np.repeat(np.arange(len(dx)), steps)
+    fraction = (np.arange(len(segment)) - np.repeat(np.cumsum(steps) - steps, steps)) / steps[segment]
+    return (np.r_[px[segment] + dx[segment] * fraction, px[-1]],
+            np.r_[py[segment] + dy[segment] * fraction, py[-1]])
+
+
+def _run_chunks(chunks: Iterator[List[Tuple]], work: Callable, commit: Callable, workers: int):
+    """work(bloco) em um pool de processos (com workers > 1), commit dos resultados na ordem dos blocos"""
+    if workers <= 1:
+        for chunk in chunks:
+            commit(work(chunk))
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Poucos blocos em andamento por vez, para não carregar a tabela inteira na memória
+        in_flight = deque()
+        for chunk in chunks:
+            in_flight.append(pool.submit(work, chunk))
+            if len(in_flight) >= workers * 2:
+                commit(in_flight.popleft().result())
+        while in_flight:
+            commit(in_flight.popleft().result())
+
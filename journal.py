@@ -0,0 +1,129 @@
+"""
+Journal em disco das sessões de treino ativas
+
+Cada sessão tem até quatro arquivos no diretório do journal:
+
+    <session_id>.meta   JSON com usuário, tipo e início do treino
+    <session_id>.track  posições aceitas, registros de 7 doubles (ordem de FIELDS)
+    <session_id>.state  JSON com o estado do filtro Kalman no último flush
+    <session_id>.done   JSON com o resumo do treino, criado quando ele é finalizado
+
+As posições são acumuladas em memória e gravadas em segmentos de
+segment_size registros, então um reinício perde no máximo um segmento.
+"""
+
+import json
+import os
+import struct
+from typing import Dict, Iterator, List, Optional, Tuple
+
+RECORD = struct.Struct('<7d')
+READ_CHUNK = RECORD.size * 4096
+
+
+class SessionJournal:
+    """Journal append-only das posições aceitas de uma sessão"""
+
+    def __init__(self, directory: str, session_id: str, segment_size: int = 16, fsync: bool = False):
+        self.directory = directory
+        self.session_id = session_id
+        self.segment_size = segment_size
+        self.fsync = fsync
+        self._buffer = bytearray()
+        self._buffered = 0
+
+    @classmethod
+    def create(cls, directory: str, session_id: str, meta: Dict, **options) -> 'SessionJournal':
+        """Cria o journal de uma sessão nova, gravando seus metadados"""
+        os.makedirs(directory, exist_ok=True)
+        journal = cls(directory, session_id, **options)
+        _write_json(journal._path('meta'), meta)
+        return journal
+
+    def append(self, row: Tuple[float, ...]):
+        """Acrescenta uma posição ao segmento em memória"""
+        self._buffer += RECORD.pack(*row)
+        self._buffered += 1
+
+    @property
+    def needs_flush(self) -> bool:
+        return self._buffered >= self.segment_size
+
+    def flush(self, state: Optional[Dict] = None):
+        """Grava o segmento em memória no arquivo e, se informado, o estado da sessão"""
+        if self._buffer:
+            with open(self._path('track'), 'ab') as f:
+                f.write(self._buffer)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            self._buffer = bytearray()
+            self._buffered = 0
+        if state is not None:
+            _write_json(self._path('state'), state)
+
+    def rows(self) -> Iterator[Tuple[float, ...]]:
+        """Lê as posições gravadas (e as ainda em memória) sem carregar o arquivo inteiro"""
+        path = self._path('track')
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                pending = b''
+                while True:
+                    data = f.read(READ_CHUNK)
+                    if not data:
+                        break
+                    pending += data
+                    usable = len(pending) - len(pending) % RECORD.size
+                    yield from RECORD.iter_unpack(pending[:usable])
+                    pending = pending[usable:]
+        # Um registro incompleto no fim do arquivo (queda no meio da escrita) é ignorado
+        yield from RECORD.iter_unpack(bytes(self._buffer))
+
+    def finish(self, summary: Dict):
+        """Marca a sessão como finalizada; o journal fica até o treino ser gravado no banco"""
+        self.flush()
+        _write_json(self._path('done'), summary)
+
+    def read_summary(self) -> Optional[Dict]:
+        """Resumo gravado por finish, ou None se a sessão ainda estava ativa"""
+        return _read_json(self._path('done'))
+
+    def read_meta(self) -> Optional[Dict]:
+        return _read_json(self._path('meta'))
+
+    def read_state(self) -> Optional[Dict]:
+        return _read_json(self._path('state'))
+
+    def delete(self):
+        """Remove os arquivos do journal (depois que o treino foi gravado no banco)"""
+        for kind in ('track', 'state', 'done', 'meta'):
+            try:
+                os.remove(self._path(kind))
+            except FileNotFoundError:
+                pass
+
+    def _path(self, kind: str) -> str:
+        return os.path.join(self.directory, f'{self.session_id}.{kind}')
+
+
+def list_sessions(directory: str) -> List[str]:
+    """Sessões com journal no diretório (para recuperação após reinício)"""
+    if not directory or not os.path.isdir(directory):
+        return []
+    return sorted(name[:-len('.meta')] for name in os.listdir(directory) if name.endswith('.meta'))
+
+
+def _write_json(path: str, data: Dict):
+    # Gravação atômica: um reinício nunca encontra o arquivo pela metade
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: str) -> Optional[Dict]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,220 @@
+"""
+Métricas ao vivo de uma sessão: parciais por km, voltas, ritmo em janela móvel e pausa automática
+
+O LiveMetrics é alimentado pelo GPSTracker a cada posição que passa pelo
+filtro de qualidade (aceita ou descartada por movimento mínimo), com o
+timestamp e a distância acumulada. Cada atualização custa O(1) amortizado:
+as janelas móveis são deques de (timestamp, distância) podados pelo início,
+e uma parcial só é fechada quando a distância cruza a próxima fronteira,
+com o instante do cruzamento interpolado dentro do segmento. Nada depende
+da trilha guardada, então o mesmo resultado sai na hora e no fim do treino.
+
+Pausa automática: com a velocidade média dos últimos pause_window segundos
+abaixo de pause_speed a sessão entra em pausa, e volta acima de
+resume_speed. O tempo em pausa não conta no tempo em movimento, que é o
+usado nas parciais e nas voltas; como a pausa só é detectada depois de
+pause_window segundos lentos, esses segundos ainda contam como movimento.
+Um intervalo sem posições maior que pause_window só conta como movimento se
+a distância percorrida nele corresponder a pelo menos pause_speed.
+"""
+
+from collections import deque
+from typing import Deque, Dict, NamedTuple, Optional, Tuple
+
+
+class LiveSettings(NamedTuple):
+    """Parâmetros das métricas ao vivo"""
+    split_distance: float = 1.0        # km por parcial
+    window: float = 30.0               # s da janela do ritmo e da velocidade
+    pause_window: float = 10.0         # s da janela da pausa automática
+    pause_speed: float = 0.5           # m/s: abaixo disso, pausa
+    resume_speed: float = 1.0          # m/s: acima disso, retoma
+
+DEFAULT_LIVE_SETTINGS = LiveSettings()
+
+
+class LiveMetrics:
+    """Parciais, voltas, ritmo móvel e pausa automática, atualizados a cada posição"""
+
+    def __init__(self, settings: LiveSettings = DEFAULT_LIVE_SETTINGS):
+        self.settings = settings
+        self.start_time = None
+        self.last_time = None
+        self.distance = 0.0
+        self.moving_time = 0.0
+        self.paused = False
+        self.pauses = 0
+        self.splits = []
+        self.laps = []
+        # (timestamp, distância) das janelas móveis
+        self._window: Deque[Tuple[float, float]] = deque()
+        self._pause_window: Deque[Tuple[float, float]] = deque()
+        # Início (tempo em movimento, timestamp) da parcial e (distância, tempo em movimento, timestamp) da volta
+        self._split_start = (0.0, None)
+        self._lap_start = (0.0, 0.0, None)
+
+    def update(self, timestamp: float, distance: float):
+        """Registra uma posição: timestamp (s) e distância acumulada da sessão (km)"""
+        if self.start_time is None:
+            self.start_time = self.last_time = timestamp
+            self._split_start = (0.0, timestamp)
+            self._lap_start = (distance, 0.0, timestamp)
+            self.distance = distance
+            self._window.append((timestamp, distance))
+            self._pause_window.append((timestamp, distance))
+            return
+
+        # Posições fora de ordem não andam o relógio
+        elapsed = max(0.0, timestamp - self.last_time)
+        timestamp = self.last_time + elapsed
+        previous_distance, previous_moving = self.distance, self.moving_time
+
+        if self._is_moving(elapsed, distance - previous_distance):
+            self.moving_time += elapsed
+        self.distance = distance
+        self.last_time = timestamp
+
+        _push(self._window, self.settings.window, timestamp, distance)
+        _push(self._pause_window, self.settings.pause_window, timestamp, distance)
+        self._update_pause(timestamp)
+
+        split_distance = self.settings.split_distance
+        while distance >= (len(self.splits) + 1) * split_distance:
+            # Interpola o instante em que a fronteira da parcial foi cruzada
+            boundary = (len(self.splits) + 1) * split_distance
+            covered = distance - previous_distance
+            fraction = (boundary - previous_distance) / covered if covered > 0 else 1.0
+            crossed_moving = previous_moving + fraction * (self.moving_time - previous_moving)
+            crossed_time = timestamp - elapsed + fraction * elapsed
+            start_moving, start_time = self._split_start
+            duration = crossed_moving - start_moving
+            self.splits.append({
+                'number': len(self.splits) + 1,
+                'distance': split_distance,
+                'duration': round(duration, 1),
+                'elapsed': round(crossed_time - start_time, 1),
+                'pace': (duration / 60) / split_distance
+            })
+            self._split_start = (crossed_moving, crossed_time)
+
+    def lap(self) -> Optional[Dict]:
+        """Fecha a volta atual na última posição recebida e a retorna; None antes da primeira posição"""
+        if self.start_time is None:
+            return None
+        start_distance, start_moving, start_time = self._lap_start
+        distance = self.distance - start_distance
+        duration = self.moving_time - start_moving
+        lap = {
+            'number': len(self.laps) + 1,
+            'distance': distance,
+            'duration': round(duration, 1),
+            'elapsed': round(self.last_time - start_time, 1),
+            'pace': (duration / 60) / distance if distance > 0 else 0
+        }
+        self.laps.append(lap)
+        self._lap_start = (self.distance, self.moving_time, self.last_time)
+        return lap
+
+    def rolling_speed(self) -> float:
+        """Velocidade (m/s) na janela móvel; zero em pausa"""
+        if self.paused or len(self._window) < 2:
+            return 0.0
+        oldest_time, oldest_distance = self._window[0]
+        span = self.last_time - oldest_time
+        return (self.distance - oldest_distance) * 1000 / span if span > 0 else 0.0
+
+    def rolling_pace(self) -> Optional[float]:
+        """Ritmo (min/km) na janela móvel; None parado ou em pausa"""
+        speed = self.rolling_speed()
+        return (1000 / speed) / 60 if speed > 0 else None
+
+    def snapshot(self) -> Dict:
+        """Campos enviados no training_update
+
+        Parciais e voltas vão como contagem e a última de cada, então a mensagem
+        não cresce ao longo do treino e o envio delta só repete a parcial quando
+        uma nova fecha. As listas completas ficam em summary.
+        """
+        speed = self.rolling_speed()
+        return {
+            'moving_time': int(self.moving_time),
+            'rolling_pace': (1000 / speed) / 60 if speed > 0 else None,
+            'rolling_speed': speed * 3.6,  # km/h
+            'paused': self.paused,
+            'split_count': len(self.splits),
+            'last_split': self.splits[-1] if self.splits else None,
+            'lap_count': len(self.laps),
+            'last_lap': self.laps[-1] if self.laps else None
+        }
+
+    def summary(self) -> Dict:
+        """O que é gravado com o treino"""
+        return {
+            'moving_time': int(self.moving_time),
+            'pauses': self.pauses,
+            'splits': list(self.splits),
+            'laps': list(self.laps)
+        }
+
+    def to_state(self) -> Dict:
+        return {
+            'settings': tuple(self.settings),
+            'start_time': self.start_time,
+            'last_time': self.last_time,
+            'distance': self.distance,
+            'moving_time': self.moving_time,
+            'paused': self.paused,
+            'pauses': self.pauses,
+            'splits': list(self.splits),
+            'laps': list(self.laps),
+            'window': list(self._window),
+            'pause_window': list(self._pause_window),
+            'split_start': self._split_start,
+            'lap_start': self._lap_start
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict) -> 'LiveMetrics':
+        live = cls(LiveSettings(*state['settings']))
+        live.start_time = state['start_time']
+        live.last_time = state['last_time']
+        live.distance = state['distance']
+        live.moving_time = state['moving_time']
+        live.paused = state['paused']
+        live.pauses = state['pauses']
+        live.splits = list(state['splits'])
+        live.laps = list(state['laps'])
+        live._window = deque(tuple(sample) for sample in state['window'])
+        live._pause_window = deque(tuple(sample) for sample in state['pause_window'])
+        live._split_start = tuple(state['split_start'])
+        live._lap_start = tuple(state['lap_start'])
+        return live
+
+    def _is_moving(self, elapsed: float, covered: float) -> bool:
+        """Se o intervalo desde a posição anterior conta como tempo em movimento"""
+        if elapsed > self.settings.pause_window:
+            # Sem posições por muito tempo (parado, GPS sem sinal): decide pelo deslocamento
+            return covered * 1000 / elapsed >= self.settings.pause_speed
+        return not self.paused
+
+    def _update_pause(self, timestamp: float):
+        oldest_time, oldest_distance = self._pause_window[0]
+        span = timestamp - oldest_time
+        # Janela ainda curta demais para decidir
+        if span < self.settings.pause_window / 2:
+            return
+        speed = (self.distance - oldest_distance) * 1000 / span
+        if self.paused:
+            if speed > self.settings.resume_speed:
+                self.paused = False
+        elif span >= self.settings.pause_window and speed < self.settings.pause_speed:
+            self.paused = True
+            self.pauses += 1
+
+
+def _push(samples: Deque[Tuple[float, float]], window: float, timestamp: float, distance: float):
+    """Acrescenta uma amostra e descarta as que saíram da janela, mantendo uma no início dela"""
+    samples.append((timestamp, distance))
+    start = timestamp - window
+    while len(samples) > 1 and samples[1][0] <= start:
+        samples.popleft()
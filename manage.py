@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Comandos de manutenção do banco de dados do Treinador de Corrida
+
+Uso:
+    python manage.py migrate-tracks [--batch-size N] [--no-compress]
+    python manage.py backfill-aggregates
+    python manage.py rebuild-rollups
+    python manage.py rebuild-spatial-index [--batch-size N]
+    python manage.py reprocess-tracks [--workers N] [--chunk-size N] [--restart] [--max-accuracy M ...]
+    python manage.py render-heatmaps [--user-id ID] [--rebuild] [--workers N] [--chunk-size N]
+    python manage.py import-tracks --user-id ID [--type TIPO] [--batch-size N] ARQUIVO_OU_PASTA...
+"""
+
+import argparse
+import os
+import sys
+from typing import IO, Iterator, List, Tuple
+
+import achievements
+import heatmap
+import reprocess
+import rollups
+import simplify
+import spatial_index
+import track_files
+from app import (db, FilterSettings, HEATMAP_ZOOMS, IMPORT_BATCH_SIZE, IMPORT_TRAINING_TYPE, heatmap_cache,
+                 training_manager)
+from track_codec import encode_track, iter_rows, iter_track
+
+
+def migrate_tracks(args) -> int:
+    """Converte as trilhas salvas em JSON para o formato binário"""
+    conn = db.connection()
+    converted = 0
+    last_rowid = 0
+
+    while True:
+        # Paginação por rowid: cada lote é lido e gravado em uma transação curta
+        rows = conn.execute('''
+            SELECT rowid, gps_data FROM trainings
+            WHERE rowid > ? AND typeof(gps_data) = 'text'
+            ORDER BY rowid LIMIT ?
+        ''', (last_rowid, args.batch_size)).fetchall()
+        if not rows:
+            break
+
+        updates = [
+            (encode_track(iter_track(gps_data), compress=not args.no_compress), rowid)
+            for rowid, gps_data in rows
+        ]
+        with db.transaction(immediate=True):
+            conn.executemany('UPDATE trainings SET gps_data = ? WHERE rowid = ?', updates)
+
+        converted += len(updates)
+        last_rowid = rows[-1][0]
+        print(f"🔄 {converted} trilhas convertidas...")
+
+    print(f"✅ Migração concluída: {converted} trilhas no formato binário")
+    return 0
+
+
+def backfill_aggregates(args) -> int:
+    """Recalcula user_aggregates a partir dos treinos e desbloqueia conquistas pendentes"""
+    with db.transaction(immediate=True) as conn:
+        unlocked = achievements.backfill(conn)
+        users = conn.execute('SELECT COUNT(*) FROM user_aggregates').fetchone()[0]
+
+    print(f"✅ Agregados recalculados para {users} usuários, {unlocked} conquistas desbloqueadas")
+    return 0
+
+
+def rebuild_rollups(args) -> int:
+    """Recalcula os totais por dia, semana e mês (training_rollups) a partir dos treinos"""
+    with db.transaction(immediate=True) as conn:
+        rows = rollups.rebuild(conn)
+        users = conn.execute('SELECT COUNT(DISTINCT user_id) FROM training_rollups').fetchone()[0]
+
+    print(f"✅ Totais por período recalculados: {rows} períodos de {users} usuários")
+    return 0
+
+
+def rebuild_spatial_index(args) -> int:
+    """Recria o índice espacial (track_segments) a partir das trilhas salvas
+
+    O índice novo é montado em uma tabela à parte e troca de lugar com o atual
+    no fim, então as consultas continuam usando o índice completo durante a
+    reconstrução. Os treinos gravados depois do início já foram indexados pelo
+    servidor e são copiados do índice atual na troca.
+    """
+    conn = db.connection()
+    shadow = 'track_segments_rebuild'
+    max_rowid = conn.execute('SELECT COALESCE(MAX(rowid), 0) FROM trainings').fetchone()[0]
+    with db.transaction(immediate=True):
+        # Sobra de uma reconstrução interrompida
+        conn.execute(f'DROP TABLE IF EXISTS {shadow}')
+        spatial_index.create_tables(conn, shadow)
+
+    indexed = 0
+    last_rowid = 0
+    while True:
+        rows = conn.execute('''
+            SELECT rowid, id, gps_data FROM trainings
+            WHERE rowid > ? AND rowid <= ? ORDER BY rowid LIMIT ?
+        ''', (last_rowid, max_rowid, args.batch_size)).fetchall()
+        if not rows:
+            break
+
+        segments = []
+        for _, training_id, gps_data in rows:
+            lat, lon, weights = simplify.load(iter_rows(gps_data))
+            segments.extend(spatial_index.index_rows(training_id, lat, lon, weights))
+        with db.transaction(immediate=True):
+            spatial_index.insert(conn, segments, shadow)
+
+        indexed += len(rows)
+        last_rowid = rows[-1][0]
+        print(f"🗺️  {indexed} trilhas indexadas...")
+
+    with db.transaction(immediate=True):
+        conn.execute(f'''
+            INSERT INTO {shadow} (min_lat, max_lat, min_lon, max_lon, training_id, points)
+            SELECT min_lat, max_lat, min_lon, max_lon, training_id, points FROM track_segments
+            WHERE training_id IN (SELECT id FROM trainings WHERE rowid > ?)
+        ''', (max_rowid,))
+        conn.execute('DROP TABLE track_segments')
+        conn.execute(f'ALTER TABLE {shadow} RENAME TO track_segments')
+
+    print(f"✅ Índice espacial recriado: {indexed} trilhas")
+    return 0
+
+
+def reprocess_tracks(args) -> int:
+    """Recalcula distância, pace, tempo em movimento e parciais dos treinos salvos com novos parâmetros de filtro"""
+    settings = FilterSettings(**{name: getattr(args, name) for name in FilterSettings._fields})
+    try:
+        result = reprocess.run(
+            db, settings, chunk_size=args.chunk_size, workers=args.workers, restart=args.restart,
+            progress=lambda processed: print(f"🔄 {processed} treinos reprocessados...")
+        )
+    except ValueError as e:
+        print(f"❌ O checkpoint existente usa outros parâmetros de filtro ({e}); use --restart para descartá-lo")
+        return 1
+
+    if result['resumed_from']:
+        print(f"↩️  Retomado do checkpoint após {result['resumed_from']} treinos")
+
+    print(f"✅ Reprocessamento concluído: {result['processed']} treinos, {result['unlocked']} conquistas desbloqueadas")
+    return 0
+
+
+def render_heatmaps(args) -> int:
+    """Gera os tiles do mapa de calor no cache em disco; com --rebuild, recalcula antes as contagens das trilhas"""
+    if args.rebuild:
+        rasterized = heatmap.rebuild(
+            db, HEATMAP_ZOOMS, user_id=args.user_id, chunk_size=args.chunk_size, workers=args.workers,
+            progress=lambda processed: print(f"🗺️  {processed} trilhas rasterizadas...")
+        )
+        print(f"✅ Contagens do mapa de calor recalculadas: {rasterized} trilhas")
+        # Os tiles gerados antes vêm das contagens antigas
+        heatmap_cache.clear((args.user_id,) if args.user_id else ())
+
+    rendered = heatmap.prerender(
+        db, heatmap_cache, user_id=args.user_id, chunk_size=args.chunk_size, workers=args.workers,
+        progress=lambda processed: print(f"🖼️  {processed} tiles gerados...")
+    )
+    print(f"✅ Mapa de calor gerado: {rendered} tiles em {heatmap_cache.directory}")
+    return 0
+
+
+def import_tracks(args) -> int:
+    """Importa o histórico de treinos de arquivos GPX/TCX (pastas incluem os .gpx, .tcx e .gz de dentro)"""
+    if db.connection().execute('SELECT 1 FROM users WHERE id = ?', (args.user_id,)).fetchone() is None:
+        print(f"❌ Usuário {args.user_id} não encontrado")
+        return 1
+
+    paths = _track_paths(args.paths)
+    print(f"📂 {len(paths)} arquivos para importar")
+    result = training_manager.import_trainings(
+        args.user_id, _open_tracks(paths), training_type=args.type, batch_size=args.batch_size,
+        progress=lambda processed: print(f"📥 {processed} atividades lidas...")
+    )
+
+    for error in result['errors']:
+        print(f"⚠️  {error['file']}: {error['error']}")
+    print(f"✅ Importação concluída: {result['imported']} treinos importados, "
+          f"{result['skipped']} já existentes, {len(result['errors'])} arquivos com erro")
+    return 1 if result['errors'] else 0
+
+
+def _track_paths(paths: List[str]) -> List[str]:
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(sorted(
+                os.path.join(path, name) for name in os.listdir(path)
+                if name.lower().endswith(('.gpx', '.tcx', '.gpx.gz', '.tcx.gz'))
+            ))
+        else:
+            found.append(path)
+    return found
+
+
+def _open_tracks(paths: List[str]) -> Iterator[Tuple[str, IO[bytes]]]:
+    """Abre um arquivo por vez, fechando o anterior"""
+    for path in paths:
+        with open(path, 'rb') as source:
+            yield path, track_files.decompress(path, source)
+
+
+def main():
+    """Função principal dos comandos de manutenção"""
+    parser = argparse.ArgumentParser(description='Manutenção do Treinador de Corrida')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    migrate = commands.add_parser('migrate-tracks', help='Converte trilhas JSON para o formato binário')
+    migrate.add_argument('--batch-size', type=int, default=500)
+    migrate.add_argument('--no-compress', action='store_true', help='Não comprimir com zlib')
+    migrate.set_defaults(handler=migrate_tracks)
+
+    backfill = commands.add_parser('backfill-aggregates', help='Recalcula os agregados usados pelas conquistas')
+    backfill.set_defaults(handler=backfill_aggregates)
+
+    rollups_parser = commands.add_parser('rebuild-rollups', help='Recalcula os totais por dia, semana e mês')
+    rollups_parser.set_defaults(handler=rebuild_rollups)
+
+    spatial = commands.add_parser('rebuild-spatial-index', help='Recria o índice espacial das trilhas')
+    spatial.add_argument('--batch-size', type=int, default=200)
+    spatial.set_defaults(handler=rebuild_spatial_index)
+
+    reprocess_parser = commands.add_parser('reprocess-tracks',
+                                           help='Refaz a filtragem das trilhas salvas e recalcula distância, pace e parciais')
+    reprocess_parser.add_argument('--chunk-size', type=int, default=200, help='Treinos por bloco/transação')
+    reprocess_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Processos do pool')
+    reprocess_parser.add_argument('--restart', action='store_true', help='Ignora o checkpoint e começa do início')
+    for name, default in FilterSettings._field_defaults.items():
+        reprocess_parser.add_argument('--' + name.replace('_', '-'), type=float, default=default)
+    reprocess_parser.set_defaults(handler=reprocess_tracks)
+
+    heatmap_parser = commands.add_parser('render-heatmaps', help='Gera os tiles do mapa de calor no cache em disco')
+    heatmap_parser.add_argument('--user-id', help='Só os tiles deste usuário')
+    heatmap_parser.add_argument('--rebuild', action='store_true',
+                                help='Recalcula as contagens a partir das trilhas salvas antes de gerar os tiles')
+    heatmap_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Processos do pool')
+    heatmap_parser.add_argument('--chunk-size', type=int, default=200, help='Trilhas ou tiles por bloco')
+    heatmap_parser.set_defaults(handler=render_heatmaps)
+
+    import_parser = commands.add_parser('import-tracks', help='Importa treinos de arquivos GPX/TCX')
+    import_parser.add_argument('paths', nargs='+', help='Arquivos ou pastas com .gpx, .tcx (ou .gz)')
+    import_parser.add_argument('--user-id', required=True, help='Usuário dono dos treinos')
+    import_parser.add_argument('--type', default=IMPORT_TRAINING_TYPE, help='Tipo dos treinos importados')
+    import_parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help='Treinos por transação')
+    import_parser.set_defaults(handler=import_tracks)
+
+    args = parser.parse_args()
+    # O pool já usa o banco de DATABASE; os comandos não sobem as threads do servidor
+    training_manager.init_database()
+    sys.exit(args.handler(args))
+
+
+if __name__ == '__main__':
+    main()
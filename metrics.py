@@ -0,0 +1,271 @@
+"""
+Métricas de desempenho em memória, expostas no formato texto do Prometheus
+
+Contadores e histogramas pensados para o caminho quente da ingestão: cada
+combinação de labels vira uma série própria, obtida uma vez com labels() e
+guardada pelo chamador; observar um valor é uma busca binária nos limites dos
+buckets e duas somas. As séries não usam lock: sob o GIL, uma troca de thread
+no meio de uma soma pode, raramente, perder uma contagem, o que é aceitável
+para métricas e evita dobrar o custo de cada observação. Gauges são funções
+chamadas só na hora da coleta (/metrics).
+
+Histogramas criados com slow_log=True registram no log (logging) os eventos
+que passam de SLOW_EVENT_THRESHOLD segundos.
+"""
+
+import logging
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional, Sequence, Tuple
+
+import native
+
+# Limites (s) dos buckets padrão: de 10 µs a 10 s
+DEFAULT_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Eventos mais lentos que isso (s) vão para o log; None desativa
+SLOW_EVENT_THRESHOLD = 0.25
+
+logger = logging.getLogger(__name__)
+
+Sample = Tuple[str, Tuple[Tuple[str, str], ...], float]
+
+
+class _Metric:
+    """Base das métricas com labels: uma série por combinação de valores"""
+
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        # Séries são criadas também nas threads do sistema do pool de offload
+        self._lock = native.lock()
+
+    @property
+    def exposed_name(self) -> str:
+        """Nome usado em # HELP e # TYPE"""
+        return self.name
+
+    def labels(self, *labelvalues: str):
+        """Série dos valores de label dados, criada no primeiro uso"""
+        series = self._series.get(labelvalues)
+        if series is None:
+            if len(labelvalues) != len(self.labelnames):
+                raise ValueError(f'{self.name} expects labels {self.labelnames}, got {labelvalues}')
+            with self._lock:
+                series = self._series.get(labelvalues)
+                if series is None:
+                    series = self._series[labelvalues] = self._new_series(labelvalues)
+        return series
+
+    def _new_series(self, labelvalues: Tuple[str, ...]):
+        raise NotImplementedError
+
+    def samples(self) -> Iterator[Sample]:
+        with self._lock:
+            items = list(self._series.items())
+        for labelvalues, series in items:
+            yield from series.samples(tuple(zip(self.labelnames, labelvalues)))
+
+
+class _CounterSeries:
+    __slots__ = ('name', 'value')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def samples(self, labels) -> Iterator[Sample]:
+        yield self.name + '_total', labels, self.value
+
+
+class Counter(_Metric):
+    """Contador monotônico, opcionalmente com labels"""
+
+    kind = 'counter'
+
+    @property
+    def exposed_name(self) -> str:
+        """Com o sufixo _total, igual ao das amostras"""
+        return self.name + '_total'
+
+    def inc(self, amount: float = 1, *labelvalues: str):
+        self.labels(*labelvalues).inc(amount)
+
+    def value(self, *labelvalues: str) -> float:
+        series = self._series.get(labelvalues)
+        return series.value if series else 0
+
+    def _new_series(self, labelvalues: Tuple[str, ...]) -> _CounterSeries:
+        return _CounterSeries(self.name)
+
+
+class _HistogramSeries:
+    __slots__ = ('histogram', 'labelvalues', 'buckets', 'counts', 'sum')
+
+    def __init__(self, histogram: 'Histogram', labelvalues: Tuple[str, ...]):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+        self.buckets = histogram.buckets
+        # Contagem por bucket, com o +Inf no fim
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        if self.histogram.slow_log and SLOW_EVENT_THRESHOLD is not None and value >= SLOW_EVENT_THRESHOLD:
+            self.histogram.log_slow(value, self.labelvalues)
+
+    @contextmanager
+    def time(self):
+        """Mede o bloco (ou a função decorada) com time.perf_counter"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def samples(self, labels) -> Iterator[Sample]:
+        name = self.histogram.name
+        counts = list(self.counts)
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+            cumulative += bucket_count
+            yield name + '_bucket', labels + (('le', _format_value(bound)),), cumulative
+        yield name + '_sum', labels, self.sum
+        yield name + '_count', labels, cumulative
+
+
+class Histogram(_Metric):
+    """Histograma cumulativo no estilo Prometheus, opcionalmente com labels"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, slow_log: bool = False):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.slow_log = slow_log
+
+    def observe(self, value: float, *labelvalues: str):
+        self.labels(*labelvalues).observe(value)
+
+    def time(self, *labelvalues: str):
+        """Mede o bloco (ou a função decorada) com time.perf_counter"""
+        return self.labels(*labelvalues).time()
+
+    def count(self, *labelvalues: str) -> int:
+        series = self._series.get(labelvalues)
+        return series.count if series else 0
+
+    def log_slow(self, value: float, labelvalues: Tuple[str, ...]):
+        logger.warning('Evento lento: %s%s levou %.1f ms', self.name,
+                       _format_labels(tuple(zip(self.labelnames, labelvalues))), value * 1000)
+
+    def _new_series(self, labelvalues: Tuple[str, ...]) -> _HistogramSeries:
+        return _HistogramSeries(self, labelvalues)
+
+
+class Gauge:
+    """Valor calculado na hora da coleta; a função retorna um número, {labels: número} ou None"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, function: Callable, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+        self.labelnames = tuple(labelnames)
+
+    @property
+    def exposed_name(self) -> str:
+        return self.name
+
+    def samples(self) -> Iterator[Sample]:
+        value = self.function()
+        if value is None:
+            return
+        if not isinstance(value, dict):
+            value = {(): value}
+        for labelvalues, sample in value.items():
+            yield self.name, tuple(zip(self.labelnames, labelvalues)), sample
+
+
+class Registry:
+    """Conjunto de métricas exportadas juntas"""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS, slow_log: bool = False) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets, slow_log))
+
+    def gauge(self, name: str, documentation: str, function: Callable, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, function, labelnames))
+
+    def render(self) -> str:
+        """Todas as métricas no formato texto do Prometheus (versão 0.0.4)"""
+        with self._lock:
+            registered = list(self._metrics)
+        lines = []
+        for metric in registered:
+            lines.append(f'# HELP {metric.exposed_name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.exposed_name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+# Registro padrão, exportado em /metrics
+REGISTRY = Registry()
+
+
+def configure(slow_event_threshold: Optional[float] = SLOW_EVENT_THRESHOLD):
+    """Ajusta o limite (s) do log de eventos lentos; None desativa"""
+    global SLOW_EVENT_THRESHOLD
+    SLOW_EVENT_THRESHOLD = slow_event_threshold
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
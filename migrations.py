@@ -0,0 +1,83 @@
+"""
+Migrações do esquema do banco, controladas por PRAGMA user_version
+
+As tabelas base continuam sendo criadas com CREATE TABLE IF NOT EXISTS em
+TrainingManager.init_database (versão 0). Cada mudança posterior entra no fim
+de MIGRATIONS e é aplicada uma única vez, na ordem, dentro da transação de
+init_database.
+"""
+
+from typing import List, NamedTuple, Tuple
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    statements: Tuple[str, ...]
+
+
+MIGRATIONS = (
+    Migration(1, 'Índices compostos para consultas por usuário', (
+        # Índice de cobertura: listagem e estatísticas por usuário leem só o índice,
+        # sem passar pelas páginas de overflow de gps_data (gravado antes de created_at)
+        '''CREATE INDEX IF NOT EXISTS idx_trainings_user_created
+           ON trainings (user_id, created_at, id, type, distance, duration, pace)''',
+        '''CREATE INDEX IF NOT EXISTS idx_achievements_user_unlocked
+           ON achievements (user_id, unlocked_at)''',
+    )),
+    Migration(2, 'Tempo em movimento, parciais e voltas dos treinos', (
+        'ALTER TABLE trainings ADD COLUMN moving_time INTEGER',
+        '''CREATE TABLE IF NOT EXISTS training_splits (
+               training_id TEXT NOT NULL,
+               kind TEXT NOT NULL,
+               number INTEGER NOT NULL,
+               distance REAL NOT NULL,
+               duration REAL NOT NULL,
+               elapsed REAL NOT NULL,
+               pace REAL NOT NULL,
+               PRIMARY KEY (training_id, kind, number)
+           ) WITHOUT ROWID''',
+    )),
+    Migration(3, 'Totais por usuário e período (ver rollups.py)', (
+        # Treinos já salvos entram com python manage.py rebuild-rollups
+        '''CREATE TABLE IF NOT EXISTS training_rollups (
+               user_id TEXT NOT NULL,
+               period TEXT NOT NULL,
+               period_start TEXT NOT NULL,
+               trainings INTEGER NOT NULL,
+               distance REAL NOT NULL,
+               duration INTEGER NOT NULL,
+               best_pace REAL,
+               PRIMARY KEY (user_id, period, period_start)
+           ) WITHOUT ROWID''',
+    )),
+    Migration(4, 'Contagens do mapa de calor por tile (ver heatmap.py)', (
+        # Treinos já salvos entram com python manage.py render-heatmaps --rebuild
+        '''CREATE TABLE IF NOT EXISTS heatmap_tiles (
+               user_id TEXT NOT NULL,
+               z INTEGER NOT NULL,
+               x INTEGER NOT NULL,
+               y INTEGER NOT NULL,
+               counts BLOB NOT NULL,
+               PRIMARY KEY (user_id, z, x, y)
+           ) WITHOUT ROWID''',
+    )),
+)
+
+
+def schema_version(conn) -> int:
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn) -> List[Migration]:
+    """Aplica as migrações pendentes e retorna as que foram aplicadas"""
+    current = schema_version(conn)
+    applied = []
+    for migration in MIGRATIONS:
+        if migration.version <= current:
+            continue
+        for statement in migration.statements:
+            conn.execute(statement)
+        conn.execute(f'PRAGMA user_version = {migration.version:d}')
+        applied.append(migration)
+    return applied
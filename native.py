@@ -0,0 +1,37 @@
+"""
+Travas e thread-locals do sistema, mesmo com o monkey patching do eventlet/gevent
+
+Com o monkey patching, threading.Lock vira uma trava de green thread e
+threading.local passa a separar os dados por green thread. Estruturas usadas
+também pelas threads do sistema do pool de offload (ConnectionPool, séries
+das métricas) precisam das versões originais: uma trava verde tomada fora da
+thread do hub tenta ceder a vez a um hub que não é o daquela thread, e um
+local por green thread abre uma conexão nova a cada requisição.
+
+Os originais são buscados na hora da chamada, então objetos criados depois
+do monkey patching (feito pelo run.py antes de importar o app) também ficam
+com as versões do sistema. Sem monkey patching, valem as do threading.
+"""
+
+import sys
+import threading
+
+
+def lock():
+    """Trava do sistema (threading.Lock original)"""
+    return _original('Lock')()
+
+
+def local():
+    """Dados por thread do sistema (threading.local original)"""
+    return _original('local')()
+
+
+def _original(name: str):
+    patcher = sys.modules.get('eventlet.patcher')
+    if patcher is not None and patcher.is_monkey_patched('thread'):
+        return getattr(patcher.original('threading'), name)
+    monkey = sys.modules.get('gevent.monkey')
+    if monkey is not None and monkey.is_module_patched('threading'):
+        return monkey.get_original('threading', name)
+    return getattr(threading, name)
@@ -0,0 +1,92 @@
+"""
+Trabalho bloqueante (SQLite, CPU) fora do loop de eventos no modo de produção
+
+Com eventlet ou gevent todas as green threads dividem uma única thread do
+sistema: enquanto uma consulta ao SQLite ou a codificação de uma trilha roda,
+nenhum socket é atendido e as posições GPS das outras sessões esperam. run()
+executa a função em um pool limitado de threads do sistema e suspende só a
+green thread que chamou. No modo threading (servidor de desenvolvimento) cada
+requisição já tem sua thread, então a função roda direto, sem custo extra.
+
+Funções marcadas com @blocking sempre passam por run(). Chamadas feitas de
+dentro do pool rodam direto, então uma função bloqueante pode chamar outra
+sem esperar por uma segunda thread livre.
+
+As funções não herdam o contexto da requisição (flask.request, session):
+recebem tudo por argumento. Como rodam em threads do sistema, também não
+devem esperar em travas e filas criadas com monkey patching (as do
+PersistenceWorker, do StatsCache): efeitos colaterais nessas estruturas ficam
+com quem chamou, depois que run() retorna.
+"""
+
+import functools
+import time
+from typing import Callable
+
+import metrics
+import native
+
+ASYNC_MODES = ('threading', 'eventlet', 'gevent', 'gevent_uwsgi')
+
+OFFLOAD_WAIT_SECONDS = metrics.REGISTRY.histogram(
+    'offload_wait_seconds', 'Espera por uma thread livre do pool de trabalho bloqueante')
+OFFLOAD_SECONDS = metrics.REGISTRY.histogram(
+    'offload_seconds', 'Duração das tarefas do pool de trabalho bloqueante', ('task',))
+
+# Executor do pool: (função, *args, **kwargs) -> resultado; None roda na própria thread
+_execute = None
+# Marca as threads do pool (do sistema, mesmo com monkey patching)
+_local = native.local()
+
+
+def configure(async_mode: str = 'threading', pool_size: int = 10):
+    """Escolhe o pool de acordo com o async_mode do Socket.IO
+
+    Com eventlet o tamanho do pool só vale se for configurado antes da
+    primeira tarefa (o tpool cria as threads uma vez).
+    """
+    global _execute
+    if async_mode not in ASYNC_MODES:
+        raise ValueError(f'Invalid async mode: {async_mode}')
+    if pool_size < 1:
+        raise ValueError(f'Invalid offload pool size: {pool_size}')
+
+    if async_mode == 'eventlet':
+        from eventlet import tpool
+        tpool.set_num_threads(pool_size)
+        _execute = tpool.execute
+    elif async_mode.startswith('gevent'):
+        import gevent
+        threadpool = gevent.get_hub().threadpool
+        threadpool.maxsize = pool_size
+
+        def _execute(fn, *args, **kwargs):
+            return threadpool.apply(fn, args, kwargs)
+    else:
+        _execute = None
+
+
+def run(fn: Callable, *args, **kwargs):
+    """Executa fn(*args, **kwargs) no pool e retorna o resultado (ou relança a exceção)"""
+    if _execute is None or getattr(_local, 'inside', False):
+        return fn(*args, **kwargs)
+    return _execute(_call, time.perf_counter(), fn, args, kwargs)
+
+
+def blocking(fn: Callable) -> Callable:
+    """Decorador: toda chamada da função passa por run()"""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return run(fn, *args, **kwargs)
+    return wrapper
+
+
+def _call(submitted: float, fn: Callable, args: tuple, kwargs: dict):
+    started = time.perf_counter()
+    OFFLOAD_WAIT_SECONDS.observe(started - submitted)
+    _local.inside = True
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _local.inside = False
+        OFFLOAD_SECONDS.observe(time.perf_counter() - started, fn.__qualname__)
@@ -0,0 +1,126 @@
+"""
+Persistência assíncrona (write-behind) dos treinos concluídos
+"""
+
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+PENDING = 'pending'
+FAILED = 'failed'
+
+_STOP = object()
+
+logger = logging.getLogger(__name__)
+
+
+class PersistenceWorker:
+    """Grava treinos concluídos em segundo plano, em transações agrupadas
+
+    stop_training só enfileira o treino e responde na hora; a thread do worker
+    junta os treinos que chegam em sequência (até batch_size, esperando no
+    máximo max_delay segundos) e chama persist_batch uma vez para o grupo.
+    """
+
+    def __init__(self, persist_batch: Callable[[List[Dict]], None], batch_size: int = 32,
+                 max_delay: float = 0.05, max_failed: int = 100):
+        self.persist_batch = persist_batch
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.max_failed = max_failed
+        self._queue = queue.Queue()
+        self._pending = {}
+        self._failed = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.persisted = 0
+        self.batches = 0
+
+    def start(self):
+        """Inicia a thread de gravação"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='persistence-worker', daemon=True)
+            self._thread.start()
+
+    def submit(self, job: Dict) -> str:
+        """Enfileira um treino para gravação e retorna seu training_id"""
+        training_id = job['training_id']
+        with self._lock:
+            self._pending[training_id] = job
+        self._queue.put(job)
+        return training_id
+
+    def status(self, training_id: str) -> Optional[str]:
+        """PENDING, FAILED ou None se o treino não está no worker (já gravado ou desconhecido)"""
+        with self._lock:
+            if training_id in self._pending:
+                return PENDING
+            if training_id in self._failed:
+                return FAILED
+        return None
+
+    def pending_count(self) -> int:
+        """Quantidade de treinos ainda não gravados"""
+        with self._lock:
+            return len(self._pending)
+
+    def stop(self, timeout: Optional[float] = None):
+        """Grava todos os treinos da fila e encerra a thread"""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            job = self._queue.get()
+            if job is _STOP:
+                break
+
+            batch = [job]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.batch_size:
+                try:
+                    job = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if job is _STOP:
+                    # Grava o que já foi retirado da fila antes de encerrar
+                    stopping = True
+                    break
+                batch.append(job)
+
+            self._persist(batch)
+
+    def _persist(self, batch: List[Dict]):
+        try:
+            self.persist_batch(batch)
+            succeeded = batch
+        except Exception:
+            # Um treino inválido não pode derrubar o lote inteiro: grava um a um
+            succeeded = []
+            for job in batch:
+                try:
+                    self.persist_batch([job])
+                    succeeded.append(job)
+                except Exception:
+                    logger.exception('Falha ao gravar o treino %s', job['training_id'])
+                    self._mark_failed(job)
+
+        with self._lock:
+            for job in succeeded:
+                self._pending.pop(job['training_id'], None)
+            self.persisted += len(succeeded)
+            self.batches += 1
+
+    def _mark_failed(self, job: Dict):
+        with self._lock:
+            self._pending.pop(job['training_id'], None)
+            self._failed[job['training_id']] = job
+            while len(self._failed) > self.max_failed:
+                self._failed.popitem(last=False)
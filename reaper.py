@@ -0,0 +1,130 @@
+"""
+Limpeza das sessões abandonadas e orçamento de memória dos trackers
+
+Uma sessão cujo cliente nunca chama /api/training/stop (app fechado, bateria
+acabou) ficaria em active_sessions para sempre. O SessionReaper roda em uma
+thread e, a cada interval segundos:
+
+- retira do session store as sessões sem atividade há mais de idle_ttl
+  segundos e as entrega a reap, que grava o treino ou descarta a sessão;
+- se a memória das trilhas em memória (GPSTracker.nbytes) passa de
+  memory_budget bytes, entrega os maiores trackers a shrink, que os passa
+  para o disco ou os simplifica, até a soma voltar a low_watermark do
+  orçamento.
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SESSIONS_EVICTED = metrics.REGISTRY.counter(
+    'sessions_evicted', 'Sessões abandonadas retiradas pelo reaper, por destino', ('action',))
+SESSIONS_SHRUNK = metrics.REGISTRY.counter(
+    'sessions_shrunk', 'Trackers reduzidos pelo orçamento de memória, por método', ('method',))
+SHRUNK_BYTES = metrics.REGISTRY.counter('sessions_shrunk_bytes', 'Memória liberada pelo orçamento de memória')
+
+
+class SessionReaper:
+    """Finaliza sessões ociosas e mantém a memória dos trackers dentro do orçamento
+
+    reap(sessão, última_atividade) retorna o destino da sessão ('persisted' ou
+    'discarded'); shrink(session_id, sessão) é chamado com a sessão travada
+    para alteração e retorna o método usado ('spilled', 'downsampled') ou None
+    se o tracker não pode ser reduzido.
+    """
+
+    def __init__(self, store, reap: Callable[[Dict, float], str],
+                 shrink: Callable[[str, Dict], Optional[str]], idle_ttl: float = 1800,
+                 interval: float = 60, memory_budget: Optional[int] = None, low_watermark: float = 0.8):
+        self.store = store
+        self.reap = reap
+        self.shrink = shrink
+        self.idle_ttl = idle_ttl
+        self.interval = interval
+        self.memory_budget = memory_budget
+        self.low_watermark = low_watermark
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.idle_ttl or self.memory_budget)
+
+    def start(self):
+        """Inicia a thread do reaper, se houver algo a fazer"""
+        if self.enabled and (self._thread is None or not self._thread.is_alive()):
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='session-reaper', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def run_once(self, now: Optional[float] = None) -> Dict:
+        """Uma passada: sessões ociosas e depois o orçamento de memória"""
+        return {
+            'evicted': self.evict_idle(now if now is not None else time.time()) if self.idle_ttl else 0,
+            'shrunk': self.enforce_budget() if self.memory_budget else 0
+        }
+
+    def evict_idle(self, now: float) -> int:
+        cutoff = now - self.idle_ttl
+        evicted = 0
+        for session_id in self.store.idle_sessions(cutoff):
+            # Confere de novo ao retirar: a sessão pode ter recebido posições ou sido finalizada
+            idle = self.store.pop_idle(session_id, cutoff)
+            if idle is None:
+                continue
+            training_session, last_activity = idle
+            try:
+                action = self.reap(training_session, last_activity)
+            except Exception:
+                logger.exception('Falha ao finalizar a sessão abandonada %s', session_id)
+                action = 'failed'
+            SESSIONS_EVICTED.inc(1, action)
+            evicted += 1
+        return evicted
+
+    def enforce_budget(self) -> int:
+        sizes = sorted(((training_session['gps_tracker'].nbytes, session_id)
+                        for session_id, training_session in self.store.items()), reverse=True)
+        total = sum(size for size, _ in sizes)
+        if total <= self.memory_budget:
+            return 0
+
+        target = self.memory_budget * self.low_watermark
+        shrunk = 0
+        for size, session_id in sizes:
+            if total <= target:
+                break
+            with self.store.edit(session_id, touch=False) as training_session:
+                if training_session is None:
+                    continue
+                method = self.shrink(session_id, training_session)
+                freed = size - training_session['gps_tracker'].nbytes
+            if method is None:
+                continue
+            total -= freed
+            shrunk += 1
+            SESSIONS_SHRUNK.inc(1, method)
+            SHRUNK_BYTES.inc(freed)
+        if total > target:
+            logger.warning('Orçamento de memória excedido: %d bytes nas trilhas (orçamento %d)',
+                           total, self.memory_budget)
+        return shrunk
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception('Falha na passada do reaper de sessões')
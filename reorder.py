@@ -0,0 +1,138 @@
+"""
+Buffer de reordenação das posições GPS pelo número de sequência do cliente
+
+Com a rede instável, posições chegam atrasadas, fora de ordem ou repetidas
+(o cliente reenvia o que não foi confirmado, ou manda de uma vez o que
+acumulou num túnel). O cliente numera as posições de cada sessão (seq 0, 1,
+2...) e o ReorderBuffer as entrega em ordem de seq, sem repetições, antes dos
+filtros do GPSTracker, que dependem da posição anterior.
+
+A posição com a seq esperada sai na hora, junto com as seguintes que já
+estavam no buffer. Uma lacuna segura as posições seguintes até ser
+preenchida, ou até o buffer passar de capacity posições ou de max_delay
+segundos (pelos timestamps do cliente) entre a posição mais antiga e a mais
+recente seguradas; aí a lacuna é dada como perdida. Uma posição que chega
+depois de sua lacuna ter sido pulada é descartada como atrasada, pois os
+filtros e o Kalman já passaram dela.
+
+Posições com seq que não é um inteiro não negativo são descartadas como
+inválidas antes de entrar no buffer.
+
+Reconhecer uma repetida custa uma comparação com a próxima seq esperada ou
+uma busca no dicionário das posições seguradas.
+"""
+
+from collections import deque
+from typing import Deque, Dict, List, Tuple
+
+# Lacunas puladas lembradas para separar atrasadas de repetidas
+SKIPPED_HISTORY = 32
+
+
+class ReorderBuffer:
+    """Entrega posições numeradas em ordem de seq, descartando repetidas e atrasadas"""
+
+    def __init__(self, capacity: int = 64, max_delay: float = 10.0):
+        self.capacity = capacity
+        self.max_delay = max_delay
+        self.next_seq = 0
+        self.duplicates = 0
+        self.late = 0
+        self.invalid = 0
+        self._held: Dict[int, Dict] = {}
+        # Intervalos [início, fim) de seqs pulados
+        self._skipped: Deque[Tuple[int, int]] = deque(maxlen=SKIPPED_HISTORY)
+
+    def __len__(self) -> int:
+        return len(self._held)
+
+    def push(self, fixes: List[Dict]) -> Tuple[List[Dict], int, int, int]:
+        """Acrescenta posições com 'seq' e 'timestamp'
+
+        Retorna as posições prontas, em ordem, e quantas foram descartadas
+        como repetidas, como atrasadas e por seq inválido.
+        """
+        duplicates = late = invalid = 0
+        for fix in fixes:
+            seq = fix['seq']
+            if not _valid_seq(seq):
+                invalid += 1
+            elif seq < self.next_seq:
+                if self._was_skipped(seq):
+                    late += 1
+                else:
+                    duplicates += 1
+            elif seq in self._held:
+                duplicates += 1
+            else:
+                self._held[seq] = fix
+
+        self.duplicates += duplicates
+        self.late += late
+        self.invalid += invalid
+        return self._release(), duplicates, late, invalid
+
+    def flush(self) -> List[Dict]:
+        """Entrega todas as posições seguradas, pulando as lacunas (fim da sessão)"""
+        ready = []
+        while self._held:
+            self._skip_gap()
+            ready.extend(self._release_contiguous())
+        return ready
+
+    def to_state(self) -> Dict:
+        return {
+            'capacity': self.capacity,
+            'max_delay': self.max_delay,
+            'next_seq': self.next_seq,
+            'duplicates': self.duplicates,
+            'late': self.late,
+            'invalid': self.invalid,
+            'held': list(self._held.values()),
+            'skipped': list(self._skipped)
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict) -> 'ReorderBuffer':
+        buffer = cls(state['capacity'], state['max_delay'])
+        buffer.next_seq = state['next_seq']
+        buffer.duplicates = state['duplicates']
+        buffer.late = state['late']
+        buffer.invalid = state.get('invalid', 0)
+        buffer._held = {fix['seq']: fix for fix in state['held']}
+        buffer._skipped.extend(tuple(interval) for interval in state['skipped'])
+        return buffer
+
+    def _release(self) -> List[Dict]:
+        ready = self._release_contiguous()
+        while self._held and self._gap_expired():
+            self._skip_gap()
+            ready.extend(self._release_contiguous())
+        return ready
+
+    def _release_contiguous(self) -> List[Dict]:
+        ready = []
+        held = self._held
+        while self.next_seq in held:
+            ready.append(held.pop(self.next_seq))
+            self.next_seq += 1
+        return ready
+
+    def _gap_expired(self) -> bool:
+        if len(self._held) > self.capacity:
+            return True
+        timestamps = [fix['timestamp'] for fix in self._held.values()]
+        return max(timestamps) - min(timestamps) > self.max_delay
+
+    def _skip_gap(self):
+        first = min(self._held)
+        self._skipped.append((self.next_seq, first))
+        self.next_seq = first
+
+    def _was_skipped(self, seq: int) -> bool:
+        return any(start <= seq < end for start, end in self._skipped)
+
+
+def _valid_seq(seq) -> bool:
+    """seq precisa ser um inteiro não negativo (bool não conta, mesmo sendo int)"""
+    return isinstance(seq, int) and not isinstance(seq, bool) and seq >= 0
@@ -0,0 +1,171 @@
+"""
+Reprocessamento em lote das trilhas salvas com novos parâmetros de filtro
+
+Lê os treinos em blocos por rowid, refaz a filtragem de cada trilha com
+GPSTracker.add_positions (NumPy) em um pool de processos e grava distância,
+pace, tempo em movimento e parciais por km recalculados em uma transação por
+bloco (as voltas marcadas pelo corredor não mudam). O checkpoint é gravado na mesma
+transação, então uma execução interrompida continua de onde parou sem
+reprocessar nem pular treinos.
+
+As trilhas salvas guardam só as posições já aceitas (e suavizadas) na época
+do treino: filtros mais rígidos descartam posições, mas as que foram
+descartadas antes não voltam.
+
+Ao terminar, os agregados das conquistas e os totais por período
+(training_rollups), que dependem da distância e do pace, são recalculados
+na mesma transação que apaga o checkpoint. A trilha gravada (gps_data) não
+muda, então os níveis de detalhe, o índice espacial e os tiles do mapa de
+calor, derivados só dela, continuam valendo. O cache de estatísticas dos
+servidores em execução fica em outro processo e só mostra os números novos
+quando as entradas expiram (STATS_CACHE_TTL) ou o servidor reinicia.
+"""
+
+import itertools
+import json
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import achievements
+import rollups
+from app import FilterSettings, GPSTracker
+from database import ConnectionPool
+from track_codec import iter_track
+
+CHECKPOINT_NAME = 'reprocess-tracks'
+
+# Posições entregues a add_positions por vez
+POSITIONS_PER_BATCH = 1024
+
+_worker_settings = None
+
+
+def create_tables(cursor):
+    """Tabela de checkpoints dos comandos de manutenção"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS maintenance_checkpoints (
+            name TEXT PRIMARY KEY,
+            last_rowid INTEGER NOT NULL,
+            processed INTEGER NOT NULL,
+            params TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    ''')
+
+
+def reprocess_track(gps_data, duration: int, settings: FilterSettings) -> Tuple[float, float, int, List[Dict]]:
+    """Refaz a filtragem de uma trilha e retorna (distância, pace, tempo em movimento, parciais)"""
+    tracker = GPSTracker(raw_buffer_size=0, settings=settings)
+    positions = iter_track(gps_data)
+    while True:
+        batch = list(itertools.islice(positions, POSITIONS_PER_BATCH))
+        if not batch:
+            break
+        tracker.add_positions(batch)
+
+    distance = tracker.total_distance
+    pace = (duration / 60) / distance if distance > 0 else 0
+    live = tracker.live.summary()
+    return distance, pace, live['moving_time'], live['splits']
+
+
+def reprocess_rows(rows: List[Tuple], settings: Optional[FilterSettings] = None) -> List[Tuple]:
+    """Reprocessa um bloco de (rowid, id, gps_data, duration)
+
+    Retorna (distance, pace, moving_time, rowid, id, parciais) de cada treino.
+    """
+    settings = settings or _worker_settings
+    results = []
+    for rowid, training_id, gps_data, duration in rows:
+        distance, pace, moving_time, splits = reprocess_track(gps_data, duration, settings)
+        results.append((distance, pace, moving_time, rowid, training_id, splits))
+    return results
+
+
+def run(db: ConnectionPool, settings: FilterSettings, chunk_size: int = 200, workers: int = 1,
+        restart: bool = False, progress: Callable[[int], None] = None) -> Dict:
+    """Reprocessa todos os treinos, continuando do checkpoint se houver um, e recalcula os agregados
+
+    Com workers > 1 os blocos são distribuídos em um pool de processos; os
+    resultados são gravados na ordem dos blocos para o checkpoint avançar de
+    forma contínua. Levanta ValueError se o checkpoint existente foi criado
+    com outros parâmetros (use restart=True para descartá-lo).
+    """
+    params = json.dumps(settings._asdict(), sort_keys=True)
+    with db.transaction(immediate=True) as conn:
+        create_tables(conn.cursor())
+        if restart:
+            conn.execute('DELETE FROM maintenance_checkpoints WHERE name = ?', (CHECKPOINT_NAME,))
+        checkpoint = conn.execute(
+            'SELECT last_rowid, processed, params FROM maintenance_checkpoints WHERE name = ?',
+            (CHECKPOINT_NAME,)
+        ).fetchone()
+
+    if checkpoint and checkpoint[2] != params:
+        raise ValueError('Existing checkpoint was created with different filter settings')
+    last_rowid, processed = checkpoint[:2] if checkpoint else (0, 0)
+    resumed_from = processed
+
+    conn = db.connection()
+
+    def read_chunks():
+        nonlocal last_rowid
+        while True:
+            rows = conn.execute('''
+                SELECT rowid, id, gps_data, duration FROM trainings
+                WHERE rowid > ? ORDER BY rowid LIMIT ?
+            ''', (last_rowid, chunk_size)).fetchall()
+            if not rows:
+                return
+            last_rowid = rows[-1][0]
+            yield rows
+
+    def commit(results: List[Tuple]):
+        nonlocal processed
+        processed += len(results)
+        with db.transaction(immediate=True):
+            conn.executemany('UPDATE trainings SET distance = ?, pace = ?, moving_time = ? WHERE rowid = ?',
+                             [result[:4] for result in results])
+            conn.executemany("DELETE FROM training_splits WHERE training_id = ? AND kind = 'split'",
+                             [(result[4],) for result in results])
+            conn.executemany('''
+                INSERT INTO training_splits (training_id, kind, number, distance, duration, elapsed, pace)
+                VALUES (?, 'split', ?, ?, ?, ?, ?)
+            ''', [(training_id, split['number'], split['distance'], split['duration'], split['elapsed'], split['pace'])
+                  for *_, training_id, splits in results for split in splits])
+            conn.execute('''
+                INSERT OR REPLACE INTO maintenance_checkpoints (name, last_rowid, processed, params, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (CHECKPOINT_NAME, results[-1][3], processed, params, time.time()))
+        if progress:
+            progress(processed)
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(settings,)) as pool:
+            # Poucos blocos em andamento por vez, para não carregar a tabela inteira na memória
+            in_flight = deque()
+            for rows in read_chunks():
+                in_flight.append(pool.submit(reprocess_rows, rows))
+                if len(in_flight) >= workers * 2:
+                    commit(in_flight.popleft().result())
+            while in_flight:
+                commit(in_flight.popleft().result())
+    else:
+        for rows in read_chunks():
+            commit(reprocess_rows(rows, settings))
+
+    # As distâncias mudaram: os agregados das conquistas e os totais por período precisam acompanhar.
+    # Uma execução interrompida aqui volta sem blocos pendentes e refaz só este passo
+    with db.transaction(immediate=True):
+        unlocked = achievements.backfill(conn)
+        rollups.rebuild(conn)
+        conn.execute('DELETE FROM maintenance_checkpoints WHERE name = ?', (CHECKPOINT_NAME,))
+
+    return {'processed': processed, 'resumed_from': resumed_from, 'unlocked': unlocked}
+
+
+def _init_worker(settings: FilterSettings):
+    global _worker_settings
+    _worker_settings = settings
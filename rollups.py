@@ -0,0 +1,115 @@
+"""
+Totais por usuário e período (dia, semana, mês) para as tendências de longo prazo
+
+A tabela training_rollups guarda, para cada usuário e início de período,
+distância, duração, quantidade de treinos e melhor pace. record_trainings
+soma os treinos recém-inseridos na mesma transação do INSERT, então um
+gráfico de um ano de volume semanal lê 52 linhas em vez de varrer trainings.
+
+Os períodos seguem o created_at dos treinos (UTC); as semanas começam na
+segunda-feira. O início de cada período é calculado pelo SQLite com as mesmas
+expressões na gravação incremental e em rebuild.
+"""
+
+import sqlite3
+from datetime import date, timedelta
+from typing import Dict, Iterator, List
+
+# Início do período de cada treino (YYYY-MM-DD)
+PERIODS = {
+    'day': "date(created_at)",
+    'week': "date(created_at, 'weekday 0', '-6 days')",
+    'month': "date(created_at, 'start of month')",
+}
+
+ROLLUP_COLUMNS = ('trainings', 'distance', 'duration', 'best_pace')
+
+# Soma as linhas novas às existentes; treinos sem distância têm pace 0 e não contam para o melhor pace
+_UPSERT = '''
+    INSERT INTO training_rollups (user_id, period, period_start, trainings, distance, duration, best_pace)
+    SELECT user_id, '{period}', {start}, COUNT(*), SUM(distance), SUM(duration),
+           MIN(CASE WHEN pace > 0 THEN pace END)
+    FROM trainings WHERE {where}
+    GROUP BY user_id, {start}
+    ON CONFLICT (user_id, period, period_start) DO UPDATE SET
+        trainings = trainings + excluded.trainings,
+        distance = distance + excluded.distance,
+        duration = duration + excluded.duration,
+        best_pace = MIN(COALESCE(best_pace, excluded.best_pace), COALESCE(excluded.best_pace, best_pace))
+'''
+
+# Abaixo do limite de parâmetros por consulta do SQLite
+MAX_IDS_PER_STATEMENT = 500
+
+
+def record_trainings(conn: sqlite3.Connection, training_ids: List[str]):
+    """Soma treinos já inseridos aos totais de seus períodos (chamar na mesma transação do INSERT)"""
+    for start in range(0, len(training_ids), MAX_IDS_PER_STATEMENT):
+        chunk = training_ids[start:start + MAX_IDS_PER_STATEMENT]
+        where = f'id IN ({", ".join("?" * len(chunk))})'
+        for period, expression in PERIODS.items():
+            conn.execute(_UPSERT.format(period=period, start=expression, where=where), chunk)
+
+
+def rebuild(conn: sqlite3.Connection) -> int:
+    """Recalcula todos os totais a partir de trainings e retorna quantas linhas foram geradas"""
+    conn.execute('DELETE FROM training_rollups')
+    for period, expression in PERIODS.items():
+        conn.execute(_UPSERT.format(period=period, start=expression, where='1'))
+    return conn.execute('SELECT COUNT(*) FROM training_rollups').fetchone()[0]
+
+
+def period_start(period: str, day: date) -> date:
+    """Início do período que contém o dia"""
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def add_periods(period: str, start: date, count: int) -> date:
+    """Início do período count períodos depois (ou antes, se negativo) do que começa em start"""
+    if period == 'month':
+        month = start.year * 12 + start.month - 1 + count
+        return date(month // 12, month % 12 + 1, 1)
+    return start + timedelta(days=count * (7 if period == 'week' else 1))
+
+
+def count_periods(period: str, since: date, until: date) -> int:
+    """Quantos períodos vão de since a until (inclusive)"""
+    since = period_start(period, since)
+    if period == 'month':
+        return (until.year - since.year) * 12 + until.month - since.month + 1
+    return (until - since).days // (7 if period == 'week' else 1) + 1
+
+
+def iter_periods(period: str, since: date, until: date) -> Iterator[date]:
+    """Inícios dos períodos de since a until (inclusive)"""
+    current = period_start(period, since)
+    while current <= until:
+        yield current
+        current = add_periods(period, current, 1)
+
+
+def get_trends(conn: sqlite3.Connection, user_id: str, period: str, since: date, until: date) -> List[Dict]:
+    """Totais do usuário em cada período de since a until, com zeros nos períodos sem treinos
+
+    Lê só training_rollups (pela chave primária), nunca trainings.
+    """
+    rows = conn.execute(f'''
+        SELECT period_start, {', '.join(ROLLUP_COLUMNS)} FROM training_rollups
+        WHERE user_id = ? AND period = ? AND period_start BETWEEN ? AND ?
+    ''', (user_id, period, period_start(period, since).isoformat(), until.isoformat())).fetchall()
+    totals = {row[0]: dict(zip(ROLLUP_COLUMNS, row[1:])) for row in rows}
+
+    trends = []
+    for start in iter_periods(period, since, until):
+        entry = totals.get(start.isoformat(), {'trainings': 0, 'distance': 0, 'duration': 0, 'best_pace': None})
+        distance = entry['distance']
+        trends.append(dict(
+            entry,
+            period_start=start.isoformat(),
+            avg_pace=(entry['duration'] / 60) / distance if distance > 0 else None
+        ))
+    return trends
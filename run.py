@@ -5,7 +5,52 @@ Script para executar o servidor Python do Treinador de Corrida
 
 import os
 import sys
-from app import app, socketio
+
+# development: servidor do Werkzeug com threads e debug; production: servidor assíncrono
+# (ASYNC_WORKER=eventlet ou gevent) com SQLite e CPU pesada no pool de OFFLOAD_POOL_SIZE threads
+SERVER_MODE = os.environ.get('SERVER_MODE', 'development')
+ASYNC_WORKER = os.environ.get('ASYNC_WORKER', 'eventlet')
+
+def patch_async_worker(worker: str):
+    """Troca sockets, threads e travas da biblioteca padrão pelas versões cooperativas
+    
+    Precisa rodar antes de importar o app (e o Flask, o SQLite, o threading usados por ele).
+    """
+    if worker == 'eventlet':
+        import eventlet
+        eventlet.monkey_patch()
+    elif worker == 'gevent':
+        from gevent import monkey
+        monkey.patch_all()
+    else:
+        raise ValueError(f'Invalid ASYNC_WORKER: {worker}')
+
+if SERVER_MODE == 'production':
+    patch_async_worker(ASYNC_WORKER)
+    os.environ['SOCKETIO_ASYNC_MODE'] = ASYNC_WORKER
+elif SERVER_MODE == 'development':
+    os.environ['SOCKETIO_ASYNC_MODE'] = 'threading'
+else:
+    raise ValueError(f'Invalid SERVER_MODE: {SERVER_MODE}')
+
+from app import app, socketio, training_manager, OFFLOAD_POOL_SIZE
+
+def server_options() -> dict:
+    """Opções do servidor web para o modo escolhido"""
+    if SERVER_MODE == 'development':
+        return {
+            'debug': os.environ.get('DEBUG', 'True').lower() == 'true',
+            'allow_unsafe_werkzeug': True
+        }
+    
+    # Conexões atendidas ao mesmo tempo (green threads do servidor)
+    max_connections = int(os.environ.get('SERVER_MAX_CONNECTIONS', 1000))
+    options = {'debug': False, 'log_output': os.environ.get('ACCESS_LOG', 'False').lower() == 'true'}
+    if ASYNC_WORKER == 'eventlet':
+        options['max_size'] = max_connections
+    else:
+        options['spawn'] = max_connections
+    return options
 
 def main():
     """Função principal para executar o servidor"""
@@ -20,8 +65,18 @@ def main():
     # Configurações do servidor
     host = os.environ.get('HOST', '0.0.0.0')
     port = int(os.environ.get('PORT', 5000))
-    debug = os.environ.get('DEBUG', 'True').lower() == 'true'
+    options = server_options()
+    
+    # Banco de dados (configurado pelas variáveis DATABASE e DB_*), gravação em segundo plano e reaper
+    training_manager.start()
+    
+    # Sessões interrompidas por um reinício voltam a partir dos journals
+    recovered = training_manager.recover_sessions()
+    if recovered:
+        print(f"♻️  {recovered} sessões recuperadas do journal")
     
+    if SERVER_MODE == 'production':
+        print(f"⚡ Modo de produção: {ASYNC_WORKER}, pool de {OFFLOAD_POOL_SIZE} threads para SQLite e CPU")
     print(f"🌐 Servidor rodando em: http://{host}:{port}")
     print("📱 Acesse pelo celular para melhor experiência GPS")
     print("🛑 Pressione Ctrl+C para parar o servidor")
@@ -33,8 +88,7 @@ def main():
             app, 
             host=host, 
             port=port, 
-            debug=debug,
-            allow_unsafe_werkzeug=True
+            **options
         )
     except KeyboardInterrupt:
         print("\n🛑 Servidor interrompido pelo usuário")
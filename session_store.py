@@ -0,0 +1,289 @@
+"""
+Armazenamento das sessões de treino ativas
+
+O MemorySessionStore guarda as sessões em um dicionário do processo, como
+antes. O SQLiteSessionStore grava o estado serializado de cada sessão no
+banco compartilhado, permitindo rodar o servidor em vários processos: cada
+evento de GPS carrega a sessão, atualiza e grava de volta em uma transação
+(o estado pequeno e só as posições novas da trilha).
+
+Os dois registram o horário da última alteração de cada sessão, usado pelo
+SessionReaper (reaper.py) para encontrar as sessões abandonadas.
+"""
+
+import pickle
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from database import ConnectionPool
+from journal import RECORD
+from track_store import TrackStore
+
+
+class MemorySessionStore:
+    """Sessões ativas em memória (um único processo)"""
+
+    def __init__(self):
+        self._sessions = {}
+        self._touched = {}
+        # Um lock por sessão serializa edit() da mesma sessão sem travar as outras
+        self._session_locks = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def __getitem__(self, session_id: str) -> Dict:
+        return self._sessions[session_id]
+
+    def __setitem__(self, session_id: str, training_session: Dict):
+        with self._lock:
+            self._sessions[session_id] = training_session
+            self._touched[session_id] = time.time()
+            self._session_locks.setdefault(session_id, threading.Lock())
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        return self._sessions.get(session_id)
+
+    def pop(self, session_id: str) -> Optional[Dict]:
+        """Remove e retorna a sessão, ou None se ela não existe
+
+        Espera o edit() em andamento na sessão terminar, para não entregar um
+        tracker ainda sendo alterado.
+        """
+        lock = self._session_locks.get(session_id)
+        if lock is None:
+            return None
+        with lock:
+            return self._remove(session_id)
+
+    def items(self) -> List[Tuple[str, Dict]]:
+        """Cópia das sessões ativas"""
+        with self._lock:
+            return list(self._sessions.items())
+
+    @contextmanager
+    def edit(self, session_id: str, touch: bool = True) -> Iterator[Optional[Dict]]:
+        """Entrega a sessão para alteração (None se ela não existe)
+
+        Com touch=False a alteração não conta como atividade da sessão.
+        """
+        lock = self._session_locks.get(session_id)
+        if lock is None:
+            yield None
+            return
+        with lock:
+            training_session = self._sessions.get(session_id)
+            yield training_session
+            if touch and training_session is not None:
+                self._touched[session_id] = time.time()
+
+    def idle_sessions(self, cutoff: float) -> List[str]:
+        """Sessões sem alteração desde cutoff (timestamp)"""
+        with self._lock:
+            return [session_id for session_id, touched in self._touched.items() if touched < cutoff]
+
+    def pop_idle(self, session_id: str, cutoff: float) -> Optional[Tuple[Dict, float]]:
+        """Remove a sessão se ela continua sem alteração desde cutoff
+
+        Retorna (sessão, horário da última alteração), ou None se ela voltou a
+        receber posições ou já foi finalizada.
+        """
+        lock = self._session_locks.get(session_id)
+        if lock is None:
+            return None
+        with lock:
+            touched = self._touched.get(session_id)
+            if touched is None or touched >= cutoff:
+                return None
+            training_session = self._remove(session_id)
+        return (training_session, touched) if training_session is not None else None
+
+    def _remove(self, session_id: str) -> Optional[Dict]:
+        """Remove a sessão (chamar com o lock da sessão)"""
+        with self._lock:
+            self._touched.pop(session_id, None)
+            self._session_locks.pop(session_id, None)
+            return self._sessions.pop(session_id, None)
+
+
+class SQLiteSessionStore:
+    """Sessões ativas serializadas no SQLite, compartilhadas entre processos
+
+    Usa as tabelas active_sessions e active_session_positions criadas por
+    TrainingManager.init_database. O estado serializado guarda só as últimas
+    window posições da trilha; as posições aceitas vão uma vez para
+    active_session_positions, então cada evento grava só o que mudou. A trilha
+    completa é remontada apenas ao retirar a sessão (pop, pop_idle) ou ao lê-la
+    inteira (get, items).
+    """
+
+    def __init__(self, db: ConnectionPool, tracker_class, window: int = 300):
+        self.db = db
+        self.tracker_class = tracker_class
+        self.window = window
+
+    def __contains__(self, session_id: str) -> bool:
+        row = self.db.connection().execute(
+            'SELECT 1 FROM active_sessions WHERE session_id = ?', (session_id,)
+        ).fetchone()
+        return row is not None
+
+    def __getitem__(self, session_id: str) -> Dict:
+        training_session = self.get(session_id)
+        if training_session is None:
+            raise KeyError(session_id)
+        return training_session
+
+    def __setitem__(self, session_id: str, training_session: Dict):
+        with self.db.transaction(immediate=True) as conn:
+            self._save(conn, session_id, training_session)
+
+    def __len__(self) -> int:
+        return self.db.connection().execute('SELECT COUNT(*) FROM active_sessions').fetchone()[0]
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        conn = self.db.connection()
+        row = conn.execute(
+            'SELECT state FROM active_sessions WHERE session_id = ?', (session_id,)
+        ).fetchone()
+        return self._load_full(conn, session_id, row[0]) if row else None
+
+    def pop(self, session_id: str) -> Optional[Dict]:
+        """Remove e retorna a sessão (com a trilha completa), ou None se ela não existe"""
+        with self.db.transaction(immediate=True) as conn:
+            row = conn.execute(
+                'SELECT state FROM active_sessions WHERE session_id = ?', (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            training_session = self._load_full(conn, session_id, row[0])
+            self._delete(conn, session_id)
+        return training_session
+
+    def items(self) -> List[Tuple[str, Dict]]:
+        conn = self.db.connection()
+        rows = conn.execute('SELECT session_id, state FROM active_sessions').fetchall()
+        return [(session_id, self._load_full(conn, session_id, state)) for session_id, state in rows]
+
+    @contextmanager
+    def edit(self, session_id: str, touch: bool = True) -> Iterator[Optional[Dict]]:
+        """Carrega a sessão e grava as alterações ao sair do bloco
+
+        O tracker entregue tem só a janela recente da trilha (suficiente para
+        os filtros e as estatísticas). A transação IMMEDIATE serializa as
+        alterações da mesma sessão feitas por processos diferentes. Com
+        touch=False a alteração não conta como atividade da sessão.
+        """
+        with self.db.transaction(immediate=True) as conn:
+            row = conn.execute(
+                'SELECT state, updated_at FROM active_sessions WHERE session_id = ?', (session_id,)
+            ).fetchone()
+            training_session, logged = self._load(row[0]) if row else (None, 0)
+            yield training_session
+            if training_session is not None:
+                self._save(conn, session_id, training_session, None if touch else row[1], logged)
+
+    def idle_sessions(self, cutoff: float) -> List[str]:
+        """Sessões sem alteração desde cutoff (timestamp)"""
+        rows = self.db.connection().execute(
+            'SELECT session_id FROM active_sessions WHERE updated_at < ?', (cutoff,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def pop_idle(self, session_id: str, cutoff: float) -> Optional[Tuple[Dict, float]]:
+        """Remove a sessão se ela continua sem alteração desde cutoff
+
+        Retorna (sessão, horário da última alteração), ou None se ela voltou a
+        receber posições ou já foi finalizada (inclusive por outro processo).
+        """
+        with self.db.transaction(immediate=True) as conn:
+            row = conn.execute(
+                'SELECT state, updated_at FROM active_sessions WHERE session_id = ? AND updated_at < ?',
+                (session_id, cutoff)
+            ).fetchone()
+            if row is None:
+                return None
+            training_session = self._load_full(conn, session_id, row[0])
+            self._delete(conn, session_id)
+        return training_session, row[1]
+
+    def _save(self, conn, session_id: str, training_session: Dict, updated_at: Optional[float] = None,
+              logged: Optional[int] = None):
+        """Grava o estado da sessão e acrescenta ao log as posições aceitas desde a carga
+
+        logged é quantas posições do tracker já estão em active_session_positions
+        (None reescreve o log com a trilha em memória).
+        """
+        tracker = training_session['gps_tracker']
+        tracker_state = tracker.to_state()
+        if tracker.journal is None:
+            # Com journal a trilha completa já está em disco e positions é só a janela
+            positions = tracker.positions
+            if logged is None or positions.appended < logged:
+                conn.execute('DELETE FROM active_session_positions WHERE session_id = ?', (session_id,))
+                logged = 0
+            first = positions.appended - len(positions)
+            start = max(logged - first, 0)
+            conn.executemany(
+                'INSERT INTO active_session_positions (session_id, seq, position) VALUES (?, ?, ?)',
+                ((session_id, first + i, RECORD.pack(*positions.row(i))) for i in range(start, len(positions)))
+            )
+            tracker_state['positions'] = self._tail(positions).to_state()
+
+        state = dict(training_session)
+        state['gps_tracker'] = tracker_state
+        state['position_log'] = True
+        conn.execute('''
+            INSERT OR REPLACE INTO active_sessions (session_id, state, updated_at)
+            VALUES (?, ?, ?)
+        ''', (session_id, pickle.dumps(state, pickle.HIGHEST_PROTOCOL), updated_at or time.time()))
+
+    def _tail(self, positions: TrackStore) -> TrackStore:
+        """Últimas window posições da trilha (sem limite, para receber as próximas até o _save)"""
+        tail = TrackStore()
+        for i in range(max(len(positions) - self.window, 0), len(positions)):
+            tail.append(*positions.row(i))
+        tail.appended = positions.appended
+        return tail
+
+    def _load(self, data: bytes) -> Tuple[Dict, int]:
+        """Reconstrói a sessão com a janela da trilha; retorna também quantas posições já estão no log"""
+        training_session = pickle.loads(data)
+        # Estados gravados antes do log têm a trilha inteira e nada no log
+        logged = training_session.pop('position_log', False)
+        tracker = self.tracker_class.from_state(training_session['gps_tracker'])
+        training_session['gps_tracker'] = tracker
+        return training_session, tracker.positions.appended if logged else 0
+
+    def _load_full(self, conn, session_id: str, data: bytes) -> Dict:
+        """Reconstrói a sessão com a trilha completa do log"""
+        training_session, logged = self._load(data)
+        tracker = training_session['gps_tracker']
+        if tracker.journal is None and logged:
+            positions = TrackStore()
+            for (position,) in conn.execute(
+                'SELECT position FROM active_session_positions WHERE session_id = ? ORDER BY seq', (session_id,)
+            ):
+                positions.append(*RECORD.unpack(position))
+            positions.appended = tracker.positions.appended
+            tracker.positions = positions
+        return training_session
+
+    def _delete(self, conn, session_id: str):
+        conn.execute('DELETE FROM active_sessions WHERE session_id = ?', (session_id,))
+        conn.execute('DELETE FROM active_session_positions WHERE session_id = ?', (session_id,))
+
+
+def create_session_store(backend: str, db: ConnectionPool, tracker_class, window: int = 300):
+    """Cria o session store configurado: 'memory' ou 'sqlite' (window: posições recentes no estado)"""
+    if backend == 'memory':
+        return MemorySessionStore()
+    if backend == 'sqlite':
+        return SQLiteSessionStore(db, tracker_class, window)
+    raise ValueError(f'Unknown session store backend: {backend}')
@@ -0,0 +1,105 @@
+"""
+Simplificação de trilhas (Douglas–Peucker) em vários níveis de detalhe
+
+Uma única passada do Douglas–Peucker atribui a cada posição a sua
+"importância": a maior tolerância (em metros) com que ela ainda seria mantida.
+O nível de tolerância t é então só o conjunto das posições com importância
+maior que t, e todas as posições descartadas ficam a no máximo t metros da
+trilha simplificada. Os níveis são aninhados e calculados de uma vez.
+"""
+
+from array import array
+from typing import Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from geometry import DEG, EARTH_RADIUS_KM
+from track_store import TrackStore
+
+EARTH_RADIUS_M = EARTH_RADIUS_KM * 1000
+
+
+def importance(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """Tolerância (m) até a qual cada posição é mantida pelo Douglas–Peucker
+
+    As extremidades têm importância infinita.
+    """
+    n = len(lat)
+    result = np.full(n, np.inf)
+    if n < 3:
+        return result
+
+    x, y = _to_meters(lat, lon)
+    stack = [(0, n - 1, np.inf)]
+    while stack:
+        first, last, parent = stack.pop()
+        if last - first < 2:
+            continue
+        distance = _segment_distance(x[first + 1:last], y[first + 1:last],
+                                     x[first], y[first], x[last], y[last])
+        split = first + 1 + int(np.argmax(distance))
+        # Uma posição nunca é mais importante que a que dividiu o trecho antes dela
+        value = min(float(distance[split - first - 1]), parent)
+        result[split] = value
+        stack.append((first, split, value))
+        stack.append((split, last, value))
+    return result
+
+
+def simplify(lat: np.ndarray, lon: np.ndarray, tolerance: float) -> np.ndarray:
+    """Índices das posições mantidas com a tolerância informada (m)"""
+    return np.flatnonzero(importance(lat, lon) > tolerance)
+
+
+def load(rows: Iterable[Tuple]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Latitudes, longitudes e importância das posições de uma trilha
+
+    rows são tuplas na ordem de FIELDS (track_codec.iter_rows sobre a trilha
+    codificada, TrackStore.rows()); só as coordenadas são guardadas, em
+    colunas array('d'), então a memória não inclui as posições inteiras.
+    """
+    lat = array('d')
+    lon = array('d')
+    for row in rows:
+        lat.append(row[0])
+        lon.append(row[1])
+    lat = np.frombuffer(lat, dtype=float) if lat else np.empty(0)
+    lon = np.frombuffer(lon, dtype=float) if lon else np.empty(0)
+    return lat, lon, importance(lat, lon)
+
+
+def build_levels(rows: Iterable[Tuple], weights: np.ndarray,
+                 tolerances: Sequence[float]) -> List[Tuple[float, TrackStore]]:
+    """Níveis de detalhe de uma trilha, um TrackStore por tolerância
+
+    rows percorre de novo a trilha passada a load (weights); cada posição vai
+    para os níveis em que é mantida, em uma única passada.
+    """
+    levels = [(tolerance, TrackStore()) for tolerance in tolerances]
+    for row, weight in zip(rows, weights.tolist()):
+        for tolerance, level in levels:
+            if weight > tolerance:
+                level.append(*row)
+    return levels
+
+
+def _to_meters(lat: np.ndarray, lon: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Projeção equiretangular em metros centrada na trilha"""
+    lat0 = float(np.mean(lat))
+    lon0 = float(lon[0])
+    # Diferença de longitude no intervalo [-180, 180) para trilhas que cruzam o antimeridiano
+    d_lon = (lon - lon0 + 180) % 360 - 180
+    x = d_lon * DEG * np.cos(lat0 * DEG) * EARTH_RADIUS_M
+    y = (lat - lat0) * DEG * EARTH_RADIUS_M
+    return x, y
+
+
+def _segment_distance(x: np.ndarray, y: np.ndarray, ax: float, ay: float, bx: float, by: float) -> np.ndarray:
+    """Distância de cada ponto ao segmento a-b (trilhas que voltam ao início têm a == b)"""
+    dx = bx - ax
+    dy = by - ay
+    length2 = dx * dx + dy * dy
+    if length2 == 0:
+        return np.hypot(x - ax, y - ay)
+    t = np.clip(((x - ax) * dx + (y - ay) * dy) / length2, 0, 1)
+    return np.hypot(x - (ax + t * dx), y - (ay + t * dy))
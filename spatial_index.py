@@ -0,0 +1,159 @@
+"""
+Índice espacial dos trechos das trilhas salvas (módulo rtree do SQLite)
+
+Cada trilha é simplificada com tolerância SEGMENT_TOLERANCE e dividida em
+trechos de até POINTS_PER_BOX posições consecutivas; cada trecho vira uma
+linha da tabela R-tree track_segments com sua caixa envolvente, o
+training_id e as coordenadas simplificadas. As consultas usam o R-tree para
+achar os trechos candidatos e conferem a distância exata sobre as
+coordenadas do trecho, então os resultados têm a precisão da simplificação.
+"""
+
+import math
+from array import array
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from geometry import DEG, EARTH_RADIUS_KM
+
+# Erro máximo (m) da trilha simplificada usada no índice
+SEGMENT_TOLERANCE = 10.0
+# Posições por trecho indexado (trechos vizinhos compartilham uma posição)
+POINTS_PER_BOX = 16
+
+EARTH_RADIUS_M = EARTH_RADIUS_KM * 1000
+METERS_PER_DEGREE = EARTH_RADIUS_M * DEG
+
+
+def create_tables(cursor, table: str = 'track_segments'):
+    """Tabela R-tree com os trechos das trilhas (outro nome cria uma tabela para reconstrução)"""
+    cursor.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING rtree(
+            id,
+            min_lat, max_lat,
+            min_lon, max_lon,
+            +training_id TEXT,
+            +points BLOB
+        )
+    ''')
+
+
+def index_rows(training_id: str, lat: np.ndarray, lon: np.ndarray, weights: np.ndarray) -> List[Tuple]:
+    """Linhas de track_segments de uma trilha (coordenadas e importância de simplify.load)"""
+    kept = np.flatnonzero(weights > SEGMENT_TOLERANCE)
+    if not kept.size:
+        return []
+    coords = np.column_stack((lat[kept], lon[kept]))
+
+    segments = []
+    step = POINTS_PER_BOX - 1
+    for start in range(0, max(len(coords) - 1, 1), step):
+        chunk = coords[start:start + POINTS_PER_BOX]
+        segments.append((
+            float(chunk[:, 0].min()), float(chunk[:, 0].max()),
+            float(chunk[:, 1].min()), float(chunk[:, 1].max()),
+            training_id,
+            array('d', chunk.ravel()).tobytes()
+        ))
+    return segments
+
+
+def insert(conn, segments: List[Tuple], table: str = 'track_segments'):
+    """Grava as linhas produzidas por index_rows"""
+    conn.executemany(f'''
+        INSERT INTO {table} (min_lat, max_lat, min_lon, max_lon, training_id, points)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', segments)
+
+
+def near(conn, lat: float, lon: float, radius: float, user_id: Optional[str] = None,
+         limit: int = 50) -> List[Tuple[str, float]]:
+    """Treinos que passaram a até radius metros do ponto, com a menor distância (m), mais próximos primeiro"""
+    d_lat = radius / METERS_PER_DEGREE
+    cos_lat = math.cos(lat * DEG)
+    d_lon = 180.0 if cos_lat < 1e-6 else min(180.0, d_lat / cos_lat)
+
+    closest = {}
+    for training_id, points in _candidates(conn, lat - d_lat, lat + d_lat, lon - d_lon, lon + d_lon, user_id):
+        distance = _distance_to_path(lat, lon, points)
+        if distance <= radius and distance < closest.get(training_id, math.inf):
+            closest[training_id] = distance
+
+    return sorted(closest.items(), key=lambda item: item[1])[:limit]
+
+
+def within_bbox(conn, min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                user_id: Optional[str] = None) -> List[str]:
+    """Treinos com algum trecho dentro da caixa ou cruzando-a"""
+    found = {}
+    for training_id, points in _candidates(conn, min_lat, max_lat, min_lon, max_lon, user_id):
+        if training_id not in found and _path_crosses_box(points, min_lat, min_lon, max_lat, max_lon):
+            found[training_id] = True
+    return list(found)
+
+
+def _candidates(conn, min_lat: float, max_lat: float, min_lon: float, max_lon: float,
+                user_id: Optional[str]):
+    sql = '''
+        SELECT s.training_id, s.points FROM track_segments s
+        {join}
+        WHERE s.max_lat >= ? AND s.min_lat <= ? AND s.max_lon >= ? AND s.min_lon <= ?
+        {user_filter}
+    '''
+    params = [min_lat, max_lat, min_lon, max_lon]
+    if user_id is None:
+        sql = sql.format(join='', user_filter='')
+    else:
+        sql = sql.format(join='JOIN trainings t ON t.id = s.training_id', user_filter='AND t.user_id = ?')
+        params.append(user_id)
+    return conn.execute(sql, params)
+
+
+def _points(points: bytes) -> np.ndarray:
+    return np.frombuffer(points, dtype=float).reshape(-1, 2)
+
+
+def _distance_to_path(lat: float, lon: float, points: bytes) -> float:
+    """Menor distância (m) do ponto aos segmentos do trecho, em projeção local centrada no ponto"""
+    coords = _points(points)
+    y = (coords[:, 0] - lat) * METERS_PER_DEGREE
+    x = ((coords[:, 1] - lon + 180) % 360 - 180) * METERS_PER_DEGREE * math.cos(lat * DEG)
+    if len(coords) == 1:
+        return float(np.hypot(x[0], y[0]))
+
+    ax, ay = x[:-1], y[:-1]
+    dx, dy = x[1:] - ax, y[1:] - ay
+    length2 = dx * dx + dy * dy
+    t = np.divide(-(ax * dx + ay * dy), length2, out=np.zeros_like(length2), where=length2 > 0)
+    t = np.clip(t, 0, 1)
+    return float(np.hypot(ax + t * dx, ay + t * dy).min())
+
+
+def _path_crosses_box(points: bytes, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> bool:
+    """Algum segmento do trecho tem parte dentro da caixa (recorte de Liang–Barsky)"""
+    coords = _points(points).tolist()
+    if len(coords) == 1:
+        lat, lon = coords[0]
+        return min_lat <= lat <= max_lat and min_lon <= lon <= max_lon
+
+    for (lat1, lon1), (lat2, lon2) in zip(coords, coords[1:]):
+        d_lat = lat2 - lat1
+        d_lon = lon2 - lon1
+        t0, t1 = 0.0, 1.0
+        for p, q in ((-d_lon, lon1 - min_lon), (d_lon, max_lon - lon1),
+                     (-d_lat, lat1 - min_lat), (d_lat, max_lat - lat1)):
+            if p == 0:
+                if q < 0:
+                    break
+                continue
+            r = q / p
+            if p < 0:
+                t0 = max(t0, r)
+            else:
+                t1 = min(t1, r)
+            if t0 > t1:
+                break
+        else:
+            return True
+    return False
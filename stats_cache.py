@@ -0,0 +1,103 @@
+"""
+Cache LRU/TTL em memória para as estatísticas dos usuários
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, NamedTuple, Optional, Tuple
+
+
+class CacheEntry(NamedTuple):
+    payload: Dict
+    etag: str
+    expires_at: float
+
+
+class StatsCache:
+    """Cache LRU com expiração por tempo e invalidação explícita por chave
+
+    Cada entrada guarda o payload e um ETag calculado a partir dele, para que
+    requisições condicionais possam ser respondidas sem consultar o banco.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Optional[CacheEntry]:
+        """Retorna a entrada válida da chave, ou None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Dict]) -> Tuple[CacheEntry, bool]:
+        """Retorna a entrada da chave e se ela veio do cache
+
+        Em caso de falta o payload é carregado com loader. Se a chave for
+        invalidada enquanto o loader roda, o resultado é devolvido mas não
+        fica no cache, pois pode estar desatualizado.
+        """
+        entry = self.get(key)
+        if entry is not None:
+            return entry, True
+
+        with self._lock:
+            generation = self._generation
+        payload = loader()
+        entry = CacheEntry(payload, make_etag(payload), time.monotonic() + self.ttl)
+
+        with self._lock:
+            if generation == self._generation and self.maxsize > 0:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return entry, False
+
+    def invalidate(self, key: Hashable):
+        """Remove a chave do cache (chamar depois do commit da escrita)"""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Esvazia o cache"""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """Contadores do cache"""
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+
+def make_etag(payload: Dict) -> str:
+    """ETag forte derivado do conteúdo do payload"""
+    body = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(body.encode('utf-8')).hexdigest()
@@ -0,0 +1,24 @@
+"""
+Configuração comum dos testes
+
+Os módulos do app ficam na raiz do repositório; o fixture app_module aponta o
+banco para um diretório temporário e sobe as threads do TrainingManager.
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def app_module(tmp_path):
+    """O módulo app com um banco novo em tmp_path"""
+    import app
+    app.configure_database(path=str(tmp_path / 'test.db'))
+    app.training_manager.start()
+    return app
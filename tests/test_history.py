@@ -0,0 +1,52 @@
+"""
+Histórico de treinos paginado por cursor (GET /api/trainings/<user_id>)
+"""
+
+import pytest
+
+
+@pytest.fixture
+def client(app_module):
+    conn = app_module.db.connection()
+    with app_module.db.transaction(immediate=True):
+        # Vários treinos com o mesmo created_at: o id desempata
+        conn.executemany('''
+            INSERT INTO trainings (id, user_id, type, distance, duration, pace, gps_data, created_at)
+            VALUES (?, ?, 'longa', ?, 600, 5.0, NULL, ?)
+        ''', [(f't{i:02d}', 'u1', float(i), f'2024-01-{1 + i // 3:02d} 10:00:00') for i in range(25)] +
+             [('other', 'u2', 1.0, '2024-01-05 10:00:00')])
+    return app_module.app.test_client()
+
+
+def _pages(client, limit):
+    pages = []
+    cursor = None
+    while True:
+        query = f'?limit={limit}' + (f'&cursor={cursor}' if cursor else '')
+        body = client.get('/api/trainings/u1' + query).get_json()
+        pages.append([t['training_id'] for t in body['trainings']])
+        cursor = body['next_cursor']
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.parametrize('limit', [1, 4, 7, 25, 100])
+def test_pages_cover_history_once_newest_first(client, limit):
+    pages = _pages(client, limit)
+
+    ids = [training_id for page in pages for training_id in page]
+    assert ids == [f't{i:02d}' for i in reversed(range(25))]
+    assert all(len(page) == limit for page in pages[:-1])
+
+
+def test_summary_has_no_track(client):
+    training = client.get('/api/trainings/u1?limit=1').get_json()['trainings'][0]
+
+    assert training['training_id'] == 't24'
+    assert 'gps_data' not in training
+
+
+def test_invalid_cursor_is_rejected(client):
+    response = client.get('/api/trainings/u1?cursor=not-a-cursor')
+
+    assert response.status_code == 400
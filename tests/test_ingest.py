@@ -0,0 +1,108 @@
+"""
+Ingestão de posições: add_positions (lote) e add_position (uma a uma)
+"""
+
+import math
+import random
+
+import pytest
+
+import app
+
+
+def _fixes(count=600, seed=1):
+    """Trilha com ruído, saltos e posições imprecisas, paradas e lentas"""
+    rng = random.Random(seed)
+    lat, lon, t = -23.55, -46.63, 1000.0
+    fixes = []
+    for _ in range(count):
+        t += 1
+        r = rng.random()
+        if r < 0.6:
+            lat += rng.gauss(0, 3e-5)
+            lon += rng.gauss(0, 3e-5)
+        elif r < 0.65:
+            # Salto impossível, descartado pelo filtro de salto
+            fixes.append({'latitude': lat + 0.01, 'longitude': lon, 'accuracy': 5, 'timestamp': t})
+            t += 1
+        fixes.append({'latitude': lat, 'longitude': lon, 'accuracy': rng.choice([3, 8, 15, 30, 60]),
+                      'speed': rng.choice([None, 0, 3.0, 25.0]), 'altitude': 700.0, 'heading': None,
+                      'timestamp': t})
+    return fixes
+
+
+def _per_point(fixes):
+    tracker = app.GPSTracker()
+    for fix in fixes:
+        tracker.add_position(fix['latitude'], fix['longitude'], fix['accuracy'], fix.get('speed'),
+                             fix.get('altitude'), fix.get('heading'), fix.get('timestamp'))
+    return tracker
+
+
+def _rows(tracker):
+    return [tuple(None if isinstance(v, float) and math.isnan(v) else v for v in row)
+            for row in tracker.positions.rows()]
+
+
+@pytest.mark.parametrize('batch_size', [1, 7, 37, 1000])
+def test_batch_matches_per_point(batch_size):
+    fixes = _fixes()
+    expected = _per_point([dict(fix) for fix in fixes])
+
+    tracker = app.GPSTracker()
+    for start in range(0, len(fixes), batch_size):
+        tracker.add_positions([dict(fix) for fix in fixes[start:start + batch_size]])
+
+    assert _rows(tracker) == _rows(expected)
+    assert tracker.total_distance == pytest.approx(expected.total_distance, abs=1e-12)
+    assert tracker.positions.appended == expected.positions.appended
+    assert tracker.raw_positions.appended == expected.raw_positions.appended
+
+
+def test_batch_result_counts_filtered_fixes():
+    fixes = _fixes(200)
+    result = app.GPSTracker().add_positions(fixes)
+
+    filtered = result['filtered']
+    assert result['accepted'] + filtered['quality_filter'] + filtered['minimum_movement'] == len(fixes)
+    assert filtered['quality_filter'] > 0
+    assert result['status'] == 'accepted'
+
+
+def test_untimed_fixes_get_arrival_time_in_both_paths(monkeypatch):
+    monkeypatch.setattr(app.time, 'time', lambda: 5000.0)
+    fixes = [{'latitude': 1.0 + i * 1e-4, 'longitude': 1.0, 'accuracy': 5} for i in range(5)]
+
+    expected = _per_point(fixes)
+    tracker = app.GPSTracker()
+    result = tracker.add_positions([dict(fix) for fix in fixes])
+
+    assert result['accepted'] == len(expected.positions) == 5
+    assert [row[-1] for row in tracker.positions.rows()] == [5000.0] * 5
+    assert not tracker.client_clock
+
+
+def test_timestamp_zero_is_not_missing():
+    tracker = app.GPSTracker()
+    tracker.add_positions([{'latitude': 1.0, 'longitude': 1.0, 'accuracy': 5, 'timestamp': 0}])
+
+    assert tracker.positions[0]['timestamp'] == 0
+    assert tracker.client_clock
+
+
+@pytest.mark.parametrize('latitude, longitude, accuracy', [
+    (math.nan, -46.63, 5), (-23.55, math.inf, 5), (-23.55, -46.63, math.nan), (-math.inf, -46.63, 5)
+])
+def test_non_finite_fix_is_quality_filtered(latitude, longitude, accuracy):
+    good = [{'latitude': -23.55, 'longitude': -46.63, 'accuracy': 5, 'timestamp': 1.0},
+            {'latitude': -23.5501, 'longitude': -46.63, 'accuracy': 5, 'timestamp': 20.0}]
+    bad = {'latitude': latitude, 'longitude': longitude, 'accuracy': accuracy, 'timestamp': 10.0}
+
+    tracker = app.GPSTracker()
+    tracker.add_position(-23.55, -46.63, 5, timestamp=1.0)
+    assert tracker.add_position(latitude, longitude, accuracy, timestamp=10.0)['reason'] == 'quality_filter'
+
+    result = app.GPSTracker().add_positions([good[0], bad, good[1]])
+    assert result['accepted'] == 2
+    assert result['filtered']['quality_filter'] == 1
+    assert math.isfinite(result['total_distance'])
@@ -0,0 +1,84 @@
+"""
+Journal das sessões em andamento e recuperação após uma queda (journal, GPSTracker.from_journal)
+"""
+
+import math
+import os
+
+import pytest
+
+import app
+from journal import RECORD, SessionJournal, list_sessions
+
+
+def _fixes(count=120):
+    return [{'latitude': -23.55 + i * 4e-5, 'longitude': -46.63 + (i % 7) * 1e-5, 'accuracy': 5.0,
+             'speed': 3.0, 'timestamp': 1000.0 + i * 2, 'seq': i} for i in range(count)]
+
+
+def _rows(track):
+    return [tuple(None if math.isnan(v) else v for v in row) for row in track.rows()]
+
+
+def _journal(directory, session_id='s1'):
+    return SessionJournal.create(str(directory), session_id, {'user_id': 'u1', 'type': 'longa', 'start_time': 0},
+                                 segment_size=8)
+
+
+def test_track_is_read_back_with_unflushed_rows(tmp_path):
+    journal = _journal(tmp_path)
+    rows = [(1.0 + i, 2.0, 5.0, math.nan, math.nan, math.nan, float(i)) for i in range(20)]
+    for row in rows[:16]:
+        journal.append(row)
+    journal.flush()
+    for row in rows[16:]:
+        journal.append(row)
+
+    assert len(list(journal.rows())) == 20
+    # Outro processo (ou o mesmo depois de reiniciar) só vê o que foi gravado
+    assert [row[0] for row in SessionJournal(str(tmp_path), 's1').rows()] == [row[0] for row in rows[:16]]
+
+
+def test_partial_record_at_end_is_ignored(tmp_path):
+    journal = _journal(tmp_path)
+    journal.append((1.0, 2.0, 5.0, 0.0, 0.0, 0.0, 1.0))
+    journal.flush()
+    with open(os.path.join(str(tmp_path), 's1.track'), 'ab') as f:
+        f.write(RECORD.pack(3.0, 4.0, 5.0, 0.0, 0.0, 0.0, 2.0)[:20])
+
+    assert list(SessionJournal(str(tmp_path), 's1').rows()) == [(1.0, 2.0, 5.0, 0.0, 0.0, 0.0, 1.0)]
+
+
+def test_recovered_session_matches_uninterrupted_one(tmp_path):
+    fixes = _fixes()
+    expected = app.GPSTracker()
+    for fix in fixes:
+        expected.add_positions([dict(fix)])
+
+    tracker = app.GPSTracker(journal=_journal(tmp_path))
+    for fix in fixes[:53]:
+        tracker.add_positions([dict(fix)])
+    # Queda: o segmento em memória se perde e o cliente reenvia tudo o que tem
+    recovered = app.GPSTracker.from_journal(SessionJournal(str(tmp_path), 's1', segment_size=8))
+    assert recovered.positions.appended % 8 == 0
+    assert recovered.positions.appended <= tracker.positions.appended
+    result = recovered.add_positions([dict(fix) for fix in fixes])
+
+    assert result['filtered']['duplicate'] > 0
+    assert _rows(recovered.track()) == _rows(expected.positions)
+    assert recovered.total_distance == pytest.approx(expected.total_distance)
+
+
+def test_finish_and_delete(tmp_path):
+    journal = _journal(tmp_path)
+    journal.append((1.0, 2.0, 5.0, 0.0, 0.0, 0.0, 1.0))
+    assert list_sessions(str(tmp_path)) == ['s1']
+    assert journal.read_summary() is None
+
+    journal.finish({'training_id': 't1', 'distance': 1.0})
+    assert SessionJournal(str(tmp_path), 's1').read_summary()['training_id'] == 't1'
+    assert len(list(SessionJournal(str(tmp_path), 's1').rows())) == 1
+
+    journal.delete()
+    assert list_sessions(str(tmp_path)) == []
+    assert os.listdir(str(tmp_path)) == []
@@ -0,0 +1,66 @@
+"""
+Métricas no formato texto do Prometheus (metrics, GET /metrics)
+"""
+
+import re
+
+import metrics
+
+
+def _registry():
+    registry = metrics.Registry()
+    registry.counter('fixes', 'Posições', ('reason',)).inc(2, 'late')
+    registry.histogram('stage_seconds', 'Etapas', buckets=(0.1, 1.0)).observe(0.5)
+    registry.gauge('sessions', 'Sessões', lambda: 3)
+    registry.gauge('cache', 'Cache', lambda: {('hits',): 4}, ('field',))
+    registry.gauge('disabled', 'Sem valor', lambda: None)
+    return registry
+
+
+def _families(text):
+    """Nome de cada família (# TYPE) e os nomes das amostras que vêm depois dele"""
+    families = {}
+    current = None
+    for line in text.splitlines():
+        if line.startswith('# TYPE '):
+            current = line.split()[2]
+            families[current] = []
+        elif not line.startswith('#'):
+            families[current].append(re.match(r'[a-zA-Z_:][a-zA-Z0-9_:]*', line).group())
+    return families
+
+
+def test_counter_family_matches_total_samples():
+    text = _registry().render()
+
+    assert '# HELP fixes_total Posições\n# TYPE fixes_total counter\nfixes_total{reason="late"} 2\n' in text
+
+
+def test_sample_names_belong_to_their_family():
+    families = _families(_registry().render())
+
+    assert families['stage_seconds'] == ['stage_seconds_bucket'] * 3 + ['stage_seconds_sum', 'stage_seconds_count']
+    assert families['sessions'] == ['sessions']
+    assert families['cache'] == ['cache']
+    assert families['disabled'] == []
+    for family, samples in families.items():
+        assert all(sample == family or sample.startswith(family + '_') for sample in samples)
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = metrics.Registry()
+    histogram = registry.histogram('h', 'H', buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value)
+
+    text = registry.render()
+
+    assert 'h_bucket{le="0.1"} 1\nh_bucket{le="1"} 3\nh_bucket{le="+Inf"} 4\nh_sum 6.05\nh_count 4\n' in text
+
+
+def test_metrics_endpoint(app_module):
+    response = app_module.app.test_client().get('/metrics')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert '# TYPE gps_fixes_accepted_total counter' in response.get_data(as_text=True)
@@ -0,0 +1,79 @@
+"""
+Migrações do esquema (PRAGMA user_version)
+"""
+
+import sqlite3
+
+import migrations
+
+
+def _version_zero(conn):
+    """Tabelas base como eram antes das migrações, com um treino salvo"""
+    conn.execute('''
+        CREATE TABLE trainings (
+            id TEXT PRIMARY KEY, user_id TEXT NOT NULL, type TEXT NOT NULL, distance REAL NOT NULL,
+            duration INTEGER NOT NULL, pace REAL NOT NULL, gps_data TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE achievements (
+            id TEXT PRIMARY KEY, user_id TEXT NOT NULL, name TEXT NOT NULL, description TEXT NOT NULL,
+            icon TEXT NOT NULL, unlocked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute("INSERT INTO trainings (id, user_id, type, distance, duration, pace) "
+                 "VALUES ('t1', 'u1', 'longa', 5.0, 1500, 5.0)")
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+
+def _names(conn, kind):
+    return {row[0] for row in conn.execute('SELECT name FROM sqlite_master WHERE type = ?', (kind,))}
+
+
+def test_versions_are_sequential():
+    assert [m.version for m in migrations.MIGRATIONS] == list(range(1, len(migrations.MIGRATIONS) + 1))
+
+
+def test_migrate_upgrades_version_zero_and_keeps_data():
+    conn = sqlite3.connect(':memory:')
+    _version_zero(conn)
+
+    applied = migrations.migrate(conn)
+
+    assert applied == list(migrations.MIGRATIONS)
+    assert migrations.schema_version(conn) == migrations.MIGRATIONS[-1].version
+    assert 'moving_time' in _columns(conn, 'trainings')
+    assert {'training_splits', 'training_rollups', 'heatmap_tiles'} <= _names(conn, 'table')
+    assert {'idx_trainings_user_created', 'idx_achievements_user_unlocked'} <= _names(conn, 'index')
+    assert conn.execute('SELECT id, distance, moving_time FROM trainings').fetchall() == [('t1', 5.0, None)]
+
+
+def test_migrate_is_idempotent():
+    conn = sqlite3.connect(':memory:')
+    _version_zero(conn)
+    migrations.migrate(conn)
+
+    assert migrations.migrate(conn) == []
+
+
+def test_migrate_applies_only_pending():
+    conn = sqlite3.connect(':memory:')
+    _version_zero(conn)
+    for statement in migrations.MIGRATIONS[0].statements:
+        conn.execute(statement)
+    conn.execute('PRAGMA user_version = 1')
+
+    applied = migrations.migrate(conn)
+
+    assert [m.version for m in applied] == [m.version for m in migrations.MIGRATIONS[1:]]
+
+
+def test_init_database_creates_current_schema(app_module):
+    conn = app_module.db.connection()
+
+    assert migrations.schema_version(conn) == migrations.MIGRATIONS[-1].version
+    assert 'moving_time' in _columns(conn, 'trainings')
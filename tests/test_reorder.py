@@ -0,0 +1,101 @@
+"""
+Buffer de reordenação por seq (reorder.ReorderBuffer)
+"""
+
+import pytest
+
+from reorder import ReorderBuffer
+
+
+def _fix(seq, timestamp=None):
+    return {'seq': seq, 'timestamp': float(seq if timestamp is None else timestamp)}
+
+
+def _seqs(fixes):
+    return [fix['seq'] for fix in fixes]
+
+
+def test_out_of_order_fixes_come_out_in_order():
+    buffer = ReorderBuffer()
+
+    ready, *_ = buffer.push([_fix(2), _fix(0), _fix(3)])
+    assert _seqs(ready) == [0]
+    assert len(buffer) == 2
+
+    ready, *_ = buffer.push([_fix(1)])
+    assert _seqs(ready) == [1, 2, 3]
+    assert len(buffer) == 0
+
+
+def test_duplicates_are_counted_not_delivered():
+    buffer = ReorderBuffer()
+    buffer.push([_fix(0), _fix(1), _fix(3)])
+
+    ready, duplicates, late, invalid = buffer.push([_fix(0), _fix(3), _fix(2)])
+
+    assert _seqs(ready) == [2, 3]
+    assert (duplicates, late, invalid) == (2, 0, 0)
+
+
+def test_gap_is_skipped_after_max_delay_and_late_fix_dropped():
+    buffer = ReorderBuffer(max_delay=10.0)
+    buffer.push([_fix(0)])
+
+    ready, *_ = buffer.push([_fix(2, 2.0), _fix(3, 13.0)])
+    assert _seqs(ready) == [2, 3]
+
+    ready, duplicates, late, invalid = buffer.push([_fix(1)])
+    assert ready == []
+    assert (duplicates, late, invalid) == (0, 1, 0)
+
+
+def test_gap_is_skipped_when_capacity_is_exceeded():
+    buffer = ReorderBuffer(capacity=3, max_delay=1e9)
+
+    ready, *_ = buffer.push([_fix(seq) for seq in range(1, 5)])
+
+    assert _seqs(ready) == [1, 2, 3, 4]
+
+
+@pytest.mark.parametrize('seq', [-1, 1.5, '2', None, True])
+def test_invalid_seq_is_dropped(seq):
+    ready, duplicates, late, invalid = ReorderBuffer().push([{'seq': seq, 'timestamp': 0.0}])
+
+    assert ready == []
+    assert invalid == 1
+
+
+def test_flush_releases_held_fixes_across_gaps():
+    buffer = ReorderBuffer()
+    buffer.push([_fix(2), _fix(5), _fix(6)])
+
+    assert _seqs(buffer.flush()) == [2, 5, 6]
+    assert len(buffer) == 0
+
+
+def test_state_round_trip_keeps_held_and_skipped():
+    buffer = ReorderBuffer(max_delay=10.0)
+    buffer.push([_fix(0), _fix(2, 2.0), _fix(3, 13.0), _fix(5, 14.0)])
+
+    restored = ReorderBuffer.from_state(buffer.to_state())
+
+    assert len(restored) == 1
+    assert restored.push([_fix(1)])[2] == 1
+    assert _seqs(restored.push([_fix(4, 14.0)])[0]) == [4, 5]
+
+
+def test_tracker_ignores_resent_batch():
+    import app
+    fixes = [{'latitude': -23.55 + i * 1e-4, 'longitude': -46.63, 'accuracy': 5, 'timestamp': 1000.0 + i * 2,
+              'seq': i} for i in range(10)]
+    tracker = app.GPSTracker()
+    tracker.add_positions([dict(fix) for fix in fixes[5:]])
+    tracker.add_positions([dict(fix) for fix in fixes[:6]])
+    accepted, distance = tracker.positions.appended, tracker.total_distance
+
+    result = tracker.add_positions([dict(fix) for fix in fixes])
+
+    assert len(tracker.reorder) == 0
+    assert tracker.positions.appended == accepted > 5
+    assert result['filtered']['duplicate'] == 10
+    assert tracker.total_distance == distance
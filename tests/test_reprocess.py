@@ -0,0 +1,50 @@
+"""
+Reprocessamento das trilhas salvas (reprocess)
+"""
+
+import pytest
+
+import reprocess
+
+
+def _save_training(app_module, user_id, training_id, count=300):
+    tracker = app_module.GPSTracker()
+    tracker.add_positions([{'latitude': -23.55 + i * 4e-5 + (i % 2) * 2e-5, 'longitude': -46.63, 'accuracy': 5.0,
+                            'timestamp': 1000.0 + i * 2} for i in range(count)])
+    app_module.training_manager.save_trainings([{
+        'training_id': training_id, 'user_id': user_id, 'type': 'longa', 'distance': tracker.total_distance,
+        'duration': count * 2, 'pace': (count * 2 / 60) / tracker.total_distance, 'gps_data': tracker.track(),
+        'live': tracker.live.summary(), 'journal': None, 'created_at': '2024-03-01 07:00:00'
+    }])
+
+
+def test_reprocess_updates_distance_and_derived_totals(app_module):
+    user_id = app_module.training_manager.create_user('Ana', 30, 60.0, 1.65, 'iniciante')
+    _save_training(app_module, user_id, 't1')
+    conn = app_module.db.connection()
+    before = conn.execute('SELECT distance FROM trainings').fetchone()[0]
+
+    settings = app_module.DEFAULT_FILTER_SETTINGS._replace(min_movement=0.02)
+    result = reprocess.run(app_module.db, settings)
+
+    assert result['processed'] == 1
+    distance, pace, duration = conn.execute('SELECT distance, pace, duration FROM trainings').fetchone()
+    assert 0 < distance < before
+    assert pace == pytest.approx((duration / 60) / distance)
+    assert conn.execute('SELECT total_distance FROM user_aggregates WHERE user_id = ?',
+                        (user_id,)).fetchone()[0] == pytest.approx(distance)
+    rollups = conn.execute('SELECT period, distance FROM training_rollups ORDER BY period').fetchall()
+    assert [period for period, _ in rollups] == ['day', 'month', 'week']
+    assert [total for _, total in rollups] == pytest.approx([distance] * 3)
+    assert conn.execute('SELECT COUNT(*) FROM maintenance_checkpoints').fetchone()[0] == 0
+
+
+def test_checkpoint_with_other_settings_is_rejected(app_module):
+    settings = app_module.DEFAULT_FILTER_SETTINGS
+    with app_module.db.transaction(immediate=True) as conn:
+        reprocess.create_tables(conn.cursor())
+        conn.execute("INSERT INTO maintenance_checkpoints VALUES (?, 0, 0, '{}', 0)", (reprocess.CHECKPOINT_NAME,))
+
+    with pytest.raises(ValueError):
+        reprocess.run(app_module.db, settings)
+    assert reprocess.run(app_module.db, settings, restart=True)['processed'] == 0
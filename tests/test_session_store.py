@@ -0,0 +1,119 @@
+"""
+Sessões ativas em memória e no SQLite (session_store)
+"""
+
+import math
+import threading
+import time
+
+import pytest
+
+from session_store import MemorySessionStore, SQLiteSessionStore
+
+
+def _fix(i):
+    return {'latitude': -23.55 + i * 5e-5, 'longitude': -46.63, 'accuracy': 5.0, 'timestamp': 1000.0 + i}
+
+
+def _rows(track):
+    return [tuple(None if math.isnan(v) else v for v in row) for row in track.rows()]
+
+
+@pytest.fixture
+def sqlite_store(app_module):
+    return SQLiteSessionStore(app_module.db, app_module.GPSTracker, window=20)
+
+
+def test_sqlite_edit_keeps_only_window_and_rebuilds_full_track(app_module, sqlite_store):
+    expected = app_module.GPSTracker()
+    sqlite_store['s1'] = {'user_id': 'u1', 'gps_tracker': app_module.GPSTracker()}
+
+    sizes = []
+    for i in range(200):
+        expected.add_positions([_fix(i)])
+        with sqlite_store.edit('s1') as training_session:
+            assert len(training_session['gps_tracker'].positions) <= 21
+            training_session['gps_tracker'].add_positions([_fix(i)])
+        if i in (50, 199):
+            sizes.append(len(app_module.db.connection().execute(
+                "SELECT state FROM active_sessions WHERE session_id = 's1'").fetchone()[0]))
+
+    # O estado gravado não cresce com a trilha
+    assert sizes[1] < sizes[0] * 1.5
+    tracker = sqlite_store.get('s1')['gps_tracker']
+    assert _rows(tracker.positions) == _rows(expected.positions)
+    assert tracker.total_distance == pytest.approx(expected.total_distance)
+
+    popped = sqlite_store.pop('s1')['gps_tracker']
+    assert _rows(popped.track()) == _rows(expected.positions)
+    assert sqlite_store.pop('s1') is None
+    assert app_module.db.connection().execute('SELECT COUNT(*) FROM active_session_positions').fetchone()[0] == 0
+
+
+def test_sqlite_batch_larger_than_window_is_logged(app_module, sqlite_store):
+    sqlite_store['s1'] = {'gps_tracker': app_module.GPSTracker()}
+
+    with sqlite_store.edit('s1') as training_session:
+        training_session['gps_tracker'].add_positions([_fix(i) for i in range(100)])
+    tracker = sqlite_store.pop('s1')['gps_tracker']
+
+    assert len(tracker.positions) == tracker.positions.appended > 20
+
+
+def test_sqlite_reset_rewrites_log(app_module, sqlite_store):
+    tracker = app_module.GPSTracker()
+    tracker.add_positions([_fix(i) for i in range(30)])
+    sqlite_store['s1'] = {'gps_tracker': tracker}
+
+    with sqlite_store.edit('s1') as training_session:
+        training_session['gps_tracker'].reset()
+        training_session['gps_tracker'].add_positions([_fix(0)])
+
+    assert len(sqlite_store.pop('s1')['gps_tracker'].positions) == 1
+
+
+def test_sqlite_pop_idle(app_module, sqlite_store):
+    sqlite_store['s1'] = {'gps_tracker': app_module.GPSTracker()}
+    with sqlite_store.edit('s1') as training_session:
+        training_session['gps_tracker'].add_positions([_fix(i) for i in range(5)])
+
+    assert sqlite_store.idle_sessions(time.time() - 60) == []
+    assert sqlite_store.pop_idle('s1', time.time() - 60) is None
+
+    training_session, touched = sqlite_store.pop_idle('s1', time.time() + 1)
+    assert len(training_session['gps_tracker'].positions) == 5
+    assert 's1' not in sqlite_store
+
+
+def test_sqlite_untouched_edit_keeps_idle_time(app_module, sqlite_store):
+    sqlite_store['s1'] = {'gps_tracker': app_module.GPSTracker()}
+    cutoff = time.time() + 1
+
+    with sqlite_store.edit('s1', touch=False):
+        pass
+
+    assert sqlite_store.idle_sessions(cutoff) == ['s1']
+
+
+def test_memory_pop_waits_for_edit():
+    store = MemorySessionStore()
+    store['s1'] = {'value': 0}
+    editing = threading.Event()
+    popped = []
+
+    def pop():
+        editing.wait()
+        popped.append(store.pop('s1'))
+
+    thread = threading.Thread(target=pop)
+    thread.start()
+    with store.edit('s1') as training_session:
+        editing.set()
+        time.sleep(0.05)
+        training_session['value'] = 1
+    thread.join()
+
+    assert popped == [{'value': 1}]
+    assert store.pop('s1') is None
+    with store.edit('s1') as training_session:
+        assert training_session is None
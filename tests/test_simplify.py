@@ -0,0 +1,78 @@
+"""
+Simplificação Douglas–Peucker em níveis (simplify)
+"""
+
+import numpy as np
+import pytest
+
+import simplify
+from track_store import TrackStore
+
+TOLERANCES = (1.0, 5.0, 20.0, 80.0)
+
+
+def _track(count=2000, seed=3):
+    rng = np.random.default_rng(seed)
+    heading = np.cumsum(rng.normal(0, 0.2, count))
+    lat = -23.55 + np.cumsum(np.cos(heading)) * 3e-5 + rng.normal(0, 2e-6, count)
+    lon = -46.63 + np.cumsum(np.sin(heading)) * 3e-5 + rng.normal(0, 2e-6, count)
+    return lat, lon
+
+
+def _max_error(lat, lon, kept):
+    """Maior distância (m) de uma posição descartada ao segmento simplificado que a cobre"""
+    x, y = simplify._to_meters(lat, lon)
+    error = 0.0
+    for first, last in zip(kept[:-1], kept[1:]):
+        if last - first > 1:
+            distance = simplify._segment_distance(x[first + 1:last], y[first + 1:last],
+                                                  x[first], y[first], x[last], y[last])
+            error = max(error, float(distance.max()))
+    return error
+
+
+@pytest.mark.parametrize('tolerance', TOLERANCES)
+def test_error_stays_within_tolerance(tolerance):
+    lat, lon = _track()
+
+    kept = simplify.simplify(lat, lon, tolerance)
+
+    assert kept[0] == 0 and kept[-1] == len(lat) - 1
+    assert 2 <= len(kept) < len(lat)
+    assert _max_error(lat, lon, kept) <= tolerance
+
+
+def test_levels_are_nested():
+    lat, lon = _track()
+    rows = [(a, b, 5.0, np.nan, np.nan, np.nan, float(i)) for i, (a, b) in enumerate(zip(lat, lon))]
+
+    _, _, weights = simplify.load(rows)
+    levels = simplify.build_levels(rows, weights, TOLERANCES)
+
+    timestamps = [{row[6] for row in level.rows()} for _, level in levels]
+    sizes = [len(level) for _, level in levels]
+    assert sizes == sorted(sizes, reverse=True)
+    for finer, coarser in zip(timestamps, timestamps[1:]):
+        assert coarser <= finer
+    for (tolerance, level), expected in zip(levels, TOLERANCES):
+        assert tolerance == expected
+        assert len(level) == len(simplify.simplify(lat, lon, tolerance))
+
+
+def test_short_and_straight_tracks():
+    assert np.isinf(simplify.importance(np.array([1.0, 1.1]), np.array([2.0, 2.0]))).all()
+
+    lat = np.linspace(-23.55, -23.50, 50)
+    kept = simplify.simplify(lat, np.full(50, -46.63), 0.5)
+    assert kept.tolist() == [0, 49]
+
+
+def test_load_accepts_track_store():
+    store = TrackStore()
+    for i in range(10):
+        store.append(-23.55 + i * 1e-4, -46.63 + (i % 2) * 1e-4, 5.0, timestamp=float(i))
+
+    lat, lon, weights = simplify.load(store.rows())
+
+    assert len(lat) == len(weights) == 10
+    assert np.isinf(weights[[0, -1]]).all()
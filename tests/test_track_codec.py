@@ -0,0 +1,82 @@
+"""
+Formato binário das trilhas (track_codec)
+"""
+
+import json
+
+import pytest
+
+from track_codec import decode_track, encode_track, is_binary_track, iter_rows
+from track_store import TrackStore
+
+POSITIONS = [
+    {'latitude': -23.5505199, 'longitude': -46.6333094, 'accuracy': 4.5, 'speed': 3.21, 'altitude': 760.25,
+     'heading': 359.99, 'timestamp': 1700000000.123},
+    {'latitude': -23.5506, 'longitude': -46.6334, 'accuracy': 12.0, 'speed': None, 'altitude': None,
+     'heading': None, 'timestamp': 1700000001.5},
+    # Cruza o antimeridiano
+    {'latitude': 10.0, 'longitude': 179.9999999, 'accuracy': 5.0, 'speed': 0.0, 'altitude': -12.5,
+     'heading': 0.0, 'timestamp': 1700000002.0},
+    {'latitude': 10.0000001, 'longitude': -179.9999999, 'accuracy': 5.0, 'speed': 1.0, 'altitude': 0.0,
+     'heading': 90.0, 'timestamp': 1700000003.0},
+]
+
+
+def _assert_same(decoded, expected):
+    assert len(decoded) == len(expected)
+    for got, want in zip(decoded, expected):
+        assert got['latitude'] == pytest.approx(want['latitude'], abs=1e-7)
+        assert got['longitude'] == pytest.approx(want['longitude'], abs=1e-7)
+        assert got['accuracy'] == pytest.approx(want['accuracy'], abs=0.05)
+        assert got['timestamp'] == pytest.approx(want['timestamp'], abs=1e-3)
+        for name, tolerance in (('speed', 0.005), ('altitude', 0.005), ('heading', 0.005)):
+            if want[name] is None:
+                assert got[name] is None
+            else:
+                assert got[name] == pytest.approx(want[name], abs=tolerance)
+
+
+@pytest.mark.parametrize('compress', [True, False])
+def test_round_trip(compress):
+    data = encode_track(POSITIONS, compress=compress)
+
+    assert is_binary_track(data)
+    _assert_same(decode_track(data), POSITIONS)
+
+
+def test_track_store_and_dicts_encode_the_same():
+    store = TrackStore()
+    for position in POSITIONS:
+        store.append_position(position)
+
+    assert encode_track(store) == encode_track(POSITIONS)
+
+
+def test_long_track_round_trip_spans_chunks():
+    positions = [dict(POSITIONS[0], latitude=-23.5 + i * 1e-5, timestamp=1700000000 + i) for i in range(3000)]
+
+    _assert_same(decode_track(encode_track(positions)), positions)
+
+
+def test_empty_track():
+    data = encode_track([])
+
+    assert is_binary_track(data)
+    assert decode_track(data) == []
+
+
+def test_legacy_json_is_still_read():
+    legacy = json.dumps(POSITIONS)
+
+    assert not is_binary_track(legacy)
+    assert decode_track(legacy) == POSITIONS
+    assert list(iter_rows(legacy.encode()))[1][3] is None
+    assert decode_track(None) == []
+
+
+def test_unknown_version_is_rejected():
+    data = bytearray(encode_track(POSITIONS))
+    data[3] = 99
+
+    with pytest.raises(ValueError):
+        decode_track(bytes(data))
@@ -0,0 +1,111 @@
+"""
+Importação e exportação GPX/TCX (track_files e TrainingManager.import_trainings)
+"""
+
+import gzip
+import io
+
+import pytest
+
+import track_files
+
+
+def _gpx(*tracks):
+    body = ''.join(
+        '<trk><trkseg>' + ''.join(
+            f'<trkpt lat="{lat}" lon="{lon}"><time>{time}</time>{extra}</trkpt>'
+            for lat, lon, time, extra in points
+        ) + '</trkseg></trk>'
+        for points in tracks
+    )
+    return ('<?xml version="1.0"?><gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1">'
+            + body + '</gpx>').encode()
+
+
+def _run(start_minute=0, count=60):
+    """Corrida em linha reta, uma posição a cada 5 s (~4 m/s)"""
+    return [(-23.55 + i * 0.00018, -46.63, f'2024-03-01T07:{start_minute + i * 5 // 60:02d}:{i * 5 % 60:02d}Z', '')
+            for i in range(count)]
+
+
+def _points(data):
+    return list(track_files.iter_points(io.BytesIO(data)))
+
+
+def test_gpx_points_and_activities():
+    points = _points(_gpx(_run(), _run(30)))
+
+    assert [activity for activity, _ in points] == [0] * 60 + [1] * 60
+    first = points[0][1]
+    assert first['latitude'] == -23.55 and first['timestamp'] == 1709276400.0
+    assert first['accuracy'] == track_files.DEFAULT_ACCURACY
+
+
+@pytest.mark.parametrize('lat, lon', [('nan', '-46.63'), ('-23.55', 'inf'), ('abc', '-46.63'), ('-23.55', '')])
+def test_invalid_coordinates_skip_only_that_point(lat, lon):
+    run = _run(count=3)
+    run[1] = (lat, lon, run[1][2], '')
+
+    points = _points(_gpx(run))
+
+    assert [p['timestamp'] for _, p in points] == [1709276400.0, 1709276410.0]
+
+
+def test_non_finite_optional_values_are_missing():
+    data = _gpx([(-23.55, -46.63, '2024-03-01T07:00:00Z', '<ele>NaN</ele><hdop>inf</hdop><speed>-inf</speed>')])
+
+    point = _points(data)[0][1]
+
+    assert point['altitude'] is None and point['speed'] is None
+    assert point['accuracy'] == track_files.DEFAULT_ACCURACY
+
+
+def test_tcx_points_without_position_are_skipped():
+    data = b'''<TrainingCenterDatabase><Activities><Activity><Lap><Track>
+        <Trackpoint><Time>2024-03-01T07:00:00Z</Time><HeartRateBpm><Value>120</Value></HeartRateBpm></Trackpoint>
+        <Trackpoint><Time>2024-03-01T07:00:05Z</Time><Position><LatitudeDegrees>-23.55</LatitudeDegrees>
+            <LongitudeDegrees>-46.63</LongitudeDegrees></Position><AltitudeMeters>760</AltitudeMeters></Trackpoint>
+        </Track></Lap></Activity></Activities></TrainingCenterDatabase>'''
+
+    points = _points(data)
+
+    assert len(points) == 1
+    assert points[0][1]['altitude'] == 760.0
+
+
+@pytest.mark.parametrize('data', [b'<html></html>', b'<gpx><trk>', b'not xml'])
+def test_invalid_files_raise_value_error(data):
+    with pytest.raises(ValueError):
+        _points(data)
+
+
+def test_gpx_export_reads_back():
+    rows = [(-23.55 + i * 1e-4, -46.63, 5.0, None, 760.0 if i % 2 else None, None, 1709276400.0 + i)
+            for i in range(600)]
+
+    chunks = list(track_files.iter_gpx(rows, name='a & b', training_type='longa'))
+    points = _points(''.join(chunks).encode())
+
+    assert len(chunks) > 3
+    assert [(p['latitude'], p['longitude'], p['altitude'], p['timestamp']) for _, p in points] == \
+           [(pytest.approx(r[0], abs=1e-7), r[1], r[4], r[6]) for r in rows]
+
+
+def test_import_trainings_skips_repeated_activities(app_module):
+    manager = app_module.training_manager
+    user_id = manager.create_user('Ana', 30, 60.0, 1.65, 'iniciante')
+    data = _gpx(_run(), _run(30))
+    files = [('a.gpx', io.BytesIO(data)),
+             ('b.gpx.gz', track_files.decompress('b.gpx.gz', io.BytesIO(gzip.compress(data)))),
+             ('bad.gpx', io.BytesIO(b'<html/>'))]
+
+    result = manager.import_trainings(user_id, files)
+
+    assert result['imported'] == 2
+    assert result['skipped'] == 2
+    assert [error['file'] for error in result['errors']] == ['bad.gpx']
+    rows = app_module.db.connection().execute(
+        'SELECT distance, duration, created_at FROM trainings WHERE user_id = ? ORDER BY created_at', (user_id,)
+    ).fetchall()
+    assert [row[2] for row in rows] == ['2024-03-01 07:00:00', '2024-03-01 07:30:00']
+    assert all(row[0] == pytest.approx(1.18, abs=0.05) and row[1] == 295 for row in rows)
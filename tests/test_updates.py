@@ -0,0 +1,66 @@
+"""
+Política de envio do training_update (updates.UpdateThrottle)
+"""
+
+import pytest
+
+from updates import UpdateThrottle
+
+
+def _update(distance, pace=5.0, calories=10):
+    return {'distance': distance, 'pace': pace, 'calories': calories}
+
+
+def test_keyframe_then_deltas():
+    throttle = UpdateThrottle(max_rate=0, delta=True, keyframe_interval=3)
+
+    messages = [throttle.offer(_update(d, pace=5.0 if d < 2 else 4.5)) for d in (1, 1, 2, 3)]
+
+    assert messages[0] == dict(_update(1), full=True, seq=0)
+    assert messages[1] == {'seq': 1}
+    assert messages[2] == {'distance': 2, 'pace': 4.5, 'seq': 2}
+    assert messages[3] == dict(_update(3, pace=4.5), full=True, seq=3)
+
+
+def test_applying_deltas_rebuilds_every_update():
+    throttle = UpdateThrottle(max_rate=0, delta=True, keyframe_interval=4)
+    updates = [_update(d / 10, pace=5 + d % 3 / 10, calories=d // 4) for d in range(20)]
+
+    state = {}
+    for update in updates:
+        message = throttle.offer(update)
+        if message.pop('full', False):
+            state = {}
+        message.pop('seq')
+        state.update(message)
+        assert state == update
+
+
+def test_rate_limit_coalesces_to_latest():
+    throttle = UpdateThrottle(max_rate=2.0, delta=False)
+
+    assert throttle.offer(_update(1), now=100.0)['seq'] == 0
+    assert throttle.offer(_update(2), now=100.1) is None
+    assert throttle.offer(_update(3), now=100.2) is None
+    assert throttle.wait(now=100.2) == pytest.approx(0.3)
+    assert throttle.poll(now=100.3) is None
+
+    message = throttle.poll(now=100.5)
+    assert message['distance'] == 3 and message['seq'] == 1
+    assert throttle.coalesced == 1
+    assert throttle.wait() is None
+
+
+def test_flush_ignores_rate_limit():
+    throttle = UpdateThrottle(max_rate=1.0)
+    throttle.offer(_update(1), now=10.0)
+    throttle.offer(_update(2), now=10.1)
+
+    assert throttle.flush(now=10.2)['distance'] == 2
+    assert throttle.flush(now=10.3) is None
+
+
+@pytest.mark.parametrize('options', [{'max_rate': -1}, {'keyframe_interval': 0}, {'bogus': 1}])
+def test_invalid_options_raise_value_error(options):
+    with pytest.raises(ValueError):
+        UpdateThrottle.from_options(options, {'max_rate': 2.0, 'delta': True, 'keyframe_interval': 20})
@@ -0,0 +1,155 @@
+"""
+Cache LRU em disco para os tiles do mapa de calor
+
+Cada chave (tupla) vira um arquivo (directory/user/z/x/y.png). O índice em
+memória guarda o tamanho de cada arquivo em ordem de uso e remove os menos
+usados quando o total passa de max_bytes; ao iniciar, os arquivos já em disco
+entram no índice pela ordem de modificação (cada acerto atualiza o mtime).
+
+Vários processos podem dividir o diretório: get lê o arquivo direto do disco,
+então tiles gravados por outro processo (ou pelo manage.py render-heatmaps)
+também são acertos. Cada processo só conta no orçamento os arquivos que já
+viu.
+"""
+
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, Optional, Tuple
+
+
+class TileCache:
+    """Cache LRU de bytes em arquivos, limitado pelo tamanho total em disco
+
+    Como no StatsCache, put recebe a geração lida antes de gerar o tile: se
+    alguma chave foi invalidada nesse meio tempo, o tile pode estar
+    desatualizado e não é gravado.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, suffix: str = '.png'):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._entries: Dict[Tuple, int] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._load_index()
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, key: Tuple) -> Optional[bytes]:
+        """Conteúdo do tile, ou None"""
+        key = _normalize(key)
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # Ordem de uso preservada entre reinícios
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._forget(key)
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+            if key not in self._entries:
+                self._entries[key] = len(data)
+                self._size += len(data)
+            self._entries.move_to_end(key)
+        return data
+
+    def put(self, key: Tuple, data: bytes, generation: Optional[int] = None):
+        """Grava o tile, a menos que alguma chave tenha sido invalidada depois de generation"""
+        if self.max_bytes <= 0 or (generation is not None and generation != self._generation):
+            return
+        key = _normalize(key)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(data)
+        os.replace(temporary, path)
+
+        with self._lock:
+            self._forget(key)
+            self._entries[key] = len(data)
+            self._size += len(data)
+            while self._size > self.max_bytes and self._entries:
+                evicted, size = self._entries.popitem(last=False)
+                self._size -= size
+                self.evictions += 1
+                _remove(self._path(evicted))
+
+    def invalidate(self, keys: Iterable[Hashable]):
+        """Remove os tiles das chaves (chamar depois do commit da escrita)"""
+        with self._lock:
+            self._generation += 1
+            for key in map(_normalize, keys):
+                self.invalidations += 1
+                self._forget(key)
+                _remove(self._path(key))
+
+    def clear(self, prefix: Tuple = ()):
+        """Remove os tiles cujas chaves começam com prefix (sem prefix, todos)"""
+        prefix = _normalize(prefix)
+        with self._lock:
+            self._generation += 1
+            for key in [key for key in self._entries if key[:len(prefix)] == prefix]:
+                self._forget(key)
+            shutil.rmtree(os.path.join(self.directory, *prefix), ignore_errors=True)
+
+    def stats(self) -> Dict:
+        """Contadores do cache"""
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'bytes': self._size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+    def _path(self, key: Tuple) -> str:
+        return os.path.join(self.directory, *key) + self.suffix
+
+    def _forget(self, key: Tuple):
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self._size -= size
+
+    def _load_index(self):
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith(self.suffix):
+                    continue
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                key = tuple(os.path.relpath(path, self.directory)[:-len(self.suffix)].split(os.sep))
+                files.append((stat.st_mtime, key, stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._size += size
+
+
+def _normalize(key: Tuple) -> Tuple[str, ...]:
+    """Chaves como no disco: (user_id, 16, 1, 2) e ('user_id', '16', '1', '2') são o mesmo tile"""
+    return tuple(map(str, key))
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,191 @@
+"""
+Formato binário compacto para as trilhas GPS salvas em trainings.gps_data
+
+Layout da versão 1 (little-endian):
+
+    cabeçalho: b'XRT' | versão (u8) | flags (u8) | timestamp base em ms (i64)
+    registros: dlat (i32) | dlon (i32) | dt (i64) | accuracy (u16) |
+               speed (u16) | altitude (i32) | heading (u16)
+
+Latitude e longitude são gravadas em ponto fixo (1e-7 grau, ~1 cm) e o tempo
+em milissegundos, todos como diferença em relação ao registro anterior (a
+diferença de longitude dá a volta no antimeridiano para caber em 32 bits). A
+precisão é gravada em decímetros, a velocidade em cm/s, a altitude em cm e a
+direção em centésimos de grau. Com a flag FLAG_ZLIB os registros são
+comprimidos com zlib. Trilhas antigas, em JSON, continuam sendo lidas.
+"""
+
+import json
+import math
+import struct
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from track_store import FIELDS
+
+MAGIC = b'XRT'
+VERSION = 1
+FLAG_ZLIB = 0x01
+
+HEADER = struct.Struct('<3sBBq')
+RECORD = struct.Struct('<iiqHHiH')
+
+COORD_SCALE = 10_000_000
+HALF_TURN = 180 * COORD_SCALE
+MISSING_U16 = 0xFFFF
+MISSING_I32 = -2 ** 31
+
+# Registros empacotados/desempacotados por vez
+CHUNK_RECORDS = 1024
+READ_CHUNK = 64 * 1024
+
+TrackData = Union[bytes, bytearray, memoryview, str, None]
+
+
+def encode_track(track: Iterable, compress: bool = True) -> bytes:
+    """Codifica uma trilha no formato binário
+
+    Aceita um TrackStore (ou qualquer objeto com rows(), como o journal da
+    sessão) ou uma sequência de posições em dicionário.
+    """
+    rows = track.rows() if hasattr(track, 'rows') else (_dict_to_row(p) for p in track)
+    flags = FLAG_ZLIB if compress else 0
+    compressor = zlib.compressobj(6) if compress else None
+
+    out = bytearray()
+    chunk = bytearray()
+    prev_lat = prev_lon = prev_ts = None
+    count = 0
+
+    for lat, lon, accuracy, speed, altitude, heading, timestamp in rows:
+        q_lat = round(lat * COORD_SCALE)
+        q_lon = round(lon * COORD_SCALE)
+        q_ts = round(timestamp * 1000)
+
+        if prev_ts is None:
+            out += HEADER.pack(MAGIC, VERSION, flags, q_ts)
+            prev_lat = prev_lon = 0
+            prev_ts = q_ts
+
+        d_lon = q_lon - prev_lon
+        if d_lon > HALF_TURN:
+            d_lon -= 2 * HALF_TURN
+        elif d_lon < -HALF_TURN:
+            d_lon += 2 * HALF_TURN
+
+        chunk += RECORD.pack(
+            q_lat - prev_lat,
+            d_lon,
+            q_ts - prev_ts,
+            _to_u16(accuracy, 10),
+            _to_u16(speed, 100),
+            MISSING_I32 if altitude is None or math.isnan(altitude) else round(altitude * 100),
+            _to_u16(heading % 360 if heading is not None else None, 100)
+        )
+        prev_lat, prev_lon, prev_ts = q_lat, q_lon, q_ts
+        count += 1
+
+        if count % CHUNK_RECORDS == 0:
+            out += compressor.compress(bytes(chunk)) if compressor else chunk
+            chunk = bytearray()
+
+    if prev_ts is None:
+        # Trilha vazia: apenas o cabeçalho
+        out += HEADER.pack(MAGIC, VERSION, flags, 0)
+
+    if compressor:
+        out += compressor.compress(bytes(chunk))
+        out += compressor.flush()
+    else:
+        out += chunk
+
+    return bytes(out)
+
+
+def is_binary_track(data: TrackData) -> bool:
+    """Indica se o valor salvo está no formato binário"""
+    return isinstance(data, (bytes, bytearray, memoryview)) and bytes(data[:3]) == MAGIC
+
+
+def iter_rows(data: TrackData) -> Iterator[Tuple]:
+    """Itera de forma preguiçosa sobre as posições como tuplas na ordem de FIELDS
+
+    Aceita o formato binário e o JSON antigo; campos ausentes são None.
+    """
+    if data is None:
+        return
+    if not is_binary_track(data):
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data).decode('utf-8')
+        for position in json.loads(data):
+            yield tuple(position.get(name) for name in FIELDS)
+        return
+
+    view = memoryview(data)
+    _, version, flags, base_ts = HEADER.unpack_from(view)
+    if version != VERSION:
+        raise ValueError(f'Unsupported track format version: {version}')
+
+    lat = lon = 0
+    ts = base_ts
+    for record in _iter_records(view[HEADER.size:], flags):
+        d_lat, d_lon, d_ts, accuracy, speed, altitude, heading = record
+        lat += d_lat
+        lon += d_lon
+        if lon > HALF_TURN:
+            lon -= 2 * HALF_TURN
+        elif lon < -HALF_TURN:
+            lon += 2 * HALF_TURN
+        ts += d_ts
+        yield (
+            lat / COORD_SCALE,
+            lon / COORD_SCALE,
+            accuracy / 10,
+            None if speed == MISSING_U16 else speed / 100,
+            None if altitude == MISSING_I32 else altitude / 100,
+            None if heading == MISSING_U16 else heading / 100,
+            ts / 1000
+        )
+
+
+def iter_track(data: TrackData) -> Iterator[Dict]:
+    """Itera de forma preguiçosa sobre as posições como dicionários"""
+    for row in iter_rows(data):
+        yield dict(zip(FIELDS, row))
+
+
+def decode_track(data: TrackData) -> List[Dict]:
+    """Decodifica a trilha inteira em uma lista de posições"""
+    return list(iter_track(data))
+
+
+def _iter_records(payload: memoryview, flags: int) -> Iterator[Tuple]:
+    """Desempacota os registros, descomprimindo aos poucos se necessário"""
+    if not flags & FLAG_ZLIB:
+        usable = len(payload) - len(payload) % RECORD.size
+        yield from RECORD.iter_unpack(payload[:usable])
+        return
+
+    decompressor = zlib.decompressobj()
+    pending = b''
+    for offset in range(0, len(payload), READ_CHUNK):
+        pending += decompressor.decompress(payload[offset:offset + READ_CHUNK])
+        usable = len(pending) - len(pending) % RECORD.size
+        if usable:
+            yield from RECORD.iter_unpack(pending[:usable])
+            pending = pending[usable:]
+
+    pending += decompressor.flush()
+    usable = len(pending) - len(pending) % RECORD.size
+    if usable:
+        yield from RECORD.iter_unpack(pending[:usable])
+
+
+def _dict_to_row(position: Dict) -> Tuple:
+    return tuple(position.get(name) for name in FIELDS)
+
+
+def _to_u16(value: Optional[float], scale: int) -> int:
+    if value is None or math.isnan(value):
+        return MISSING_U16
+    return min(max(round(value * scale), 0), MISSING_U16 - 1)
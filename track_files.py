@@ -0,0 +1,176 @@
+"""
+Leitura e escrita em streaming de arquivos GPX e TCX
+
+iter_points lê o arquivo com iterparse e entrega uma posição por vez; cada
+elemento de posição é descartado da árvore assim que lido, então a memória
+não cresce com o tamanho do arquivo. iter_gpx faz o caminho inverso: recebe
+as linhas de uma trilha (track_codec.iter_rows, TrackStore.rows) e produz o
+documento GPX em pedaços de texto, para uma resposta em streaming.
+
+As posições lidas usam as chaves de track_store.FIELDS. Sem precisão no
+arquivo, accuracy vem do HDOP (GPX) ou de DEFAULT_ACCURACY; posições sem
+horário vêm com timestamp None.
+"""
+
+import gzip
+import math
+import zlib
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from typing import IO, Dict, Iterable, Iterator, Optional, Tuple
+from xml.sax.saxutils import escape
+
+# Precisão (m) atribuída às posições de arquivos que não a informam
+DEFAULT_ACCURACY = 5.0
+# Metros de erro por unidade de HDOP
+HDOP_METERS = 5.0
+
+# Elementos que delimitam uma atividade (um treino) em cada formato
+ACTIVITY_TAGS = {'trk', 'Activity'}
+SUPPORTED_ROOTS = {'gpx', 'TrainingCenterDatabase'}
+
+# Posições por pedaço de texto em iter_gpx
+GPX_CHUNK_POINTS = 256
+
+GPX_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<gpx version="1.1" creator="Treinador de Corrida" xmlns="http://www.topografix.com/GPX/1/1">\n'
+    '<trk><name>{name}</name><type>{type}</type><trkseg>\n'
+)
+GPX_FOOTER = '</trkseg></trk>\n</gpx>\n'
+
+
+def decompress(name: str, stream: IO[bytes]) -> IO[bytes]:
+    """Descomprime em streaming os arquivos .gz (formato das exportações em massa)"""
+    return gzip.GzipFile(fileobj=stream) if name.lower().endswith('.gz') else stream
+
+
+def iter_points(source: IO[bytes]) -> Iterator[Tuple[int, Dict]]:
+    """Itera sobre (número da atividade, posição) de um GPX (trk/trkpt) ou TCX (Activity/Trackpoint)
+
+    Lança ValueError para XML inválido ou de outro formato.
+    """
+    activity = -1
+    # Elementos abertos, da raiz até o atual
+    stack = []
+    try:
+        for event, elem in ET.iterparse(source, events=('start', 'end')):
+            tag = _local_name(elem.tag)
+            if event == 'start':
+                if not stack and tag not in SUPPORTED_ROOTS:
+                    raise ValueError(f'Unsupported track file: root element <{tag}>')
+                if tag in ACTIVITY_TAGS:
+                    activity += 1
+                stack.append(elem)
+                continue
+
+            stack.pop()
+            if tag in ('trkpt', 'Trackpoint'):
+                point = _gpx_point(elem) if tag == 'trkpt' else _tcx_point(elem)
+                if point is not None:
+                    yield activity, point
+            elif tag not in ACTIVITY_TAGS:
+                continue
+
+            # Posição (ou atividade) já lida: sai da árvore
+            elem.clear()
+            if stack:
+                stack[-1].remove(elem)
+    except (ET.ParseError, gzip.BadGzipFile, EOFError, zlib.error) as e:
+        raise ValueError(f'Invalid track file: {e}') from e
+
+
+def iter_gpx(rows: Iterable[Tuple], name: str = '', training_type: str = '') -> Iterator[str]:
+    """Documento GPX 1.1 de uma trilha, em pedaços de até GPX_CHUNK_POINTS posições"""
+    yield GPX_HEADER.format(name=escape(name), type=escape(training_type))
+    chunk = []
+    for latitude, longitude, accuracy, speed, altitude, heading, timestamp in rows:
+        point = f'<trkpt lat="{latitude:.7f}" lon="{longitude:.7f}">'
+        if _present(altitude):
+            point += f'<ele>{altitude:.2f}</ele>'
+        if _present(timestamp):
+            point += f'<time>{_format_time(timestamp)}</time>'
+        chunk.append(point + '</trkpt>\n')
+        if len(chunk) >= GPX_CHUNK_POINTS:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+    yield GPX_FOOTER
+
+
+def _gpx_point(elem: ET.Element) -> Optional[Dict]:
+    latitude = _float(elem.get('lat'))
+    longitude = _float(elem.get('lon'))
+    # Pontos sem lat/lon válidos (ausentes, inválidos ou NaN/inf) são ignorados, como no TCX
+    if latitude is None or longitude is None:
+        return None
+    point = _empty_point(latitude, longitude)
+    for child in elem.iter():
+        tag = _local_name(child.tag)
+        if tag == 'ele':
+            point['altitude'] = _float(child.text)
+        elif tag == 'time':
+            point['timestamp'] = _parse_time(child.text)
+        elif tag == 'hdop' and _float(child.text) is not None:
+            point['accuracy'] = _float(child.text) * HDOP_METERS
+        elif tag == 'speed':
+            point['speed'] = _float(child.text)
+        elif tag == 'course':
+            point['heading'] = _float(child.text)
+    return point
+
+
+def _tcx_point(elem: ET.Element) -> Optional[Dict]:
+    values = {_local_name(child.tag): child.text for child in elem.iter()}
+    latitude = _float(values.get('LatitudeDegrees'))
+    longitude = _float(values.get('LongitudeDegrees'))
+    # Pontos só com frequência cardíaca/cadência, sem posição
+    if latitude is None or longitude is None:
+        return None
+    point = _empty_point(latitude, longitude)
+    point['altitude'] = _float(values.get('AltitudeMeters'))
+    point['timestamp'] = _parse_time(values.get('Time'))
+    point['speed'] = _float(values.get('Speed'))
+    return point
+
+
+def _empty_point(latitude: float, longitude: float) -> Dict:
+    return {'latitude': latitude, 'longitude': longitude, 'accuracy': DEFAULT_ACCURACY, 'speed': None,
+            'altitude': None, 'heading': None, 'timestamp': None}
+
+
+def _local_name(tag: str) -> str:
+    """Nome do elemento sem o namespace ({http://...}trkpt -> trkpt)"""
+    return tag.rpartition('}')[2]
+
+
+def _float(text: Optional[str]) -> Optional[float]:
+    """Número do texto, ou None se ausente, inválido ou não finito (NaN, inf)"""
+    try:
+        value = float(text)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+def _parse_time(text: Optional[str]) -> Optional[float]:
+    """Horário ISO 8601 em segundos desde a época; sem fuso, UTC"""
+    if not text:
+        return None
+    try:
+        moment = datetime.fromisoformat(text.strip().replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def _format_time(timestamp: float) -> str:
+    moment = datetime.fromtimestamp(timestamp, timezone.utc)
+    return moment.isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+
+def _present(value: Optional[float]) -> bool:
+    return value is not None and not math.isnan(value)
@@ -0,0 +1,126 @@
+"""
+Armazenamento colunar das posições GPS de uma sessão de treino
+"""
+
+import math
+from array import array
+from typing import Dict, Iterator, Optional, Tuple
+
+# Colunas na ordem em que são gravadas (valores ausentes viram NaN)
+FIELDS = ('latitude', 'longitude', 'accuracy', 'speed', 'altitude', 'heading', 'timestamp')
+OPTIONAL_FIELDS = ('speed', 'altitude', 'heading')
+
+
+class TrackStore:
+    """Trilha GPS em colunas array('d'), com buffer circular opcional
+
+    Cada posição ocupa 56 bytes (7 doubles) em vez de um dicionário de 7 chaves.
+    Com maxlen definido, as posições mais antigas são sobrescritas quando o
+    buffer enche; appended conta todas as posições já recebidas.
+    """
+
+    __slots__ = ('maxlen', 'appended', '_start', '_columns')
+
+    def __init__(self, maxlen: Optional[int] = None):
+        self.maxlen = maxlen
+        self.appended = 0
+        self._start = 0
+        self._columns = tuple(array('d') for _ in FIELDS)
+
+    def append(self, latitude: float, longitude: float, accuracy: float, speed: Optional[float] = None,
+               altitude: Optional[float] = None, heading: Optional[float] = None,
+               timestamp: float = 0.0):
+        """Adiciona uma posição ao final da trilha"""
+        row = (latitude, longitude, accuracy,
+               math.nan if speed is None else speed,
+               math.nan if altitude is None else altitude,
+               math.nan if heading is None else heading,
+               timestamp)
+        self.appended += 1
+
+        if self.maxlen is not None and len(self._columns[0]) >= self.maxlen:
+            if not self.maxlen:
+                return
+            # Buffer cheio: sobrescreve a posição mais antiga
+            for column, value in zip(self._columns, row):
+                column[self._start] = value
+            self._start = (self._start + 1) % self.maxlen
+            return
+
+        for column, value in zip(self._columns, row):
+            column.append(value)
+
+    def append_position(self, position: Dict):
+        """Adiciona uma posição no formato de dicionário"""
+        self.append(position['latitude'], position['longitude'], position['accuracy'],
+                    position.get('speed'), position.get('altitude'), position.get('heading'),
+                    position['timestamp'])
+
+    def row(self, index: int) -> Tuple[float, ...]:
+        """Retorna a posição de índice index como tupla (NaN para ausentes)"""
+        size = len(self)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError('track index out of range')
+        index = (self._start + index) % size
+        return tuple(column[index] for column in self._columns)
+
+    def rows(self) -> Iterator[Tuple[float, ...]]:
+        """Itera sobre as posições como tuplas, sem criar dicionários"""
+        size = len(self)
+        for i in range(size):
+            index = (self._start + i) % size
+            yield tuple(column[index] for column in self._columns)
+
+    def __getitem__(self, index: int) -> Dict:
+        return _row_to_dict(self.row(index))
+
+    def __iter__(self) -> Iterator[Dict]:
+        for row in self.rows():
+            yield _row_to_dict(row)
+
+    def __len__(self) -> int:
+        return len(self._columns[0])
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    @property
+    def nbytes(self) -> int:
+        """Memória ocupada pelas colunas"""
+        return sum(column.itemsize * column.buffer_info()[1] for column in self._columns)
+
+    def to_state(self) -> Dict:
+        """Estado serializável da trilha (colunas como bytes)"""
+        return {
+            'maxlen': self.maxlen,
+            'appended': self.appended,
+            'start': self._start,
+            'columns': [column.tobytes() for column in self._columns]
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict) -> 'TrackStore':
+        """Reconstrói uma trilha a partir de to_state"""
+        store = cls(maxlen=state['maxlen'])
+        store.appended = state['appended']
+        store._start = state['start']
+        for column, data in zip(store._columns, state['columns']):
+            column.frombytes(data)
+        return store
+
+    def clear(self):
+        """Remove todas as posições"""
+        self.appended = 0
+        self._start = 0
+        self._columns = tuple(array('d') for _ in FIELDS)
+
+
+def _row_to_dict(row: Tuple[float, ...]) -> Dict:
+    position = dict(zip(FIELDS, row))
+    for name in OPTIONAL_FIELDS:
+        if math.isnan(position[name]):
+            position[name] = None
+    return position
+
@@ -0,0 +1,97 @@
+"""
+Política de envio dos eventos training_update de cada sessão
+"""
+
+import time
+from typing import Dict, Optional
+
+
+class UpdateThrottle:
+    """Limita, agrupa e compacta as atualizações enviadas a um cliente
+
+    - max_rate: no máximo max_rate mensagens por segundo (0 desativa o limite).
+      Atualizações que chegam antes do intervalo substituem a pendente, que sai
+      quando o intervalo termina: o app consulta wait para agendar o envio e
+      poll para fazê-lo (ou flush, no fim da sessão).
+    - delta: envia só os campos que mudaram desde a última mensagem; a cada
+      keyframe_interval mensagens (e na primeira) o payload vai completo, com
+      full = True.
+
+    Todas as mensagens levam seq, para o cliente perceber se perdeu alguma.
+    """
+
+    def __init__(self, max_rate: float = 2.0, delta: bool = True, keyframe_interval: int = 20):
+        if max_rate < 0:
+            raise ValueError('max_rate must be >= 0')
+        if keyframe_interval < 1:
+            raise ValueError('keyframe_interval must be >= 1')
+        self.max_rate = max_rate
+        self.delta = delta
+        self.keyframe_interval = keyframe_interval
+        self.seq = 0
+        self.coalesced = 0
+        self._last_sent_at = None
+        self._last_payload = {}
+        self._pending = None
+
+    @classmethod
+    def from_options(cls, options: Dict, defaults: Dict) -> 'UpdateThrottle':
+        """Cria a política a partir das opções do cliente, completando com os padrões"""
+        unknown = set(options) - set(defaults)
+        if unknown:
+            raise ValueError(f"Unknown update options: {', '.join(sorted(unknown))}")
+        merged = dict(defaults, **options)
+        return cls(
+            max_rate=float(merged['max_rate']),
+            delta=bool(merged['delta']),
+            keyframe_interval=int(merged['keyframe_interval'])
+        )
+
+    def offer(self, update: Dict, now: Optional[float] = None) -> Optional[Dict]:
+        """Registra uma atualização e retorna a mensagem a enviar agora, ou None"""
+        now = time.time() if now is None else now
+        if self._pending is not None:
+            self.coalesced += 1
+        self._pending = update
+        return self.poll(now)
+
+    def poll(self, now: Optional[float] = None) -> Optional[Dict]:
+        """Retorna a atualização pendente se o limite de taxa já permite enviá-la, ou None"""
+        now = time.time() if now is None else now
+        if self._pending is None or self.wait(now):
+            return None
+        return self._take(now)
+
+    def wait(self, now: Optional[float] = None) -> Optional[float]:
+        """Segundos até a atualização pendente poder ser enviada (0 se já pode); None sem pendente"""
+        if self._pending is None:
+            return None
+        if not self.max_rate or self._last_sent_at is None:
+            return 0.0
+        now = time.time() if now is None else now
+        return max(0.0, self._last_sent_at + 1 / self.max_rate - now)
+
+    def flush(self, now: Optional[float] = None) -> Optional[Dict]:
+        """Retorna a atualização pendente, ignorando o limite de taxa"""
+        if self._pending is None:
+            return None
+        return self._take(time.time() if now is None else now)
+
+    def _take(self, now: float) -> Dict:
+        update = self._pending
+        self._pending = None
+        self._last_sent_at = now
+
+        if not self.delta or self.seq % self.keyframe_interval == 0:
+            message = dict(update, full=True)
+        else:
+            message = {key: value for key, value in update.items()
+                       if self._last_payload.get(key, _MISSING) != value}
+        self._last_payload = update
+
+        message['seq'] = self.seq
+        self.seq += 1
+        return message
+
+
+_MISSING = object()